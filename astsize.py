@@ -0,0 +1,107 @@
+import sys
+
+from parser import AST
+from lexer import Token
+from resolver import children
+
+
+# Stand-ins for the original node and token classes, which kept their attributes in a __dict__
+class DictNode:
+    pass
+
+
+class DictToken:
+    pass
+
+
+# Total size in bytes of a tree: every distinct node, token, list and __dict__ reachable from it.
+# Names, numbers and other leaf values are left out - both layouts share them
+def tree_bytes(tree):
+    seen = set()
+    total = 0
+    pending = [tree]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or not isinstance(obj, (list, AST, Token, DictNode, DictToken)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, list):
+            pending.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                total += sys.getsizeof(obj.__dict__)
+                pending.extend(vars(obj).values())
+            else:
+                pending.extend(getattr(obj, name) for name in slot_names(type(obj)))
+    return total
+
+
+# Every slot a class declares, including those inherited
+def slot_names(cls):
+    return [name for klass in cls.__mro__ for name in klass.__dict__.get('__slots__', ())
+            if name != '__weakref__']
+
+
+# Number of AST nodes in a tree (lists of statements themselves do not count)
+def count_nodes(tree):
+    total = 0
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, AST):
+            total += 1
+        pending.extend(children(node))
+    return total
+
+
+# Rebuild a tree with the original layout: a __dict__ per node, and a private operator Token per BinOp/UnaryOp
+def dict_layout(node):
+    if isinstance(node, list):
+        return [dict_layout(item) for item in node]
+    if not isinstance(node, AST):
+        return node
+    copy = DictNode()
+    for name in slot_names(type(node)):
+        value = getattr(node, name)
+        if name == 'op':
+            token = DictToken()
+            token.type, token.value = value.type, value.value
+            value = token
+        elif name in ('left', 'right', 'expr', 'func', 'condition', 'then_branch', 'else_branch', 'body', 'args'):
+            value = dict_layout(value)
+        setattr(copy, name, value)
+    return copy
+
+
+# Measure a parsed program in the original __dict__-based layout and in the current one.
+# Returns {'nodes': n, 'before': bytes, 'after': bytes}
+def measure(tree):
+    return {
+        'nodes': count_nodes(tree),
+        'before': tree_bytes(dict_layout(tree)),
+        'after': tree_bytes(tree),
+    }
+
+
+# Report the memory used per AST node for a .lambda file
+if __name__ == '__main__':
+    from lexer import Lexer
+    from parser import Parser, NodeTable
+    if len(sys.argv) == 2:
+        with open(sys.argv[1], 'r') as file:
+            text = file.read()
+        tree = Parser(Lexer(text).lex()).parse()
+        table = NodeTable()
+        shared = tree_bytes(Parser(Lexer(text).lex(), table).parse())
+        sizes = measure(tree)
+        nodes = max(sizes['nodes'], 1)
+        print(f"AST nodes: {sizes['nodes']}")
+        print(f"Before (__dict__ nodes, private operator tokens): {sizes['before']} bytes, "
+              f"{sizes['before'] / nodes:.1f} bytes/node")
+        print(f"After (__slots__ nodes, shared operator tokens):   {sizes['after']} bytes, "
+              f"{sizes['after'] / nodes:.1f} bytes/node")
+        print(f"Shared (identical subtrees built once):            {shared} bytes, "
+              f"{shared / nodes:.1f} bytes/node, {table.shared} nodes reused")
+    else:
+        print("Usage: python astsize.py <program.lambda>")
@@ -0,0 +1,30 @@
+from interpreter import Interpreter
+from compiler import ClosureInterpreter
+from transpiler import PythonInterpreter
+from vm import VMInterpreter
+from stackless import StacklessInterpreter
+
+# Execution engines that file_runner and repl can select by name
+BACKENDS = {
+    'tree': Interpreter,                # The original AST walking interpreter
+    'closure': ClosureInterpreter,      # Compiles the AST into nested Python closures once
+    'python': PythonInterpreter,        # Transpiles the program to Python source and runs it as bytecode
+    'vm': VMInterpreter,                # Compiles to flat bytecode run by a stack virtual machine
+    'stackless': StacklessInterpreter,  # Continuation-stack evaluator with proper tail calls
+}
+
+
+# Backends that accept the memoize/memo_size options
+MEMOIZING_BACKENDS = ('tree', 'stackless')
+
+
+# Create a fresh interpreter for the named backend, writing the results of top-level statements to `output`
+# (a sink from sinks.py; by default they are dropped)
+def create_interpreter(backend='tree', memoize=False, memo_size=1024, output=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend} (expected one of: {', '.join(BACKENDS)})")
+    if memoize:
+        if backend not in MEMOIZING_BACKENDS:
+            raise ValueError(f"The {backend} backend does not support memoization")
+        return BACKENDS[backend](memoize=True, memo_size=memo_size, output=output)
+    return BACKENDS[backend](output=output)
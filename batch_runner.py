@@ -0,0 +1,131 @@
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from backends import BACKENDS, MEMOIZING_BACKENDS
+from file_runner import execute_file
+from sinks import CallbackSink
+
+# Options every worker runs its files with, set once per worker process by init_worker
+OPTIONS = {'backend': 'tree', 'optimize': False, 'memoize': False, 'memo_size': 1024, 'cache': True}
+
+
+# Expand directories (searched recursively), glob patterns, manifests (text files listing one program
+# per line, relative to the manifest, with # comments) and single .lambda files into a sorted list of programs
+def collect_files(sources):
+    files = set()
+    for source in sources:
+        if any(char in source for char in '*?['):
+            files.update(path for path in glob.glob(source, recursive=True) if path.endswith('.lambda'))
+        elif os.path.isdir(source):
+            files.update(glob.glob(os.path.join(source, '**', '*.lambda'), recursive=True))
+        elif source.endswith('.lambda'):
+            if not os.path.isfile(source):
+                raise ValueError(f"No such file: {source}")
+            files.add(source)
+        elif os.path.isfile(source):
+            files.update(read_manifest(source))
+        else:
+            raise ValueError(f"No such file or directory: {source}")
+    return sorted(os.path.normpath(path) for path in files)
+
+
+# The programs listed in a manifest file
+def read_manifest(manifest_path):
+    base = os.path.dirname(manifest_path)
+    with open(manifest_path, 'r') as file:
+        lines = [line.split('#', 1)[0].strip() for line in file]
+    return [os.path.join(base, line) for line in lines if line]
+
+
+# Set the options of a worker process. Workers live for the whole batch, so the interpreter
+# modules are imported once per worker rather than once per file
+def init_worker(options):
+    OPTIONS.update(options)
+
+
+# Run one program and describe the outcome: its printed results, or the error it stopped with, and how long it took
+def run_one(file_path):
+    start = time.perf_counter()
+    try:
+        results = []
+        execute_file(file_path, OPTIONS['backend'], OPTIONS['optimize'], OPTIONS['memoize'], OPTIONS['memo_size'],
+                     OPTIONS['cache'], output=CallbackSink(lambda result: results.append(str(result))))
+        outcome = {'file': file_path, 'ok': True, 'results': results, 'error': None}
+    except Exception as error:
+        outcome = {'file': file_path, 'ok': False, 'results': None, 'error': f"{type(error).__name__}: {error}"}
+    outcome['seconds'] = round(time.perf_counter() - start, 6)
+    return outcome
+
+
+# Run every program in `files` across `workers` processes (in this process when workers is 1),
+# handing them out `chunksize` files at a time. Returns the report: one entry per file, in the order of `files`
+def run_batch(files, workers=None, chunksize=1, backend='tree', optimize=False, memoize=False, memo_size=1024,
+              cache=True):
+    options = {'backend': backend, 'optimize': optimize, 'memoize': memoize, 'memo_size': memo_size, 'cache': cache}
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers == 1:
+        init_worker(options)
+        outcomes = [run_one(file_path) for file_path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(options,)) as executor:
+            outcomes = list(executor.map(run_one, files, chunksize=chunksize))
+    failed = sum(1 for outcome in outcomes if not outcome['ok'])
+    return {
+        'summary': {
+            'files': len(outcomes),
+            'passed': len(outcomes) - failed,
+            'failed': failed,
+            'workers': workers,
+            'seconds': round(time.perf_counter() - start, 6),
+        },
+        'options': options,
+        'files': outcomes,
+    }
+
+
+# Main entry point for running the script
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="python batch_runner.py")
+    arg_parser.add_argument('sources', nargs='+',
+                            help="directories, glob patterns, manifest files or .lambda files to run")
+    arg_parser.add_argument('--workers', type=int, default=None,
+                            help="number of worker processes (default: one per CPU)")
+    arg_parser.add_argument('--chunksize', type=int, default=1,
+                            help="number of files handed to a worker at a time")
+    arg_parser.add_argument('--output', default=None,
+                            help="file to write the JSON report to (default: standard output)")
+    arg_parser.add_argument('--backend', choices=list(BACKENDS), default='tree',
+                            help="execution engine to run the programs with")
+    arg_parser.add_argument('--optimize', action='store_true',
+                            help="fold constants, inline small functions and simplify the AST before running each program")
+    arg_parser.add_argument('--memoize', action='store_true',
+                            help="remember the results of pure functions (tree and stackless backends)")
+    arg_parser.add_argument('--memo-size', type=int, default=1024,
+                            help="maximum number of results remembered per function")
+    arg_parser.add_argument('--no-cache', dest='cache', action='store_false',
+                            help="always lex and parse the files instead of using __lambdacache__")
+    args = arg_parser.parse_args()
+    if args.memoize and args.backend not in MEMOIZING_BACKENDS:
+        arg_parser.error(f"--memoize is not supported by the {args.backend} backend")
+    if args.workers is not None and args.workers < 1 or args.chunksize < 1:
+        arg_parser.error("--workers and --chunksize must be at least 1")
+    try:
+        files = collect_files(args.sources)
+    except ValueError as error:
+        arg_parser.error(str(error))
+
+    report = run_batch(files, args.workers, args.chunksize, args.backend, args.optimize, args.memoize,
+                       args.memo_size, args.cache)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    sys.exit(1 if report['summary']['failed'] else 0)
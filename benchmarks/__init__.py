@@ -0,0 +1,5 @@
+# Reproducible benchmarks for the lexer, the parser and the interpreter backends.
+# Run them with `python -m benchmarks run`, and compare two result files with `python -m benchmarks compare`
+from benchmarks.workloads import WORKLOADS
+from benchmarks.runner import PHASES, run_benchmarks
+from benchmarks.compare import compare_results
@@ -0,0 +1,68 @@
+import argparse
+import json
+import sys
+
+from backends import BACKENDS
+from benchmarks.workloads import WORKLOADS
+from benchmarks.runner import run_benchmarks
+from benchmarks.compare import THRESHOLD, compare_results, format_comparison
+
+
+# Print one finished benchmark while the suite runs
+def report(name, summary):
+    print(f"{name:<24} median {summary['median'] * 1000:10.3f} ms  "
+          f"(min {summary['min'] * 1000:.3f}, stdev {summary['stdev'] * 1000:.3f})", file=sys.stderr)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run the benchmarks and write their results as JSON")
+    run.add_argument('--workload', action='append', choices=list(WORKLOADS), dest='workloads',
+                     help="workload to run (can be repeated; default: all of them)")
+    run.add_argument('--repeat', type=int, default=5, help="timed runs per benchmark")
+    run.add_argument('--warmup', type=int, default=1, help="untimed runs before the timed ones")
+    run.add_argument('--scale', type=int, default=1, help="multiply the size of every workload")
+    run.add_argument('--backend', choices=list(BACKENDS), default='tree',
+                     help="execution engine the run phase uses")
+    run.add_argument('--output', default=None, help="file to write the results to (default: standard output)")
+
+    compare = commands.add_parser('compare', help="compare two result files and flag regressions")
+    compare.add_argument('old', help="results of the baseline")
+    compare.add_argument('new', help="results to check against the baseline")
+    compare.add_argument('--threshold', type=float, default=THRESHOLD,
+                         help="relative slowdown of the median that counts as a regression (default: 0.10)")
+
+    args = arg_parser.parse_args(argv)
+    if args.command == 'run':
+        try:
+            results = run_benchmarks(args.workloads, args.repeat, args.warmup, args.scale, args.backend, report)
+        except ValueError as error:
+            arg_parser.error(str(error))
+        text = json.dumps(results, indent=2, sort_keys=True)
+        if args.output is None:
+            print(text)
+        else:
+            with open(args.output, 'w') as file:
+                file.write(text + '\n')
+        return 0
+
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    for key in ('backend', 'scale'):
+        if old['meta'].get(key) != new['meta'].get(key):
+            print(f"Warning: the results were measured with different {key} settings", file=sys.stderr)
+    rows = compare_results(old, new, args.threshold)
+    print(format_comparison(rows))
+    regressions = [row[0] for row in rows if row[4] == 'regression']
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
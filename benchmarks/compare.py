@@ -0,0 +1,28 @@
+# Default relative change in median time above which a benchmark counts as a regression
+THRESHOLD = 0.10
+
+
+# Compare two result files benchmark by benchmark. Returns one row per benchmark present in both:
+# (name, old median, new median, ratio new/old, status), where status is 'regression', 'improvement' or 'same'
+def compare_results(old, new, threshold=THRESHOLD):
+    rows = []
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before = old['results'][name]['median']
+        after = new['results'][name]['median']
+        ratio = after / before if before else float('inf')
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'improvement'
+        else:
+            status = 'same'
+        rows.append((name, before, after, ratio, status))
+    return rows
+
+
+# The comparison as a text table
+def format_comparison(rows):
+    lines = [f"{'benchmark':<24} {'old (ms)':>10} {'new (ms)':>10} {'ratio':>7}  status"]
+    for name, before, after, ratio, status in rows:
+        lines.append(f"{name:<24} {before * 1000:>10.3f} {after * 1000:>10.3f} {ratio:>7.2f}  {status}")
+    return "\n".join(lines)
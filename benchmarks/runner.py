@@ -0,0 +1,91 @@
+import gc
+import platform
+import statistics
+import sys
+import time
+
+from lexer import Lexer
+from parser import Parser
+from backends import create_interpreter
+from benchmarks.workloads import WORKLOADS
+
+# The phases timed for every workload, each on the output of the one before
+PHASES = ('lex', 'parse', 'run')
+
+
+# Time `function` `repeat` times after `warmup` untimed calls. The garbage collector is paused
+# while a call is timed (as timeit does), so collections triggered by earlier runs do not add noise
+def time_runs(function, repeat, warmup):
+    for _ in range(warmup):
+        function()
+    runs = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            runs.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return runs
+
+
+# Statistical summary of the run times of one benchmark, in seconds
+def summarize(runs):
+    return {
+        'runs': runs,
+        'min': min(runs),
+        'max': max(runs),
+        'mean': statistics.mean(runs),
+        'median': statistics.median(runs),
+        'stdev': statistics.stdev(runs) if len(runs) > 1 else 0.0,
+    }
+
+
+# Run every phase of one workload. Lexing and parsing are timed on their own; each run of the
+# program uses a fresh interpreter, so definitions from an earlier run are not reused
+def run_workload(source, repeat, warmup, backend):
+    tokens = Lexer(source).lex()
+    tree = Parser(tokens).parse()
+
+    def run():
+        interpreter = create_interpreter(backend)
+        for statement in tree:
+            interpreter.visit(statement)
+
+    return {
+        'lex': summarize(time_runs(lambda: Lexer(source).lex(), repeat, warmup)),
+        'parse': summarize(time_runs(lambda: Parser(tokens).parse(), repeat, warmup)),
+        'run': summarize(time_runs(run, repeat, warmup)),
+    }
+
+
+# Run the named workloads (all of them by default) and return the results, keyed "workload/phase"
+def run_benchmarks(names=None, repeat=5, warmup=1, scale=1, backend='tree', progress=None):
+    names = list(WORKLOADS) if names is None else names
+    for name in names:
+        if name not in WORKLOADS:
+            raise ValueError(f"Unknown workload: {name} (expected one of: {', '.join(WORKLOADS)})")
+    if repeat < 1 or warmup < 0 or scale < 1:
+        raise ValueError("repeat and scale must be at least 1, and warmup at least 0")
+
+    results = {}
+    for name in names:
+        source = WORKLOADS[name](scale)
+        for phase, summary in run_workload(source, repeat, warmup, backend).items():
+            results[f'{name}/{phase}'] = summary
+            if progress is not None:
+                progress(f'{name}/{phase}', summary)
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'backend': backend,
+            'repeat': repeat,
+            'warmup': warmup,
+            'scale': scale,
+        },
+        'results': results,
+    }
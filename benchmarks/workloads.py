@@ -0,0 +1,70 @@
+# The benchmark workloads. Each one is a function that returns the source of a program; `scale`
+# multiplies its size. Sources are generated deterministically, so every run measures the same program.
+
+
+# Long arithmetic expressions with every operator and plenty of parentheses
+def arithmetic(scale=1):
+    lines = []
+    for i in range(200 * scale):
+        a, b, c = i % 97 + 1, i % 13 + 1, i % 7 + 2
+        lines.append(f"(({a} + {b}) * {c} - {a} / {b} + {a} % {c}) * (({b} - {c}) * {a} + {i}) / {c}")
+        lines.append(f"({a} > {b}) && ({b} < {c}) || !({a} == {c + i})")
+    return "\n".join(lines)
+
+
+# Deep recursion: factorial close to the depth the tree walker can handle
+def recursion(scale=1):
+    lines = ["defun factorial(n) { if n == 0 1 else n * factorial(n - 1) }"]
+    lines.extend(f"factorial({50 + i % 10})" for i in range(20 * scale))
+    return "\n".join(lines)
+
+
+# Many calls to small defun functions, nested a few levels deep
+def calls(scale=1):
+    lines = [
+        "defun add(a, b) { a + b }",
+        "defun double(x) { add(x, x) }",
+        "defun inc(x) { x + 1 }",
+        "defun iseven(x) { x % 2 == 0 }",
+        "defun pick(x) { if iseven(x) double(x) else inc(x) }",
+        "defun sum3(a, b, c) { add(add(a, b), c) }",
+    ]
+    for i in range(300 * scale):
+        lines.append(f"sum3(pick({i}), double(inc({i})), add({i}, pick({i + 1})))")
+    return "\n".join(lines)
+
+
+# A long generated file of definitions and statements, to weigh on the lexer and the parser
+def long_file(scale=1):
+    lines = []
+    for i in range(1000 * scale):
+        lines.append(f"# function number {i}")
+        lines.append(f"defun f{i}(x, y) {{ if x > {i % 50} x * y + {i} else f{max(i - 1, 0)}(x + 1, y) }}")
+        lines.append(f"f{i}({i % 60}, {i % 9})")
+    return "\n".join(lines)
+
+
+# Lambda-heavy code in the style of program.lambda: immediately applied lambdas and higher-order functions
+def lambdas(scale=1):
+    lines = [
+        "defun applytwice(f, x) { f(f(x)) }",
+        "defun addone(x) { x + 1 }",
+        "defun compose(f, g, x) { f(g(x)) }",
+        "defun square(x) { x * x }",
+    ]
+    for i in range(200 * scale):
+        lines.append(f"lambd(x) ( x * x )({i})")
+        lines.append(f"lambd(x, y) ( x * y + x - y )({i}, {i % 11})")
+        lines.append(f"applytwice(addone, {i})")
+        lines.append(f"compose(square, addone, {i % 30})")
+    return "\n".join(lines)
+
+
+# Workloads by name, in the order they are run and reported
+WORKLOADS = {
+    'arithmetic': arithmetic,
+    'recursion': recursion,
+    'calls': calls,
+    'long_file': long_file,
+    'lambdas': lambdas,
+}
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+from lexer import Lexer
+from parser import Parser
+from optimizer import Optimizer
+from inliner import Inliner
+
+# Bump whenever the AST node classes, the parser or the optimizer change what they produce,
+# so programs cached by an older interpreter are parsed again
+CACHE_VERSION = 7
+
+# Directory (next to the source file, like __pycache__) that holds cached compiled programs
+CACHE_DIR = '__lambdacache__'
+
+
+# Path of a cache entry for a source file, e.g. __lambdacache__/program.lambda.ast.pickle
+def cache_path(file_path, suffix):
+    directory, filename = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, CACHE_DIR, filename + suffix)
+
+
+# Write a file so that readers see either the old contents or the complete new ones, never a partial
+# write. Failures are ignored - an unwritable cache only costs the next run the work it would have saved
+def atomic_write(path, data):
+    temp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# Return (statements, removed) for a .lambda file: its parsed - and, with optimize, optimized - AST,
+# and the number of nodes the optimizer removed. The result is cached on disk keyed by the hash
+# of the source text, the cache version and the optimizer setting, so an unchanged file is loaded
+# without running the Lexer or the Parser, and any change to the file invalidates the entry
+def load_program(file_path, optimize=False, use_cache=True):
+    with open(file_path, 'rb') as file:
+        source = file.read()
+    key = {
+        'version': CACHE_VERSION,
+        'python': sys.version_info[:2],
+        'sha256': hashlib.sha256(source).hexdigest(),
+        'optimized': optimize,
+    }
+    path = cache_path(file_path, '.opt.pickle' if optimize else '.ast.pickle')
+
+    if use_cache:
+        try:
+            with open(path, 'rb') as file:
+                # The key is a separate pickle in front of the tree, so a stale entry is never unpickled in full
+                if pickle.load(file) == key:
+                    return pickle.load(file)
+        except Exception:
+            pass  # Missing, stale or unreadable entries are simply rebuilt
+
+    tree = Parser(Lexer(source.decode()).lex()).parse()
+    removed = 0
+    if optimize:
+        optimizer = Optimizer(Inliner())  # A file is a whole program, so its functions can be inlined
+        tree = optimizer.optimize(tree)
+        removed = optimizer.removed
+
+    if use_cache:
+        try:
+            data = pickle.dumps(key) + pickle.dumps((tree, removed), pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            data = None  # Extremely deep trees are not cached
+        if data is not None:
+            atomic_write(path, data)
+    return tree, removed
@@ -0,0 +1,201 @@
+# Token Types
+INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
+    AND, OR, NOT, EQ, NEQ, GT, LT, GEQ, LEQ, \
+    ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
+    'INTEGER', 'BOOLEAN', 'PLUS', 'MINUS', 'MUL', 'DIV', 'MOD', 'LPAREN', 'RPAREN',
+    'AND', 'OR', 'NOT', 'EQ', 'NEQ', 'GT', 'LT', 'GEQ', 'LEQ',
+    'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
+)
+
+import operator
+
+from sinks import NullSink
+
+# Binary operators resolved to plain Python callables (DIV keeps the integer division of the tree walker)
+BINARY_OPERATORS = {
+    PLUS: operator.add,
+    MINUS: operator.sub,
+    MUL: operator.mul,
+    DIV: operator.floordiv,
+    MOD: operator.mod,
+    EQ: operator.eq,
+    NEQ: operator.ne,
+    GT: operator.gt,
+    LT: operator.lt,
+    GEQ: operator.ge,
+    LEQ: operator.le,
+}
+
+# Unary operators resolved to plain Python callables
+UNARY_OPERATORS = {
+    MINUS: operator.neg,
+    NOT: operator.not_,
+}
+
+
+# A compiled function or lambda - a closure over its body plus the environment it was defined in
+class CompiledFunction:
+    def __init__(self, name, params, body, env=None):
+        self.name = name      # Function name ('<lambda>' for lambdas)
+        self.params = params  # Parameter names
+        self.body = body      # Compiled body: a callable taking an environment
+        self.env = env        # Enclosing environment (None for top-level definitions)
+
+    def __call__(self, *args):
+        if len(args) != len(self.params):
+            raise TypeError("Argument count mismatch")
+        return self.body((args, self.env))
+
+    def __repr__(self):
+        return f'<function {self.name}({", ".join(self.params)})>'
+
+
+# The ClosureInterpreter compiles the AST once into nested Python closures and then runs them.
+# Every closure takes an environment - a (values, parent) pair - so no per-node dispatch happens at run time.
+class ClosureInterpreter:
+    def __init__(self, output=None):
+        self.global_scope = {}  # Global scope for storing functions
+        self.output = output if output is not None else NullSink()  # Sink for the results of top-level statements
+
+    # Compile and execute a statement or a list of statements, mirroring Interpreter.visit
+    def visit(self, node):
+        if isinstance(node, list):
+            return self.visit_statements(node)
+        return self.compile(node)(None)
+
+    # Execute a list of statements in sequence and collect their non-None results
+    def visit_statements(self, statements):
+        result = None
+        for statement in statements:
+            result = self.compile(statement)(None)
+            if result is not None:
+                self.output.write(result)
+        return result
+
+    # Main compile method that dispatches to the appropriate compile method.
+    # `scope` is the chain of parameter lists enclosing the node, innermost first.
+    def compile(self, node, scope=()):
+        method_name = f'compile_{type(node).__name__.lower()}'
+        method = getattr(self, method_name, self.generic_compile)
+        return method(node, scope)
+
+    # Compile a function or lambda body (a single expression or a list of statements)
+    def compile_body(self, body, scope):
+        if not isinstance(body, list):
+            return self.compile(body, scope)
+        statements = [self.compile(statement, scope) for statement in body]
+        if not statements:
+            return lambda env: None
+        if len(statements) == 1:
+            return statements[0]
+
+        def run_body(env):
+            result = None
+            for statement in statements:
+                result = statement(env)
+            return result
+        return run_body
+
+    # Generic compile method that raises an error if no specific compile method is found
+    def generic_compile(self, node, scope):
+        raise Exception(f'No compile_{type(node).__name__} method')
+
+    # Compile a number node into a constant
+    def compile_num(self, node, scope):
+        value = node.value
+        return lambda env: value
+
+    # Compile a boolean node into a constant
+    def compile_bool(self, node, scope):
+        value = node.value
+        return lambda env: value
+
+    # Compile a variable node - parameters become direct frame reads, anything else a global lookup
+    def compile_var(self, node, scope):
+        name = node.name
+        for depth, params in enumerate(scope):
+            if name in params:
+                slot = params.index(name)
+                if depth == 0:
+                    return lambda env: env[0][slot]
+
+                def load_outer(env):
+                    for _ in range(depth):
+                        env = env[1]
+                    return env[0][slot]
+                return load_outer
+
+        global_scope = self.global_scope
+
+        def load_global(env):
+            try:
+                return global_scope[name]
+            except KeyError:
+                raise NameError(f"Undefined variable: {name}") from None
+        return load_global
+
+    # Compile a binary operation, resolving the operator to a callable now instead of at every evaluation
+    def compile_binop(self, node, scope):
+        left = self.compile(node.left, scope)
+        right = self.compile(node.right, scope)
+
+        # Short-circuit evaluation for AND and OR logical operators
+        if node.op.type == OR:
+            def or_(env):
+                value = left(env)
+                return value if value else right(env)
+            return or_
+        elif node.op.type == AND:
+            def and_(env):
+                value = left(env)
+                return right(env) if value else value
+            return and_
+
+        op = BINARY_OPERATORS[node.op.type]
+        return lambda env: op(left(env), right(env))
+
+    # Compile a unary operation
+    def compile_unaryop(self, node, scope):
+        expr = self.compile(node.expr, scope)
+        op = UNARY_OPERATORS[node.op.type]
+        return lambda env: op(expr(env))
+
+    # Compile a function definition - the body is compiled once, when the definition is reached
+    def compile_function(self, node, scope):
+        body = self.compile_body(node.body, (node.params,) + scope)
+        name, params, global_scope = node.name, node.params, self.global_scope
+
+        def define(env):
+            global_scope[name] = CompiledFunction(name, params, body, env)
+        return define
+
+    # Compile a lambda into a closure factory that captures the current environment
+    def compile_lambda(self, node, scope):
+        body = self.compile_body(node.body, (node.params,) + scope)
+        params = node.params
+        return lambda env: CompiledFunction('<lambda>', params, body, env)
+
+    # Compile a function call, specialising the common small arities
+    def compile_call(self, node, scope):
+        func = self.compile(node.func, scope)
+        args = [self.compile(arg, scope) for arg in node.args]
+
+        # A non-callable target surfaces as Python's own TypeError
+        if len(args) == 0:
+            return lambda env: func(env)()
+        if len(args) == 1:
+            arg0, = args
+            return lambda env: func(env)(arg0(env))
+        if len(args) == 2:
+            arg0, arg1 = args
+            return lambda env: func(env)(arg0(env), arg1(env))
+        return lambda env: func(env)(*[arg(env) for arg in args])
+
+    # Compile an if statement into a closure choosing between the compiled branches
+    def compile_if(self, node, scope):
+        condition = self.compile(node.condition, scope)
+        then_branch = self.compile(node.then_branch, scope)
+        if node.else_branch is None:
+            return lambda env: then_branch(env) if condition(env) else None
+        else_branch = self.compile(node.else_branch, scope)
+        return lambda env: then_branch(env) if condition(env) else else_branch(env)
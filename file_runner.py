@@ -1,52 +1,165 @@
-from lexer import Lexer
+import sys
+
+from lexer import StreamLexer
 from parser import Parser
-from interpreter import Interpreter
+from optimizer import Optimizer
+from inliner import Inliner
+from cache import load_program
+from backends import BACKENDS, MEMOIZING_BACKENDS, create_interpreter
+from profiler import ProfilingInterpreter
+from snapshot import Snapshot
+from sinks import BufferedSink
+
+# Size of the pieces a file is read in when streaming
+CHUNK_SIZE = 64 * 1024
 
 # Function to run a file containing the source code
-def run_file(file_path):
-    # Open the file and read its contents
-    with open(file_path, 'r') as file:
-        code = file.read()
-
-    # Initialize the Lexer with the code and generate tokens
-    lexer = Lexer(code)
-    tokens = lexer.lex()
-
-    # Pass the tokens to the Parser and generate the AST
-    parser = Parser(tokens)
-    tree = parser.parse()
-
-    # Initialize the Interpreter to execute the AST
-    interpreter = Interpreter()
-    results = []
-
-    # If the AST is a list (multiple statements), visit each statement
-    if isinstance(tree, list):
-        for statement in tree:
-            result = interpreter.visit(statement)
-            if result is not None:
-                results.append(result)
+# With `profile`, the program runs under the profiler (tree backend only), which reports to stderr
+# and, if `profile_stacks` names a file, writes the call stacks there in collapsed format.
+# With a `prelude` Snapshot, the program starts with the prelude's functions already defined
+def run_file(file_path, backend='tree', optimize=False, memoize=False, memo_size=1024, stream=False, cache=True,
+             profile=False, profile_stacks=None, prelude=None):
+    if stream:
+        run_stream(file_path, backend, optimize, memoize, memo_size, prelude)
+        return
+
+    # Results are printed in batches as the program produces them
+    output = BufferedSink(sys.stdout)
+    interpreter = None
+    if profile and prelude is not None:
+        # The snapshot's nodes have offsets into the prelude's source, which the profiler cannot map to lines
+        raise ValueError("Profiling does not support prelude snapshots")
+    if profile:
+        with open(file_path, 'r') as file:
+            interpreter = ProfilingInterpreter(memoize, memo_size, source=file.read(), output=output)
+    elif prelude is not None:
+        interpreter = prelude.fork(backend, memoize, memo_size, output)
+    try:
+        interpreter, removed = execute_file(file_path, backend, optimize, memoize, memo_size, cache, interpreter,
+                                            output)
+    finally:
+        output.close()
+    if optimize and removed is not None:
+        report_optimizer(removed)
+
+    if memoize:
+        report_memo(interpreter)
+    if profile:
+        print(interpreter.report(), file=sys.stderr)
+        if profile_stacks is not None:
+            with open(profile_stacks, 'w') as file:
+                file.write(interpreter.collapsed() + '\n')
+
+# Run a file, writing the non-None results of its top-level statements to the `output` sink, and return
+# the interpreter that ran it and the number of nodes the optimizer removed (None when it is not known).
+# `interpreter` replaces the one the backend would create, e.g. to run under the profiler; the results
+# then go to its own sink
+def execute_file(file_path, backend='tree', optimize=False, memoize=False, memo_size=1024, cache=True,
+                 interpreter=None, output=None):
+    # The python backend transpiles the whole file at once and caches the generated module
+    if backend == 'python' and cache and not memoize and interpreter is None:
+        interpreter = create_interpreter(backend, output=output)
+        interpreter.run_file(file_path, optimize)
+        return interpreter, None
+
+    # Lex and parse the file (and optionally fold constants and simplify the AST),
+    # or load the result from the cache if the file has not changed since it was last run
+    tree, removed = load_program(file_path, optimize, cache)
+
+    # Initialize the selected interpreter backend to execute the AST
+    if interpreter is None:
+        interpreter = create_interpreter(backend, memoize, memo_size, output)
+
+    # Run the statements; the interpreter writes their results to its sink
+    interpreter.visit(tree if isinstance(tree, list) else [tree])
+    return interpreter, removed
+
+# Run a file as a stream: it is read in chunks, and every top-level statement is executed and its
+# result printed as soon as the statement has been parsed. Memory use is bounded by the largest
+# statement rather than by the file, and output starts before the whole file has been read
+def run_stream(file_path, backend='tree', optimize=False, memoize=False, memo_size=1024, prelude=None):
+    output = BufferedSink(sys.stdout)
+    if prelude is not None:
+        interpreter = prelude.fork(backend, memoize, memo_size, output)
     else:
-        # Otherwise, just visit the single statement/tree
-        result = interpreter.visit(tree)
-        if result is not None:
-            results.append(result)
+        interpreter = create_interpreter(backend, memoize, memo_size, output)
+    # Later statements can still redefine any function, so only calls in top-level expressions are inlined
+    optimizer = Optimizer(Inliner(closed=False)) if optimize else None
+    removed = 0
+
+    try:
+        with open(file_path, 'r') as file:
+            chunks = iter(lambda: file.read(CHUNK_SIZE), '')
+            for statement in Parser(StreamLexer(chunks).tokens()).statements():
+                if optimizer is not None:
+                    statement = optimizer.optimize(statement)
+                    removed += optimizer.removed
+                interpreter.visit([statement])
+                output.flush()  # Show the result right away rather than with the next batch
+    finally:
+        output.close()
 
-    # Print the results of the execution
-    for result in results:
-        print(result)
+    if optimizer is not None:
+        report_optimizer(removed)
+    if memoize:
+        report_memo(interpreter)
+
+# Report how often the memo tables of pure functions were used
+def report_memo(interpreter):
+    for name, stats in interpreter.memo.stats().items():
+        print(f"Memo {name}: {stats['hits']} hits, {stats['misses']} misses, {stats['size']} cached",
+              file=sys.stderr)
+
+# Tell how much the optimizer shrank the program - or grew it, when inlining added more than folding removed
+def report_optimizer(removed):
+    if removed >= 0:
+        print(f"Optimizer removed {removed} nodes", file=sys.stderr)
+    else:
+        print(f"Optimizer added {-removed} nodes by inlining", file=sys.stderr)
 
 # Main entry point for running the script
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) == 2:
-        input_filename = sys.argv[1]
-        # Ensure the file has the correct extension
-        if not input_filename.endswith('.lambda'):
-            print("Error: File must have a .lambda extension")
-        else:
-            # Run the file if the extension is correct
-            run_file(input_filename)
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="python file_runner.py")
+    arg_parser.add_argument('file', help="program to run, with a .lambda extension")
+    arg_parser.add_argument('--backend', choices=list(BACKENDS), default='tree',
+                            help="execution engine to run the program with")
+    arg_parser.add_argument('--optimize', action='store_true',
+                            help="fold constants, inline small functions and simplify the AST before running it")
+    arg_parser.add_argument('--memoize', action='store_true',
+                            help="remember the results of pure functions (tree and stackless backends)")
+    arg_parser.add_argument('--memo-size', type=int, default=1024,
+                            help="maximum number of results remembered per function")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="read the file in chunks and print each result as soon as it is computed")
+    arg_parser.add_argument('--no-cache', dest='cache', action='store_false',
+                            help="always lex and parse the file instead of using __lambdacache__")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="report time per function and evaluations per AST node to stderr (tree backend)")
+    arg_parser.add_argument('--profile-stacks', default=None, metavar='FILE',
+                            help="with --profile, also write the call stacks to FILE for flame graph tools")
+    arg_parser.add_argument('--prelude-snapshot', default=None, metavar='FILE',
+                            help="start with the functions of a prelude snapshot written by snapshot.py")
+    args = arg_parser.parse_args()
+    if args.memoize and args.backend not in MEMOIZING_BACKENDS:
+        arg_parser.error(f"--memoize is not supported by the {args.backend} backend")
+    if args.profile_stacks is not None:
+        args.profile = True
+    if args.profile and (args.backend != 'tree' or args.stream):
+        arg_parser.error("--profile only works with the tree backend, without --stream")
+    if args.profile and args.prelude_snapshot is not None:
+        arg_parser.error("--profile cannot be combined with --prelude-snapshot")
+    prelude = None
+    if args.prelude_snapshot is not None:
+        try:
+            prelude = Snapshot.load(args.prelude_snapshot)
+        except (OSError, ValueError) as error:
+            arg_parser.error(str(error))
+    input_filename = args.file
+    # Ensure the file has the correct extension
+    if not input_filename.endswith('.lambda'):
+        print("Error: File must have a .lambda extension")
     else:
-        # Print usage information if the wrong number of arguments is provided
-        print("Usage: python file_runner.py <program.lambda>")
+        # Run the file if the extension is correct
+        run_file(input_filename, args.backend, args.optimize, args.memoize, args.memo_size, args.stream, args.cache,
+                 args.profile, args.profile_stacks, prelude)
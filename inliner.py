@@ -0,0 +1,366 @@
+# Token Types
+INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
+    AND, OR, NOT, EQ, NEQ, GT, LT, GEQ, LEQ, \
+    ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
+    'INTEGER', 'BOOLEAN', 'PLUS', 'MINUS', 'MUL', 'DIV', 'MOD', 'LPAREN', 'RPAREN',
+    'AND', 'OR', 'NOT', 'EQ', 'NEQ', 'GT', 'LT', 'GEQ', 'LEQ',
+    'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
+)
+
+from collections import Counter
+
+from lexer import Token
+from parser import BinOp, UnaryOp, Num, Bool, Var, Function, Lambda, Call, If
+from purity import free_variables
+from resolver import children
+from optimizer import Optimizer, count_nodes
+
+# Largest function body, in AST nodes, that is copied into its call sites
+INLINE_SIZE = 12
+
+# Most AST nodes that inlining and specialization may add to one program
+INLINE_BUDGET = 2000
+
+
+# The Inliner replaces calls of small defun functions by a copy of the function's body, with the
+# arguments in place of the parameters, so a call like addone(x) costs no more than x + 1. Calls that
+# only became direct through the substitution are inlined in turn: applytwice(addone, x) becomes
+# addone(addone(x)) and then x + 1 + 1. Functions too large to inline that are called with constant
+# or function arguments get a specialized copy instead (applytwice_addone(x), defined just before the
+# statement that needs it) when that lets something in it be inlined or folded.
+#
+# The rewritten program computes the same values and raises the same errors:
+# - only functions whose single-expression body neither recurses (directly or through other known
+#   functions) nor defines functions or lambdas are inlined or specialized, and only with the right
+#   number of arguments;
+# - an argument that could fail (anything but a constant, a parameter or the name of a known function)
+#   is only substituted where the body evaluates it exactly once, unconditionally, before anything
+#   else that could fail, and in argument order - just as the call would;
+# - a body is not inlined where one of the names it reads would be captured by a parameter of the
+#   code around the call site.
+# Copied nodes keep their offsets, so errors and profiles point at the function the code came from.
+#
+# With `closed`, a list of statements is a whole program (as file_runner runs it): a function defined
+# exactly once is known from its definition onwards, and is also inlined into the bodies of functions
+# defined after it. Otherwise - for the repl, the server and streamed files, where later input can
+# redefine any function - function definitions are left as they are and only top-level expressions
+# are rewritten, with the definitions seen so far; nothing is specialized.
+class Inliner:
+    def __init__(self, max_size=INLINE_SIZE, budget=INLINE_BUDGET, closed=True):
+        self.max_size = max_size
+        self.budget = budget
+        self.closed = closed
+        self.functions = {}        # Name -> Function that calls of that name can be inlined from
+        self.recursive = None      # Names of the known functions that can call themselves, None until needed
+        self.grown = 0             # AST nodes added so far
+        self.inlined = 0           # Calls replaced by a function body
+        self.specialized = 0       # Specialized copies of functions created
+        self.scope = ()            # Parameter lists enclosing the node being visited, innermost first
+        self.expanding = ()        # Functions whose bodies are being inlined, to stop at recursion through arguments
+        self.specializations = {}  # (function name, constant arguments) -> name of the specialized copy, or None
+        self.pending = []          # Specialized copies to define before the current statement
+        self.names = set()         # Every name of the program, so specialized copies get new ones
+        self.folder = Optimizer()  # Folds the code made by inlining, before the call around it is considered
+
+    # Inline the calls of a list of statements and return the new list
+    def inline(self, statements):
+        once = set()
+        if self.closed:
+            # A defun nested in a function body also defines a global function when it runs
+            counts = Counter(node.name for node in walk(statements) if isinstance(node, Function))
+            once = {name for name, count in counts.items() if count == 1}
+            self.functions, self.recursive, self.specializations = {}, None, {}
+            self.names = set(counts) | {node.name for node in walk(statements) if isinstance(node, Var)}
+        result = []
+        for statement in statements:
+            if isinstance(statement, Function):
+                if self.closed:
+                    statement = self.visit(statement)
+                self.define(statement, not self.closed or statement.name in once)
+            else:
+                statement = self.visit(statement)
+            result.extend(self.pending)
+            self.pending = []
+            result.append(statement)
+        return result
+
+    # Record a definition: from now on calls of its name use it, if it can be inlined at all
+    def define(self, func, known):
+        self.functions.pop(func.name, None)
+        self.recursive = None
+        body = expression(func.body)
+        if known and body is not None and not any(isinstance(node, (Function, Lambda)) for node in walk(body)):
+            self.functions[func.name] = func
+
+    # Main visit method: returns the node with the calls below it inlined (the node itself if nothing changed)
+    def visit(self, node):
+        if isinstance(node, Call):
+            return self.visit_call(node)
+        if isinstance(node, (Function, Lambda)):
+            return self.visit_scope(node)
+        if isinstance(node, BinOp):
+            left, right = self.visit(node.left), self.visit(node.right)
+            if left is node.left and right is node.right:
+                return node
+            return BinOp(left, node.op, right, node.offset)
+        if isinstance(node, UnaryOp):
+            expr = self.visit(node.expr)
+            return node if expr is node.expr else UnaryOp(node.op, expr, node.offset)
+        if isinstance(node, If):
+            condition, then_branch = self.visit(node.condition), self.visit(node.then_branch)
+            else_branch = None if node.else_branch is None else self.visit(node.else_branch)
+            if condition is node.condition and then_branch is node.then_branch and else_branch is node.else_branch:
+                return node
+            return If(condition, then_branch, else_branch, node.offset)
+        if isinstance(node, list):
+            statements = [self.visit(statement) for statement in node]
+            return node if all(new is old for new, old in zip(statements, node)) else statements
+        return node  # Numbers, booleans and variables
+
+    # Visit the body of a function or lambda with its parameters in scope
+    def visit_scope(self, node):
+        outer, outer_expanding = self.scope, self.expanding
+        self.scope = (node.params,) + outer
+        if isinstance(node, Function):
+            self.expanding = outer_expanding + (node.name,)
+        try:
+            body = self.visit(node.body)
+        finally:
+            self.scope, self.expanding = outer, outer_expanding
+        if body is node.body:
+            return node
+        if isinstance(node, Function):
+            return Function(node.name, node.params, body, node.offset)
+        return Lambda(node.params, body, node.offset)
+
+    # Inline or specialize a call of a known function, after its function and arguments
+    def visit_call(self, node):
+        func = self.visit(node.func)
+        args = [self.visit(arg) for arg in node.args]
+        target = self.target(func, args)
+        if target is not None:
+            replacement = self.expand(node, target, args)
+            if replacement is None and self.closed:
+                replacement = self.specialize(node, target, args)
+            if replacement is not None:
+                return replacement
+        if func is node.func and all(new is old for new, old in zip(args, node.args)):
+            return node
+        return Call(func, args, node.offset)
+
+    # The known function a call with these arguments can be rewritten to use, or None
+    def target(self, func, args):
+        if not isinstance(func, Var) or self.is_local(func.name) or func.name in self.expanding:
+            return None
+        target = self.functions.get(func.name)
+        if target is None or len(args) != len(target.params) or func.name in self.recursive_functions():
+            return None
+        return target
+
+    # Replace a call by the body of the function it calls, or return None if that is not safe or too large
+    def expand(self, node, target, args):
+        body = expression(target.body)
+        if count_nodes(body) > self.max_size:
+            return None
+        if free_variables(body, frozenset(target.params)) & self.local_names():
+            return None  # A name the body reads would be captured by a parameter around the call site
+        if not self.in_order(body, target.params, args):
+            return None
+        called = callees(body)
+        if any(isinstance(arg, (Num, Bool)) and param in called for param, arg in zip(target.params, args)):
+            return None  # The call would become a call of a constant, like 3(4), which Python warns about
+        replacement = substitute(body, dict(zip(target.params, args)))
+        grown = count_nodes(replacement) - count_nodes(node)
+        if self.grown + grown > self.budget:
+            return None
+        self.grown += grown
+        self.inlined += 1
+        outer = self.expanding
+        self.expanding = outer + (target.name,)
+        try:
+            replacement = self.visit(replacement)  # Calls made direct by the substitution can be inlined in turn
+        finally:
+            self.expanding = outer
+        return self.folder.fold(replacement)  # So that the call around this one sees the constants
+
+    # Call a copy of the function specialized on its constant and function arguments, or return None.
+    # The copy is defined before the current top-level statement, and reused by calls with the same constants
+    def specialize(self, node, target, args):
+        called = callees(expression(target.body))
+        fixed = {param: arg for param, arg in zip(target.params, args) if self.is_fixed(arg, param in called)}
+        if not fixed:
+            return None
+        params = [param for param in target.params if param not in fixed]
+        if any(isinstance(arg, Var) and arg.name in params for arg in fixed.values()):
+            return None  # A function argument would be captured by a remaining parameter
+        key = (target.name, tuple((param, type(arg), arg.value if isinstance(arg, (Num, Bool)) else arg.name)
+                                  for param, arg in fixed.items()))
+        if key not in self.specializations:
+            self.specializations[key] = self.specialized_copy(target, fixed, params)
+        name = self.specializations[key]
+        if name is None:
+            return None
+        func = Var(Token(ID, name, node.func.offset))
+        return Call(func, [arg for param, arg in zip(target.params, args) if param not in fixed], node.offset)
+
+    # Define a copy of a function with the arguments in `fixed` substituted, and return its name. Returns
+    # None, and defines nothing, when the copy would be no simpler than the function: nothing in it could
+    # be inlined or folded
+    def specialized_copy(self, target, fixed, params):
+        body = substitute(expression(target.body), fixed)
+        grown, inlined = self.grown, self.inlined
+        if grown + count_nodes(body) + 1 > self.budget:
+            return None
+        self.grown += count_nodes(body) + 1
+        outer_scope, outer_expanding = self.scope, self.expanding
+        self.scope, self.expanding = (params,), (target.name,)
+        try:
+            body = self.visit(body)
+        finally:
+            self.scope, self.expanding = outer_scope, outer_expanding
+        body = self.folder.optimize(body)
+        if self.inlined == inlined and self.folder.removed <= 0:
+            self.grown, self.inlined = grown, inlined
+            return None
+        name = self.new_name(target.name, fixed.values())
+        self.pending.append(Function(name, params, [body], target.offset))
+        self.specialized += 1
+        return name
+
+    # A name for a specialized copy that no identifier of the program can have (identifiers contain no '_')
+    def new_name(self, name, fixed):
+        parts = [name] + [str(arg.value).lower().replace('-', 'm') if isinstance(arg, (Num, Bool)) else arg.name
+                          for arg in fixed]
+        candidate, number = '_'.join(parts), 1
+        while candidate in self.names:
+            number += 1
+            candidate = f"{'_'.join(parts)}_{number}"
+        self.names.add(candidate)
+        return candidate
+
+    # Whether the body evaluates the arguments that could fail exactly when, and in the order, the call would
+    def in_order(self, body, params, args):
+        risky = [param for param, arg in zip(params, args) if not self.is_safe(arg)]
+        if not risky:
+            return True
+        uses = Counter(node.name for node in walk(body) if isinstance(node, Var))
+        if any(uses[param] != 1 for param in risky):
+            return False
+        events = []
+        strict_events(body, set(risky), set(params), events)
+        return events[:len(risky)] == risky
+
+    # Whether an argument can be copied any number of times, or dropped, without changing what happens:
+    # a constant, a parameter around the call site, or the name of a known function
+    def is_safe(self, arg):
+        if isinstance(arg, (Num, Bool)):
+            return True
+        return isinstance(arg, Var) and (self.is_local(arg.name) or arg.name in self.functions)
+
+    # Whether a function can be specialized on an argument: a constant, or the name of a known function.
+    # A constant is not substituted for a parameter that is `called`, so no constant ends up called
+    def is_fixed(self, arg, called=False):
+        if isinstance(arg, (Num, Bool)):
+            return not called
+        return isinstance(arg, Var) and not self.is_local(arg.name) and arg.name in self.functions
+
+    # Whether a name is a parameter of the code around the node being visited
+    def is_local(self, name):
+        return any(name in params for params in self.scope)
+
+    # Every parameter name of the code around the node being visited
+    def local_names(self):
+        return {name for params in self.scope for name in params}
+
+    # Known functions that can reach themselves through the names their bodies read
+    def recursive_functions(self):
+        if self.recursive is None:
+            reads = {name: free_variables(func) & set(self.functions) for name, func in self.functions.items()}
+            self.recursive = set()
+            for name in reads:
+                seen, todo = set(), list(reads[name])
+                while todo:
+                    current = todo.pop()
+                    if current not in seen:
+                        seen.add(current)
+                        todo.extend(reads[current])
+                if name in seen:
+                    self.recursive.add(name)
+        return self.recursive
+
+
+# The single expression a function body consists of, or None if it has several statements
+def expression(body):
+    if not isinstance(body, list):
+        return body
+    return body[0] if len(body) == 1 else None
+
+
+# Every node of a tree, parents before children
+def walk(node):
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        yield node
+        nodes.extend(children(node))
+
+
+# Names called directly in a tree, such as f in f(x)
+def callees(node):
+    return {child.func.name for child in walk(node) if isinstance(child, Call) and isinstance(child.func, Var)}
+
+
+# A copy of `node` with the parameters in `mapping` replaced by their arguments. Every other node is
+# new, with the offset of the node it was copied from, so the copy can be resolved on its own
+def substitute(node, mapping):
+    if isinstance(node, Var):
+        if node.name in mapping:
+            return mapping[node.name]
+        return Var(Token(ID, node.name, node.offset))
+    if isinstance(node, BinOp):
+        return BinOp(substitute(node.left, mapping), node.op, substitute(node.right, mapping), node.offset)
+    if isinstance(node, UnaryOp):
+        return UnaryOp(node.op, substitute(node.expr, mapping), node.offset)
+    if isinstance(node, Call):
+        return Call(substitute(node.func, mapping), [substitute(arg, mapping) for arg in node.args], node.offset)
+    if isinstance(node, If):
+        else_branch = None if node.else_branch is None else substitute(node.else_branch, mapping)
+        return If(substitute(node.condition, mapping), substitute(node.then_branch, mapping), else_branch, node.offset)
+    if isinstance(node, Num):
+        return Num(Token(INTEGER, node.value, node.offset))
+    if isinstance(node, Bool):
+        return Bool(Token(BOOLEAN, node.value, node.offset))
+    raise ValueError(f"Cannot inline a {type(node).__name__}")
+
+
+# Append to `events`, in evaluation order, the reads of the parameters in `risky` and None for every
+# other step that could fail (reading a global name included), as far as evaluation is unconditional.
+# Returns False where it stops at a branch (an If, or the right operand of && and ||)
+def strict_events(node, risky, params, events):
+    if isinstance(node, (Num, Bool)):
+        return True
+    if isinstance(node, Var):
+        if node.name in risky:
+            events.append(node.name)
+        elif node.name not in params:
+            events.append(None)
+        return True
+    if isinstance(node, BinOp):
+        if not strict_events(node.left, risky, params, events):
+            return False
+        if node.op.type in (AND, OR):
+            return False
+        if not strict_events(node.right, risky, params, events):
+            return False
+    elif isinstance(node, UnaryOp):
+        if not strict_events(node.expr, risky, params, events):
+            return False
+    elif isinstance(node, Call):
+        for child in [node.func] + node.args:
+            if not strict_events(child, risky, params, events):
+                return False
+    elif isinstance(node, If):
+        strict_events(node.condition, risky, params, events)
+        return False
+    events.append(None)
+    return True
@@ -7,13 +7,53 @@ INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
     'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
 )
 
-from parser import Var, Function
+from parser import Function, Var
+from resolver import Resolver
+from memo import Memoizer
+from parallel import Parallel
+from streams import Streams
+import pvector
+from sinks import NullSink
+
+# A call frame: the argument values of one call, indexed by parameter slot, and the frame
+# the function was defined in. Frames replace copying the whole global scope on every call
+class Frame:
+    __slots__ = ('values', 'parent')
+
+    def __init__(self, values, parent=None):
+        self.values = values  # Argument values, indexed by parameter slot
+        self.parent = parent  # Enclosing frame (None for top-level definitions)
+
+# The inline cache of call sites that call a global defun function by name: the function and its
+# number of parameters. All call sites of one name share the same Binding, and redefining the
+# name marks it invalid, so a call site only looks the name up again after a redefinition
+class Binding:
+    __slots__ = ('scope', 'func', 'arity', 'valid')
+
+    def __init__(self, scope, func):
+        self.scope = scope              # Global scope the function was found in, so each interpreter uses its own
+        self.func = func                # The Function node
+        self.arity = len(func.params)
+        self.valid = True
 
 # Interpreter class that executes the parsed Abstract Syntax Tree (AST)
 class Interpreter:
-    def __init__(self):
+    def __init__(self, memoize=False, memo_size=1024, output=None):
         self.global_scope = {}  # Global scope for storing variables and functions
-        self.output = []        # Output list to store the results of execution
+        self.output = output if output is not None else NullSink()  # Sink for the results of top-level statements
+        self.frame = None       # Frame of the call being executed (None at top level)
+        self.resolver = Resolver()
+        self.bindings = {}      # Function name -> Binding shared by the call sites that call it
+        # Memo tables for pure functions, when memoization is enabled
+        self.memo = Memoizer(self.global_scope, memo_size) if memoize else None
+        # Built-in pmap and preduce, which run pure functions on a pool of worker processes
+        self.parallel = Parallel(self)
+        self.global_scope.update(self.parallel.builtins())
+        # Built-in lazy streams: range, map, filter, take and reduce
+        self.streams = Streams(self)
+        self.global_scope.update(self.streams.builtins())
+        # Built-in persistent lists: list, cons, append, concat, nth and len
+        self.global_scope.update(pvector.builtins())
 
     # Main visit method that dispatches to the appropriate visit method
     def visit(self, node):
@@ -28,8 +68,8 @@ class Interpreter:
         result = None
         for statement in statements:
             result = self.visit(statement)
-            if result is not None:
-                self.output.append(result)  # Collect non-None results
+            if result is not None and self.frame is None:
+                self.output.write(result)  # Results of top-level statements, not of function bodies
         return result
 
     # Generic visit method that raises an error if no specific visit method is found
@@ -44,8 +84,13 @@ class Interpreter:
     def visit_bool(self, node):
         return node.value
 
-    # Visit a variable node and retrieve its value from the global scope
+    # Visit a variable node - parameters are read from their frame slot, other names from the global scope
     def visit_var(self, node):
+        if node.depth is not None:
+            frame = self.frame
+            for _ in range(node.depth):
+                frame = frame.parent
+            return frame.values[node.slot]
         if node.name in self.global_scope:
             return self.global_scope[node.name]
         else:
@@ -99,45 +144,94 @@ class Interpreter:
         elif node.op.type == NOT:
             return not expr  # Logical NOT
 
-    # Visit a function definition node and store it in the global scope
+    # Visit a function definition node, resolve its parameter references and store it in the global scope
     def visit_function(self, node):
-        self.global_scope[node.name] = node  # Store the function by its name
-
-    # Visit a lambda function node and return a callable function object
+        self.resolver.resolve(node)
+        self.define(node)
+
+    # Store a resolved function by its name, replacing any earlier definition
+    def define(self, node):
+        self.global_scope[node.name] = node
+        binding = self.bindings.pop(node.name, None)
+        if binding is not None:
+            binding.valid = False  # Call sites of the old definition look the name up again
+        if self.memo is not None:
+            self.memo.invalidate()  # A new definition can change what other functions compute
+
+    # Visit a lambda function node and return a callable closure over the frame it was created in
     def visit_lambda(self, node):
+        env = self.frame
+        if env is None:
+            self.resolver.resolve(node)  # Lambdas nested in a function were resolved with it
+
         def lambda_func(*args):
             if len(args) != len(node.params):
                 raise TypeError("Argument count mismatch")
-            local_scope = dict(zip(node.params, args))  # Map parameters to arguments
-            previous_scope = self.global_scope.copy()  # Save current scope
-            self.global_scope.update(local_scope)  # Update scope with lambda arguments
-            result = self.visit(node.body)  # Execute lambda body
-            self.global_scope = previous_scope  # Restore previous scope
-            return result
+            return self.call_body(node.body, Frame(args, env))
 
         return lambda_func
 
     # Visit a function call node and execute the function
     def visit_call(self, node):
+        # A call site that called a global function before calls it again directly, as long as the name was not redefined
+        cache = node.cache
+        if cache is not None and cache.valid and cache.scope is self.global_scope:
+            args = [self.visit(arg) for arg in node.args]
+            if len(args) != cache.arity:
+                raise TypeError("Argument count mismatch")
+            return self.call_function(cache.func, args)
+
         func = self.visit(node.func)  # Evaluate the function to call
         args = [self.visit(arg) for arg in node.args]  # Evaluate arguments
-
+        if isinstance(func, Function):
+            name = node.func.name if type(node.func) is Var and node.func.depth is None else None
+            if name is not None and self.global_scope.get(name) is func:
+                binding = self.bindings.get(name)
+                if binding is None or binding.func is not func:
+                    binding = self.bindings[name] = Binding(self.global_scope, func)
+                node.cache = binding
+        elif not callable(func):
+            raise TypeError(f"{getattr(node.func, 'name', func)} is not callable")
+        return self.apply(func, args)
+
+    # Call a function value with already evaluated arguments
+    def apply(self, func, args):
         # Handle function calls defined in the code
-        if isinstance(node.func, Var) and node.func.name in self.global_scope:
-            func_node = self.global_scope[node.func.name]
-            if isinstance(func_node, Function):
-                previous_scope = self.global_scope.copy()  # Save current scope
-                local_scope = dict(zip(func_node.params, args))  # Map parameters to arguments
-                self.global_scope.update(local_scope)  # Update scope with function arguments
-                result = self.visit(func_node.body)  # Execute function body
-                self.global_scope = previous_scope  # Restore previous scope
-                return result
-            else:
-                raise TypeError(f"{node.func.name} is not callable")
+        if isinstance(func, Function):
+            if len(args) != len(func.params):
+                raise TypeError("Argument count mismatch")
+            return self.call_function(func, args)
         elif callable(func):
             return func(*args)  # Handle lambda functions or built-in callables
         else:
-            raise NameError(f"Undefined function: {node.func.name}")
+            raise TypeError(f"{func} is not callable")
+
+    # Call a defun function whose arity has been checked
+    def call_function(self, func, args):
+        if self.memo is not None:
+            return self.call_memoized(func, args)
+        return self.call_body(func.body, Frame(args))
+
+    # Call a function through its memo table if it is pure
+    def call_memoized(self, func, args):
+        table = self.memo.table(func)
+        key = self.memo.key(args)
+        if table is None or key is None:
+            return self.call_body(func.body, Frame(args))
+        found, result = table.get(key)
+        if not found:
+            result = self.call_body(func.body, Frame(args))
+            table.put(key, result)
+        return result
+
+    # Execute a function body in a new frame, restoring the caller's frame afterwards
+    def call_body(self, body, frame):
+        previous_frame = self.frame
+        self.frame = frame
+        try:
+            return self.visit(body)
+        finally:
+            self.frame = previous_frame
 
     # Visit an if statement node and execute the appropriate branch
     def visit_if(self, node):
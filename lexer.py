@@ -7,162 +7,159 @@ ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
     'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
 )
 
-# The Token class represents a single token - the token type and its value if any
+import re
+
+# The Token class represents a single token - the token type, its value if any, and the
+# offset in the source text where it starts. Tokens use __slots__ since a program has many of them
 class Token:
-    def __init__(self, type_, value=None):
+    __slots__ = ('type', 'value', 'offset')
+
+    def __init__(self, type_, value=None, offset=None):
         self.type = type_
         self.value = value
+        self.offset = offset
 
     def __repr__(self):
         return f'Token({self.type}, {repr(self.value)})'
 
+# Token types of the operators and punctuation, by their text
+SYMBOLS = {
+    '+': PLUS, '-': MINUS, '*': MUL, '/': DIV, '%': MOD,
+    '(': LPAREN, ')': RPAREN, '{': 'LBRACE', '}': 'RBRACE', ',': COMMA,
+    '&&': AND, '||': OR, '==': EQ, '!=': NEQ, '!': NOT,
+    '>': GT, '<': LT, '>=': GEQ, '<=': LEQ,
+}
+
+# Keywords and boolean literals, as (token type, value) by their text
+KEYWORDS = {
+    'True': (BOOLEAN, True),
+    'False': (BOOLEAN, False),
+    'if': (IF, 'if'),
+    'defun': (DEFUN, 'defun'),
+    'lambd': (LAMBDA, 'lambd'),
+    'else': (ELSE, 'else'),
+}
+
+# One master pattern matches a whole token per step, skipping any whitespace and comments
+# (from # to the end of the line) before it. The group that matched tells what the token is:
+# 1 - an integer, 2 - an identifier or keyword, 3 - an operator or punctuation,
+# 4 - any other (invalid) character. No group matches for trailing whitespace at the end of the text.
+NUMBER, NAME, SYMBOL, INVALID = range(1, 5)
+TOKEN_PATTERN = re.compile(
+    r'(?:\s+|#[^\n]*(?:\n|$))*'
+    r'(?:(\d+)'
+    r'|([^\W\d_][^\W_]*)'
+    r'|(&&|\|\||==|!=|>=|<=|[-+*/%(){},!<>])'
+    r'|(.)'
+    r'|$)',
+    re.DOTALL,
+)
+
 # The Lexer class is responsible for analyzing the lexical code - converting text into a list of tokens
 class Lexer:
     def __init__(self, text):
         self.text = text
-        self.pos = 0
-        self.line = 1  
-        self.column = 1    
-        self.current_char = self.text[self.pos] if self.text else None
-
-    # A function that moves the focus to the next character in the input and updates the current position
-    def advance(self):
-        if self.current_char == '\n':
-            self.line += 1
-            self.column = 0
-        self.pos += 1
-        self.column += 1
-        if self.pos < len(self.text):
-            self.current_char = self.text[self.pos]
-        else:
-            self.current_char = None
-
-    # Skipping white spaces in the code (like spaces and empty lines)
-    def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
 
-    # Skip comments in code - comments start with # and continue to the end of the line
-    def skip_comment(self):
-                while self.current_char is not None and self.current_char != '\n':
-                    self.advance()
-                self.advance()
+    # Line and column (both starting at 1) of an offset in the text. Only error messages need
+    # them, so they are computed on demand instead of being tracked for every character
+    def position(self, offset):
+        line = self.text.count('\n', 0, offset) + 1
+        column = offset - self.text.rfind('\n', 0, offset)
+        return line, column
 
-     # A function that performs the lexical analysis process and returns a list of tokens
+    # A function that performs the lexical analysis process and returns a list of tokens
     def lex(self):
         tokens = []
-        while self.current_char is not None:
-            if self.current_char.isspace():
-                self.skip_whitespace()
-            elif self.current_char == '#':
-                self.skip_comment()
-            elif self.current_char.isdigit():
-                tokens.append(Token(INTEGER, self.integer()))
-            elif self.current_char == '+':
-                tokens.append(Token(PLUS, '+'))
-                self.advance()
-            elif self.current_char == '-':
-                tokens.append(Token(MINUS, '-'))
-                self.advance()
-            elif self.current_char == '*':
-                tokens.append(Token(MUL, '*'))
-                self.advance()
-            elif self.current_char == '/':
-                tokens.append(Token(DIV, '/'))
-                self.advance()
-            elif self.current_char == '%':
-                tokens.append(Token(MOD, '%'))
-                self.advance()
-            elif self.current_char == '(':
-                tokens.append(Token(LPAREN, '('))
-                self.advance()
-            elif self.current_char == ')':
-                tokens.append(Token(RPAREN, ')'))
-                self.advance()
-            elif self.current_char == '{':
-                tokens.append(Token('LBRACE', '{'))
-                self.advance()
-            elif self.current_char == '}':
-                tokens.append(Token('RBRACE', '}'))
-                self.advance()
-            elif self.current_char == ',':
-                tokens.append(Token(COMMA, ','))
-                self.advance()
-            elif self.current_char == '&' and self.peek() == '&':
-                self.advance()
-                self.advance()
-                tokens.append(Token(AND, '&&'))
-            elif self.current_char == '|' and self.peek() == '|':
-                self.advance()
-                self.advance()
-                tokens.append(Token(OR, '||'))
-            elif self.current_char == '=' and self.peek() == '=':
-                self.advance()
-                self.advance()
-                tokens.append(Token(EQ, '=='))
-            elif self.current_char == '!':
-                if self.peek() == '=':
-                    self.advance()
-                    self.advance()
-                    tokens.append(Token(NEQ, '!='))
+        append = tokens.append
+        symbols, keywords = SYMBOLS, KEYWORDS
+        for match in TOKEN_PATTERN.finditer(self.text):
+            kind = match.lastindex
+            if kind == SYMBOL:
+                text = match.group(SYMBOL)
+                append(Token(symbols[text], text, match.start(SYMBOL)))
+            elif kind == NAME:
+                text = match.group(NAME)
+                if text in keywords:
+                    type_, value = keywords[text]
+                    append(Token(type_, value, match.start(NAME)))
+                elif text.lower() == 'not':  # Ensure 'not' keyword is recognized in any case
+                    append(Token(NOT, text, match.start(NAME)))
                 else:
-                    tokens.append(Token(NOT, '!'))
-                    self.advance()
-            elif self.current_char == '>':
-                self.advance()
-                if self.current_char == '=':
-                    tokens.append(Token(GEQ, '>='))
-                    self.advance()
-                else:
-                    tokens.append(Token(GT, '>'))
-            elif self.current_char == '<':
-                self.advance()
-                if self.current_char == '=':
-                    tokens.append(Token(LEQ, '<='))
-                    self.advance()
-                else:
-                    tokens.append(Token(LT, '<'))
-            elif self.current_char.isalpha():
-                tokens.append(self.id())
-            else:
-                raise ValueError(f"Unknown token: {repr(self.current_char)} at line {self.line}, column {self.column}")
-        tokens.append(Token(EOF))
+                    append(Token(ID, text, match.start(NAME)))
+            elif kind == NUMBER:
+                append(Token(INTEGER, int(match.group(NUMBER)), match.start(NUMBER)))
+            elif kind == INVALID:
+                line, column = self.position(match.start(INVALID))
+                raise ValueError(f"Unknown token: {repr(match.group(INVALID))} at line {line}, column {column}")
+        append(Token(EOF, None, len(self.text)))
         return tokens
 
-    # Function for reading an integer - returns an integer from the input
-    def integer(self):
-        result = ''
-        while self.current_char is not None and self.current_char.isdigit():
-            result += self.current_char
-            self.advance()
-        return int(result)
+# The StreamLexer tokenizes text that arrives in chunks (for example a large file read piece by piece).
+# tokens() is a generator, and only the unconsumed tail of the input is kept in memory
+class StreamLexer:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ''         # Input not consumed yet
+        self.base = 0            # Offset in the whole input of buffer[0]
+        self.line = 1            # Line number at buffer[0]
+        self.line_start = 0      # Offset in the whole input where that line starts
+
+    # Read the next chunk, dropping the consumed part of the buffer. Returns False at the end of input
+    def refill(self, pos):
+        chunk = next(self.chunks, '')
+        if not chunk:
+            return False
+        consumed = self.buffer[:pos]
+        newline = consumed.rfind('\n')
+        if newline >= 0:
+            self.line += consumed.count('\n')
+            self.line_start = self.base + newline + 1
+        self.buffer = self.buffer[pos:] + chunk
+        self.base += pos
+        return True
 
-    # A function that looks at the next character in the input without moving the current position
-    def peek(self):
-        peek_pos = self.pos + 1
-        if peek_pos < len(self.text):
-            return self.text[peek_pos]
-        return None
+    # Line and column (both starting at 1) of an offset inside the current buffer
+    def position(self, offset):
+        index = offset - self.base
+        newline = self.buffer.rfind('\n', 0, index)
+        line = self.line + self.buffer.count('\n', 0, index)
+        column = index - newline if newline >= 0 else offset - self.line_start + 1
+        return line, column
 
-    # A function to identify an ID or keyword - returns a suitable token
-    def id(self):
-        result = ''
-        while self.current_char is not None and self.current_char.isalnum():
-            result += self.current_char
-            self.advance()
-        if result == 'True':
-            return Token(BOOLEAN, True)
-        elif result == 'False':
-            return Token(BOOLEAN, False)
-        elif result == 'if':
-            return Token(IF, result)
-        elif result == 'defun':
-            return Token(DEFUN, result)
-        elif result == 'lambd':
-            return Token(LAMBDA, result)
-        elif result == 'else':
-            return Token(ELSE, result)
-        elif result.lower() == 'not':  # Ensure 'not' keyword is recognized
-            return Token(NOT, result)
-        else:
-            return Token(ID, result)
\ No newline at end of file
+    # Generate the tokens of the input, ending with EOF
+    def tokens(self):
+        pos = 0
+        more = True
+        symbols, keywords = SYMBOLS, KEYWORDS
+        while True:
+            match = TOKEN_PATTERN.match(self.buffer, pos)
+            # A match that reaches the end of the buffer may be cut short (like 'fact' of 'factorial')
+            if more and match.end() == len(self.buffer):
+                if self.refill(pos):
+                    pos = 0
+                else:
+                    more = False
+                continue
+            kind = match.lastindex
+            if kind is None:
+                break
+            offset = self.base + match.start(kind)
+            if kind == SYMBOL:
+                text = match.group(SYMBOL)
+                yield Token(symbols[text], text, offset)
+            elif kind == NAME:
+                text = match.group(NAME)
+                if text in keywords:
+                    type_, value = keywords[text]
+                    yield Token(type_, value, offset)
+                elif text.lower() == 'not':
+                    yield Token(NOT, text, offset)
+                else:
+                    yield Token(ID, text, offset)
+            elif kind == NUMBER:
+                yield Token(INTEGER, int(match.group(NUMBER)), offset)
+            else:
+                line, column = self.position(offset)
+                raise ValueError(f"Unknown token: {repr(match.group(INVALID))} at line {line}, column {column}")
+            pos = match.end()
+        yield Token(EOF, None, self.base + len(self.buffer))
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+
+from parser import Function
+from purity import pure_functions
+
+
+# A bounded memo table for one function, evicting the least recently used result when full
+class MemoTable:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.results = OrderedDict()  # Argument key -> result, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    # Return (True, result) for a remembered key, or (False, None)
+    def get(self, key):
+        if key in self.results:
+            self.results.move_to_end(key)
+            self.hits += 1
+            return True, self.results[key]
+        self.misses += 1
+        return False, None
+
+    # Remember a result, evicting the least recently used one if the table is full
+    def put(self, key, result):
+        self.results[key] = result
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+
+# The Memoizer keeps a MemoTable for every pure function of an interpreter's global scope.
+# Purity is worked out lazily and forgotten (along with every remembered result) whenever a
+# function is defined, since a redefinition can change what other functions compute.
+class Memoizer:
+    def __init__(self, global_scope, maxsize=1024):
+        self.global_scope = global_scope
+        self.maxsize = maxsize  # Maximum number of results remembered per function
+        self.tables = {}        # Function name -> MemoTable
+        self.pure = None        # Names of the pure functions, or None until needed again
+
+    # Forget purity and remembered results; hit and miss counters are kept
+    def invalidate(self):
+        self.pure = None
+        for table in self.tables.values():
+            table.results.clear()
+
+    # The memo table of a function, or None if calls to it must not be memoized
+    def table(self, func):
+        if self.pure is None:
+            self.pure = pure_functions(self.global_scope)
+        if func.name not in self.pure or self.global_scope.get(func.name) is not func:
+            return None
+        if func.name not in self.tables:
+            self.tables[func.name] = MemoTable(self.maxsize)
+        return self.tables[func.name]
+
+    # The memo key of a call's arguments, or None if the call must not be memoized. A function passed as
+    # an argument is called by the callee, so the call only depends on its arguments when that function is
+    # a pure defun (still the current definition of its name); lambdas and built-ins could have side effects
+    def key(self, args):
+        for arg in args:
+            if isinstance(arg, Function):
+                if self.pure is None:
+                    self.pure = pure_functions(self.global_scope)
+                if arg.name not in self.pure or self.global_scope.get(arg.name) is not arg:
+                    return None
+            elif callable(arg):
+                return None
+        return memo_key(args)
+
+    # Hit/miss counters and current size of every memo table
+    def stats(self):
+        return {name: {'hits': table.hits, 'misses': table.misses, 'size': len(table.results)}
+                for name, table in self.tables.items()}
+
+
+# The memo key of an argument list. True == 1 in Python, so every value is paired with its type;
+# None when an argument cannot be used as a key
+def memo_key(args):
+    key = tuple((type(arg), arg) for arg in args)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
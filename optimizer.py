@@ -0,0 +1,200 @@
+# Token Types
+INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
+    AND, OR, NOT, EQ, NEQ, GT, LT, GEQ, LEQ, \
+    ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
+    'INTEGER', 'BOOLEAN', 'PLUS', 'MINUS', 'MUL', 'DIV', 'MOD', 'LPAREN', 'RPAREN',
+    'AND', 'OR', 'NOT', 'EQ', 'NEQ', 'GT', 'LT', 'GEQ', 'LEQ',
+    'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
+)
+
+from compiler import BINARY_OPERATORS, UNARY_OPERATORS
+from lexer import Token
+from parser import BinOp, UnaryOp, Num, Bool, Function, Lambda, Call, If
+from resolver import children
+
+# Operators whose result is always an integer (or an error), whatever their operands
+ARITHMETIC = (PLUS, MINUS, MUL, DIV, MOD)
+
+
+# The Optimizer rewrites the AST between parsing and execution:
+# - constant BinOp/UnaryOp nodes are folded into a single Num or Bool,
+# - If nodes with a constant condition are replaced by the branch that would run,
+# - && and || with a constant left operand are reduced to the operand that decides them,
+# - identities such as e * 1, e + 0, e - 0 and e / 1 are reduced to e when e is an integer literal or an
+#   arithmetic expression. A variable or a call could hold a boolean (True * 1 is 1), so x * 1 is kept.
+# An operation that raises (like 5 / 0) is never folded, so the error still happens at run time.
+# Input nodes are never modified; rewritten parents are new nodes.
+# A subtree shared by several parents (see parser.NodeTable) is optimized once per call to optimize().
+# With an `inliner` (see inliner.Inliner), calls of small functions are inlined between two folding
+# passes, so constants passed to a function are folded into the code that replaces the call.
+class Optimizer:
+    def __init__(self, inliner=None):
+        self.inliner = inliner
+        self.removed = 0  # Number of AST nodes removed by the last call to optimize(), negative if it grew
+        self.done = {}    # id of each node optimized so far -> (node, optimized node)
+
+    # Optimize a list of statements (or a single node) and record how many nodes were removed
+    def optimize(self, tree):
+        before = count_nodes(tree)
+        optimized = self.fold(tree)
+        if self.inliner is not None:
+            if isinstance(optimized, list):
+                optimized = self.fold(self.inliner.inline(optimized))
+            else:
+                inlined = self.inliner.inline([optimized])
+                optimized = self.fold(inlined[0] if len(inlined) == 1 else inlined)
+        self.removed = before - count_nodes(optimized)
+        return optimized
+
+    # Fold a list of statements (or a single node) once
+    def fold(self, tree):
+        try:
+            if isinstance(tree, list):
+                return [self.visit(statement) for statement in tree]
+            return self.visit(tree)
+        finally:
+            self.done = {}
+
+    # Main visit method that dispatches to the appropriate visit method
+    def visit(self, node):
+        done = self.done.get(id(node))
+        if done is not None and done[0] is node:
+            return done[1]
+        method_name = f'visit_{type(node).__name__.lower()}'
+        method = getattr(self, method_name, self.generic_visit)
+        optimized = method(node)
+        self.done[id(node)] = (node, optimized)
+        return optimized
+
+    # Nodes without sub-expressions (numbers, booleans, variables) are left as they are
+    def generic_visit(self, node):
+        return node
+
+    # Fold a binary operation whose operands are constants, or simplify it
+    def visit_binop(self, node):
+        left = self.visit(node.left)
+        op_type = node.op.type
+
+        # A constant left operand decides && and || on its own, or leaves just the right operand
+        if op_type in (AND, OR) and is_constant(left):
+            if bool(left.value) == (op_type == OR):
+                return left
+            return self.visit(node.right)
+
+        right = self.visit(node.right)
+        if is_constant(left) and is_constant(right):
+            try:
+                return constant(BINARY_OPERATORS[op_type](left.value, right.value), node.offset)
+            except Exception:
+                pass  # Keep the operation so the error is raised when the program runs
+
+        # Algebraic identities, only where they cannot change the type of the result
+        if op_type in (PLUS, MINUS) and is_value(right, 0) and is_integer(left):
+            return left
+        if op_type == PLUS and is_value(left, 0) and is_integer(right):
+            return right
+        if op_type in (MUL, DIV) and is_value(right, 1) and is_integer(left):
+            return left
+        if op_type == MUL and is_value(left, 1) and is_integer(right):
+            return right
+
+        if left is node.left and right is node.right:
+            return node
+        return BinOp(left, node.op, right, node.offset)
+
+    # Fold a unary operation on a constant
+    def visit_unaryop(self, node):
+        expr = self.visit(node.expr)
+        if is_constant(expr):
+            return constant(UNARY_OPERATORS[node.op.type](expr.value), node.offset)
+        if expr is node.expr:
+            return node
+        return UnaryOp(node.op, expr, node.offset)
+
+    # Replace an If with a constant condition by the branch that would be taken
+    def visit_if(self, node):
+        condition = self.visit(node.condition)
+        then_branch = self.visit(node.then_branch)
+        else_branch = None if node.else_branch is None else self.visit(node.else_branch)
+        if is_constant(condition):
+            if condition.value:
+                return then_branch
+            if else_branch is not None:
+                return else_branch
+        if condition is node.condition and then_branch is node.then_branch and else_branch is node.else_branch:
+            return node
+        return If(condition, then_branch, else_branch, node.offset)
+
+    # Optimize a function body
+    def visit_function(self, node):
+        body = self.visit_body(node.body)
+        if body is node.body:
+            return node
+        return Function(node.name, node.params, body, node.offset)
+
+    # Optimize a lambda body
+    def visit_lambda(self, node):
+        body = self.visit_body(node.body)
+        if body is node.body:
+            return node
+        return Lambda(node.params, body, node.offset)
+
+    # Optimize the function and the arguments of a call
+    def visit_call(self, node):
+        func = self.visit(node.func)
+        args = [self.visit(arg) for arg in node.args]
+        if func is node.func and all(new is old for new, old in zip(args, node.args)):
+            return node
+        return Call(func, args, node.offset)
+
+    # Optimize a body that is either a single expression or a list of statements
+    def visit_body(self, body):
+        if not isinstance(body, list):
+            return self.visit(body)
+        optimized = [self.visit(statement) for statement in body]
+        if all(new is old for new, old in zip(optimized, body)):
+            return body
+        return optimized
+
+
+# Whether a node is a literal number or boolean
+def is_constant(node):
+    return isinstance(node, (Num, Bool))
+
+
+# Whether a node is the literal integer `value` (True and False do not count)
+def is_value(node, value):
+    return isinstance(node, Num) and type(node.value) is int and node.value == value
+
+
+# Whether a node is known to evaluate to an integer (if it evaluates at all)
+def is_integer(node):
+    if isinstance(node, Num):
+        return type(node.value) is int
+    if isinstance(node, BinOp):
+        return node.op.type in ARITHMETIC
+    if isinstance(node, UnaryOp):
+        return node.op.type == MINUS
+    return False
+
+
+# Build the literal node for a folded value, at the offset of the expression it replaces
+def constant(value, offset=None):
+    if isinstance(value, bool):
+        return Bool(Token(BOOLEAN, value, offset))
+    return Num(Token(INTEGER, value, offset))
+
+
+# Count the nodes of a tree (a list of statements counts only its elements)
+def count_nodes(tree):
+    if tree is None:
+        return 0
+    total = 0 if isinstance(tree, list) else 1
+    return total + sum(count_nodes(child) for child in children(tree))
+
+
+# Optimize a parsed program, returning the optimized statements and the number of nodes removed
+def optimize(tree):
+    optimizer = Optimizer()
+    optimized = optimizer.optimize(tree)
+    return optimized, optimizer.removed
@@ -0,0 +1,176 @@
+# Token Types
+INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
+    AND, OR, NOT, EQ, NEQ, GT, LT, GEQ, LEQ, \
+    ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
+    'INTEGER', 'BOOLEAN', 'PLUS', 'MINUS', 'MUL', 'DIV', 'MOD', 'LPAREN', 'RPAREN',
+    'AND', 'OR', 'NOT', 'EQ', 'NEQ', 'GT', 'LT', 'GEQ', 'LEQ',
+    'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
+)
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+from parser import BinOp, Var, Function
+from purity import pure_functions
+from streams import Stream
+from pvector import PVector
+
+# Below this many elements, pmap and preduce run in the calling process: shipping the work to other
+# processes costs more than it saves
+PARALLEL_THRESHOLD = 256
+
+# Number of pieces the elements are split into per worker, so that uneven calls still balance out
+CHUNKS_PER_WORKER = 4
+
+# Worker pools shared by every Parallel in the process, by number of workers
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+# Operators that are associative on integers and booleans (&& and || return the operand that decides them)
+ASSOCIATIVE = (PLUS, MUL, AND, OR)
+
+
+# Parallel provides the pmap and preduce built-ins of an interpreter. A call to a pure defun function
+# (see purity.py) over enough integer and boolean arguments is split into chunks that a pool of worker
+# processes evaluates: the function's AST and those of the pure functions it may call are pickled and
+# sent along with each chunk, and the results are merged back in order. preduce folds from left to right;
+# it only reduces chunks in parallel when the function is recognizably associative (see associative()),
+# since only then does combining the chunks' results give the same value. Everything else - lambdas,
+# impure or non-associative functions, other arguments, or too few elements - runs serially through the
+# interpreter, so the result never depends on whether the pool was used.
+# The worker processes are shared by all interpreters of the process (see shared_pool), so a server
+# with many sessions does not start a pool per session; shutdown() stops them.
+class Parallel:
+    def __init__(self, interpreter, workers=None, threshold=PARALLEL_THRESHOLD):
+        self.interpreter = interpreter  # Interpreter the built-ins belong to (tree or stackless)
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.pool = None  # The shared pool, taken on first parallel use
+
+    # The built-in functions to add to the interpreter's global scope
+    def builtins(self):
+        return {'pmap': self.pmap, 'preduce': self.preduce}
+
+    # pmap(f, x1, x2, ...) calls f on each element and returns the results as a list, in order.
+    # A single list or stream argument (such as the result of another pmap) is mapped element by element
+    def pmap(self, func, *items):
+        items = elements(items)
+        functions = self.shippable(func, items)
+        if functions is None:
+            return PVector(self.interpreter.apply(func, [item]) for item in items)
+        chunks = self.split(items)
+        results = self.executor().map(map_chunk, [functions] * len(chunks), [func.name] * len(chunks), chunks)
+        return PVector(result for chunk in results for result in chunk)
+
+    # preduce(f, x1, x2, ...) combines the elements with f from left to right, like f(f(x1, x2), x3).
+    # In parallel, each chunk is reduced on its own and the partial results are combined afterwards,
+    # which is only done for functions known to be associative
+    def preduce(self, func, *items):
+        items = elements(items)
+        if not items:
+            raise TypeError("preduce of an empty sequence")
+        functions = self.shippable(func, items) if associative(func) else None
+        if functions is None:
+            return reduce(lambda left, right: self.interpreter.apply(func, [left, right]), items)
+        chunks = self.split(items)
+        partials = list(self.executor().map(reduce_chunk, [functions] * len(chunks),
+                                            [func.name] * len(chunks), chunks))
+        return reduce(lambda left, right: self.interpreter.apply(func, [left, right]), partials)
+
+    # The pure functions to send to the workers, or None if the call has to run serially
+    def shippable(self, func, items):
+        if self.workers < 2 or len(items) < max(self.threshold, 2) or not isinstance(func, Function):
+            return None
+        if any(type(item) not in (int, bool) for item in items):
+            return None
+        global_scope = self.interpreter.global_scope
+        if global_scope.get(func.name) is not func:
+            return None  # A function that has since been redefined is no longer known by its name
+        pure = pure_functions(global_scope)
+        if func.name not in pure:
+            return None
+        return {name: global_scope[name] for name in pure}
+
+    # Split the elements into consecutive chunks for the workers
+    def split(self, items):
+        size = max(1, -(-len(items) // (self.workers * CHUNKS_PER_WORKER)))
+        return [items[start:start + size] for start in range(0, len(items), size)]
+
+    # The worker pool, started on first use and kept for later calls
+    def executor(self):
+        if self.pool is None:
+            self.pool = shared_pool(self.workers)
+        return self.pool
+
+    # Stop using the worker processes; they keep serving the other interpreters until shutdown()
+    def close(self):
+        self.pool = None
+
+
+# The process-wide pool with the given number of workers, started on first use. Workers are started
+# by a fork server (or spawned where there is none) rather than forked from the caller, so they do not
+# inherit its threads, sockets or other open files
+def shared_pool(workers):
+    with POOLS_LOCK:
+        if workers not in POOLS:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            POOLS[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return POOLS[workers]
+
+
+# Stop all worker processes of the process; later parallel calls start new ones
+def shutdown():
+    with POOLS_LOCK:
+        pools = list(POOLS.values())
+        POOLS.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+# Whether a function is known to be associative, so preduce may group its calls in any way: its body
+# is a single a + b, a * b, a && b or a || b of its two parameters (in either order)
+def associative(func):
+    if not isinstance(func, Function) or len(func.params) != 2 or len(set(func.params)) != 2:
+        return False
+    body = func.body
+    if isinstance(body, list):
+        if len(body) != 1:
+            return False
+        body = body[0]
+    if not isinstance(body, BinOp) or body.op.type not in ASSOCIATIVE:
+        return False
+    operands = (body.left, body.right)
+    return all(isinstance(operand, Var) for operand in operands) and \
+        {operand.name for operand in operands} == set(func.params)
+
+
+# The elements pmap and preduce work on: their arguments, or the items of a single list or stream argument
+def elements(items):
+    if len(items) == 1 and isinstance(items[0], (tuple, PVector, Stream)):
+        return tuple(items[0])
+    return items
+
+
+# An interpreter in a worker process that knows the shipped functions
+def worker_interpreter(functions):
+    from interpreter import Interpreter  # Imported here: the interpreter module imports this one
+    interpreter = Interpreter()
+    interpreter.global_scope.update(functions)
+    return interpreter
+
+
+# Worker side of pmap: call a function on every element of a chunk
+def map_chunk(functions, name, chunk):
+    interpreter = worker_interpreter(functions)
+    func = functions[name]
+    return [interpreter.apply(func, [item]) for item in chunk]
+
+
+# Worker side of preduce: combine the elements of a chunk
+def reduce_chunk(functions, name, chunk):
+    interpreter = worker_interpreter(functions)
+    func = functions[name]
+    return reduce(lambda left, right: interpreter.apply(func, [left, right]), chunk)
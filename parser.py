@@ -7,98 +7,201 @@ ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
     'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
 )
 
+import weakref
+
 from lexer import Token
-# All classes here represent different types of nodes in the Abstract Syntax Tree (AST)
+# All classes here represent different types of nodes in the Abstract Syntax Tree (AST).
+# Nodes declare __slots__ instead of carrying a __dict__, since large programs have millions of them
 
 # Base class for all AST nodes
+# Every node has an `offset`: where it starts in the source text (None for nodes built by later passes)
 class AST:
-    pass
+    __slots__ = ('__weakref__', 'offset')  # __weakref__ lets a NodeTable refer to nodes without keeping them alive
+
+# One shared Token per operator type. BinOp and UnaryOp nodes refer to these instead of keeping
+# the token produced by the lexer alive just to read its type
+OPERATORS = {}
+
+# Return the shared operator Token with the same type as `token`
+def operator(token):
+    if token.type not in OPERATORS:
+        OPERATORS[token.type] = Token(token.type, token.value)
+    return OPERATORS[token.type]
 
 # Node representing a binary operation (e.g., addition, subtraction)
 class BinOp(AST):
-    def __init__(self, left, op, right):
+    __slots__ = ('left', 'op', 'right')
+
+    def __init__(self, left, op, right, offset=None):
         self.left = left  # Left operand
         self.op = op      # Operator
         self.right = right  # Right operand
+        self.offset = offset
 
 # Node representing a unary operation (e.g., negation, NOT)
 class UnaryOp(AST):
-    def __init__(self, op, expr):
+    __slots__ = ('op', 'expr')
+
+    def __init__(self, op, expr, offset=None):
         self.op = op      # Operator (e.g., '-')
         self.expr = expr  # Expression to apply the operator to
+        self.offset = offset
 
 # Node representing an integer value
 class Num(AST):
+    __slots__ = ('value',)
+
     def __init__(self, token):
         self.value = token.value  # The integer value
+        self.offset = token.offset
 
 # Node representing a boolean value
 class Bool(AST):
+    __slots__ = ('value',)
+
     def __init__(self, token):
         self.value = token.value  # The boolean value (True/False)
+        self.offset = token.offset
 
 # Node representing a variable
 class Var(AST):
+    __slots__ = ('name', 'depth', 'slot')
+
     def __init__(self, token):
         self.name = token.value  # The name of the variable
+        self.depth = None        # Frames to walk outwards to reach a parameter (None for globals), set by the Resolver
+        self.slot = None         # Index of the parameter within that frame
+        self.offset = token.offset
 
 # Node representing a function definition
 class Function(AST):
-    def __init__(self, name, params, body):
+    __slots__ = ('name', 'params', 'body')
+
+    def __init__(self, name, params, body, offset=None):
         self.name = name      # Function name
         self.params = params  # Parameters of the function
         self.body = body      # The body of the function (a list of statements)
+        self.offset = offset
 
 # Node representing a lambda function
 class Lambda(AST):
-    def __init__(self, params, body):
+    __slots__ = ('params', 'body')
+
+    def __init__(self, params, body, offset=None):
         self.params = params  # Parameters of the lambda function
         self.body = body      # The body of the lambda function (an expression)
+        self.offset = offset
 
 # Node representing a function call
 class Call(AST):
-    def __init__(self, func, args):
+    __slots__ = ('func', 'args', 'cache')
+
+    def __init__(self, func, args, offset=None):
         self.func = func  # The function being called
         self.args = args  # Arguments passed to the function
+        self.offset = offset
+        self.cache = None  # Inline cache of the function this call site last called, filled in by the Interpreter
+
+    # The inline cache belongs to the running interpreter and is not pickled
+    def __getstate__(self):
+        return None, {'func': self.func, 'args': self.args, 'offset': self.offset, 'cache': None}
 
 # Node representing an if statement
 class If(AST):
-    def __init__(self, condition, then_branch, else_branch=None):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+
+    def __init__(self, condition, then_branch, else_branch=None, offset=None):
         self.condition = condition  # The condition to evaluate
         self.then_branch = then_branch  # The branch to execute if condition is true
         self.else_branch = else_branch  # The branch to execute if condition is false
+        self.offset = offset
+
+# A NodeTable shares structurally identical subtrees between the nodes built by one or more parsers.
+# Every time a parser builds a node it looks up a key made of the node type, its leaf values and
+# its (already shared) children; if a live node with that key exists, that node is used instead.
+# Only nodes that are never modified after parsing are shared, so Function nodes are left out.
+# A Var is keyed by its lexical address as well as its name, so a shared Var resolves to the same
+# (depth, slot) everywhere it appears. A shared node keeps the offset of its first occurrence.
+# The table holds nodes weakly: it never keeps a tree alive
+class NodeTable:
+    def __init__(self):
+        self.nodes = weakref.WeakValueDictionary()
+        self.shared = 0  # Number of nodes that were replaced by an existing one
+
+    # Return the live node stored under `key`, or store `node` there and return it
+    def intern(self, node, key):
+        existing = self.nodes.get(key)
+        if existing is not None:
+            self.shared += 1
+            return existing
+        self.nodes[key] = node
+        return node
+
+    def __len__(self):
+        return len(self.nodes)
 
 # The Parser class is responsible for transforming a list of tokens into an AST
 class Parser:
-    def __init__(self, tokens):
-        self.tokens = tokens
+    # `tokens` can be a list or any iterable, such as a token generator reading a large file:
+    # tokens are pulled one at a time and not kept once they have been consumed.
+    # With a NodeTable, identical subtrees are built once and shared (also across parsers using the same table)
+    def __init__(self, tokens, table=None):
+        self.tokens = iter(tokens)
         self.pos = 0
-        self.current_token = self.tokens[self.pos]
+        self.lookahead = None  # Token read ahead by peek(), if any
+        self.current_token = next(self.tokens, None) or Token(EOF)
+        self.table = table
+        self.scope = ()  # Parameter lists of the enclosing functions and lambdas, innermost first
+
+    # Return `node`, or the identical node already in the table
+    def share(self, node, key):
+        if self.table is None:
+            return node
+        return self.table.intern(node, key)
+
+    # Build a Var, with its lexical address filled in when nodes are shared
+    def var(self, token):
+        node = Var(token)
+        if self.table is None:
+            return node
+        for depth, params in enumerate(self.scope):
+            if node.name in params:
+                node.depth, node.slot = depth, params.index(node.name)
+                break
+        return self.table.intern(node, (Var, node.name, node.depth, node.slot))
+
+    # Parse a function or lambda body with its parameters in scope
+    def body(self, params, parse):
+        enclosing = self.scope
+        self.scope = (params,) + enclosing
+        try:
+            return parse()
+        finally:
+            self.scope = enclosing
 
     # Move to the next token in the list
     def advance(self):
         self.pos += 1
-        if self.pos < len(self.tokens):
-            self.current_token = self.tokens[self.pos]
+        if self.lookahead is not None:
+            self.current_token, self.lookahead = self.lookahead, None
         else:
-            self.current_token = Token(EOF)
+            self.current_token = next(self.tokens, None) or Token(EOF)
 
     # Peek at the next token without consuming it
     def peek(self):
-        peek_pos = self.pos + 1
-        if peek_pos < len(self.tokens):
-            return self.tokens[peek_pos]
-        return Token(EOF)
+        if self.lookahead is None:
+            self.lookahead = next(self.tokens, None) or Token(EOF)
+        return self.lookahead
 
     # Parse a factor (e.g., a number, a variable, or an expression in parentheses)
     def factor(self):
         token = self.current_token
         if token.type == INTEGER:
             self.advance()
-            return Num(token)
+            return self.share(Num(token), (Num, type(token.value), token.value))
         elif token.type == BOOLEAN:
             self.advance()
-            return Bool(token)
+            return self.share(Bool(token), (Bool, token.value))
         elif token.type == ID:
             return self.function_call_or_var()
         elif token.type == LPAREN:
@@ -111,20 +214,35 @@ class Parser:
                 raise ValueError("Expected ')'")
         elif token.type == MINUS:
             self.advance()
-            return UnaryOp(token, self.factor())
+            return self.unary(token)
         elif token.type == NOT:
             self.advance()
-            return UnaryOp(token, self.factor())
+            return self.unary(token)
+        elif token.type == IF:
+            return self.if_statement()  # An if expression nested in a larger expression or a body
         else:
             raise ValueError(f"Unexpected token: {token.type}")
 
+    # Build a unary operation on the factor that follows its operator
+    def unary(self, token):
+        expr = self.factor()
+        return self.share(UnaryOp(operator(token), expr, token.offset), (UnaryOp, token.type, expr))
+
+    # Build a binary operation, which starts where its left operand does
+    def binop(self, left, token, right):
+        return self.share(BinOp(left, operator(token), right, left.offset), (BinOp, left, token.type, right))
+
+    # Build a call starting at `offset`
+    def call(self, func, args, offset):
+        return self.share(Call(func, args, offset), (Call, func) + tuple(args))
+
     # Parse a term (handles multiplication, division, modulus)
     def term(self):
         node = self.factor()
         while self.current_token.type in (MUL, DIV, MOD):
             token = self.current_token
             self.advance()
-            node = BinOp(left=node, op=token, right=self.factor())
+            node = self.binop(node, token, self.factor())
         return node
 
     # Parse an expression (handles addition, subtraction, and logical operations)
@@ -133,11 +251,12 @@ class Parser:
         while self.current_token.type in (PLUS, MINUS, AND, OR, EQ, NEQ, GT, LT, GEQ, LEQ):
             token = self.current_token
             self.advance()
-            node = BinOp(left=node, op=token, right=self.term())
+            node = self.binop(node, token, self.term())
         return node
 
     # Parse an if statement
     def if_statement(self):
+        offset = self.current_token.offset
         self.advance()  # skip 'if'
         condition = self.expression()
         then_branch = self.expression()
@@ -145,10 +264,11 @@ class Parser:
         if self.current_token.type == ELSE:
             self.advance()
             else_branch = self.expression()
-        return If(condition, then_branch, else_branch)
+        return self.share(If(condition, then_branch, else_branch, offset), (If, condition, then_branch, else_branch))
 
     # Parse a function definition
     def function_definition(self):
+        offset = self.current_token.offset
         self.advance()  # skip 'defun'
         func_name = self.current_token.value
         self.advance()  # skip function name
@@ -162,16 +282,17 @@ class Parser:
         self.advance()  # skip ')'
         if self.current_token.type == 'LBRACE':
             self.advance()  # skip '{'
-            body = self.parse_block()
+            body = self.body(params, self.parse_block)
             if self.current_token.type != 'RBRACE':
                 raise ValueError("Expected '}'")
             self.advance()  # skip '}'
         else:
-            body = [self.expression()]  # Wrap single expression in a list
-        return Function(func_name, params, body)
+            body = [self.body(params, self.expression)]  # Wrap single expression in a list
+        return Function(func_name, params, body, offset)
 
     # Parse a lambda expression
     def lambda_expression(self):
+        offset = self.current_token.offset
         self.advance()  # skip 'lambd'
         self.advance()  # skip '('
         params = []
@@ -181,9 +302,9 @@ class Parser:
             if self.current_token.type == COMMA:
                 self.advance()
         self.advance()  # skip ')'
-        body = self.expression()
+        body = self.body(params, self.expression)
 
-        lambda_node = Lambda(params, body)
+        lambda_node = self.share(Lambda(params, body, offset), (Lambda, tuple(params), body))
 
         if self.current_token.type == LPAREN:
             self.advance()  # Skip '('
@@ -193,7 +314,7 @@ class Parser:
                 if self.current_token.type == COMMA:
                     self.advance()
             self.advance()  # Skip ')'
-            return Call(lambda_node, args)
+            return self.call(lambda_node, args, offset)
 
         return lambda_node
 
@@ -208,22 +329,24 @@ class Parser:
 
     # Main parse function to process all tokens and produce the AST
     def parse(self):
-        statements = []
+        return list(self.statements())
+
+    # Parse and yield the top-level statements one at a time, so each can run before the rest is read
+    def statements(self):
         while self.current_token.type != EOF:
             if self.current_token.type == IF:
-                statements.append(self.if_statement())
+                statement = self.if_statement()
             elif self.current_token.type == DEFUN:
-                func_def = self.function_definition()
-                statements.append(func_def)
+                statement = self.function_definition()
             elif self.current_token.type == LAMBDA:
-                statements.append(self.lambda_expression())
+                statement = self.lambda_expression()
             else:
-                statements.append(self.expression())
+                statement = self.expression()
 
             if self.current_token.type == COMMA:
                 self.advance()  # Skip comma between statements
 
-        return statements
+            yield statement
 
     # Handle either a function call or a variable reference
     def function_call_or_var(self):
@@ -240,6 +363,6 @@ class Parser:
             if self.current_token.type != RPAREN:
                 raise ValueError("Expected ')'")
             self.advance()  # consume ')'
-            return Call(Var(token), args)
+            return self.call(self.var(token), args, token.offset)
         else:
-            return Var(token)
+            return self.var(token)
@@ -0,0 +1,130 @@
+import time
+
+from interpreter import Interpreter
+from lexer import Lexer
+from parser import BinOp, UnaryOp, Num, Bool, Var, Function, Call
+
+
+# Time spent in one function over the whole run
+class FunctionStats:
+    __slots__ = ('calls', 'inclusive', 'exclusive')
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0  # Seconds from entering the function to leaving it (recursive calls counted once)
+        self.exclusive = 0.0  # The same, minus the time spent in the functions it called
+
+
+# The ProfilingInterpreter is the tree walker with bookkeeping added to visit() and to calls: it
+# counts how often every AST node is evaluated, and how often every defun function and lambda is
+# called and how long it takes. It is a separate class, so the plain Interpreter pays nothing for it.
+# Nodes shared through a NodeTable are counted together, at the position of their first occurrence.
+class ProfilingInterpreter(Interpreter):
+    def __init__(self, memoize=False, memo_size=1024, source=None, output=None):
+        super().__init__(memoize, memo_size, output)
+        self.lexer = Lexer(source) if source is not None else None  # To turn node offsets into line/column
+        self.hits = {}       # Node -> number of times it was evaluated
+        self.functions = {}  # Function name -> FunctionStats
+        self.stacks = {}     # Call stack ("f;g;h") -> seconds spent in its innermost function
+        self.calls = []      # Calls in progress: [name, stack, seconds spent in callees]
+        self.active = {}     # Function name -> number of its calls in progress
+
+    # Count every node as it is evaluated
+    def visit(self, node):
+        if not isinstance(node, list):
+            self.hits[node] = self.hits.get(node, 0) + 1
+        return super().visit(node)
+
+    # A call site whose inline cache hits calls the function without evaluating its callee; count the callee anyway
+    def visit_call(self, node):
+        cache = node.cache
+        if cache is not None and cache.valid and cache.scope is self.global_scope:
+            self.hits[node.func] = self.hits.get(node.func, 0) + 1
+        return super().visit_call(node)
+
+    # Time calls of defun functions
+    def call_function(self, func, args):
+        return self.timed(func.name, super().call_function, func, args)
+
+    # Time calls of lambdas, named after where they are defined
+    def visit_lambda(self, node):
+        func = super().visit_lambda(node)
+        name = f'<lambda {self.location(node)}>'
+
+        def profiled_lambda(*args):
+            return self.timed(name, func, *args)
+
+        return profiled_lambda
+
+    # Call `function` and record its time under `name`
+    def timed(self, name, function, *args):
+        stack = f'{self.calls[-1][1]};{name}' if self.calls else name
+        call = [name, stack, 0.0]
+        self.calls.append(call)
+        self.active[name] = self.active.get(name, 0) + 1
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls.pop()
+            self.active[name] -= 1
+            stats = self.functions.get(name)
+            if stats is None:
+                stats = self.functions[name] = FunctionStats()
+            stats.calls += 1
+            stats.exclusive += elapsed - call[2]
+            if not self.active[name]:
+                stats.inclusive += elapsed  # Only the outermost of nested recursive calls
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + elapsed - call[2]
+            if self.calls:
+                self.calls[-1][2] += elapsed
+
+    # "line:column" of a node, or its offset when the source is not known
+    def location(self, node):
+        if node.offset is None:
+            return '?'
+        if self.lexer is None:
+            return f'@{node.offset}'
+        line, column = self.lexer.position(node.offset)
+        return f'{line}:{column}'
+
+    # Text report: functions by exclusive time, then the `limit` most evaluated nodes
+    def report(self, limit=20):
+        lines = ["Functions by exclusive time:",
+                 f"{'function':<32} {'calls':>10} {'inclusive ms':>14} {'exclusive ms':>14}"]
+        for name, stats in sorted(self.functions.items(), key=lambda item: (-item[1].exclusive, item[0])):
+            lines.append(f"{name:<32} {stats.calls:>10} {stats.inclusive * 1000:>14.3f} {stats.exclusive * 1000:>14.3f}")
+        lines.append("")
+        lines.append("Most evaluated nodes:")
+        lines.append(f"{'hits':>10}  {'location':<10} node")
+        hottest = sorted(self.hits.items(), key=lambda item: (-item[1], item[0].offset is None, item[0].offset or 0))
+        for node, count in hottest[:limit]:
+            lines.append(f"{count:>10}  {self.location(node):<10} {describe(node)}")
+        return "\n".join(lines)
+
+    # The call stacks in collapsed format ("f;g;h microseconds" per line), as read by flame graph tools
+    def collapsed(self):
+        lines = []
+        for stack, seconds in sorted(self.stacks.items()):
+            microseconds = round(seconds * 1000000)
+            if microseconds > 0:
+                lines.append(f"{stack} {microseconds}")
+        return "\n".join(lines)
+
+
+# A short description of a node for the report
+def describe(node):
+    if isinstance(node, BinOp):
+        return f'BinOp {node.op.value}'
+    if isinstance(node, UnaryOp):
+        return f'UnaryOp {node.op.value}'
+    if isinstance(node, (Num, Bool)):
+        return f'{type(node).__name__} {node.value}'
+    if isinstance(node, Var):
+        return f'Var {node.name}'
+    if isinstance(node, Function):
+        return f'Function {node.name}'
+    if isinstance(node, Call):
+        return f'Call {node.func.name}' if isinstance(node.func, Var) else 'Call <lambda>'
+    return type(node).__name__
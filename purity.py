@@ -0,0 +1,32 @@
+from parser import Var, Function, Lambda
+from resolver import children
+
+
+# Names a function body refers to that are not bound by its own parameters (or those of lambdas inside it)
+def free_variables(node, bound=frozenset()):
+    if isinstance(node, Var):
+        return set() if node.name in bound else {node.name}
+    if isinstance(node, (Function, Lambda)):
+        bound = bound | set(node.params)
+    names = set()
+    for child in children(node):
+        names |= free_variables(child, bound)
+    return names
+
+
+# Find the defun functions of a global scope that are pure: their only free variables are their
+# parameters and other pure functions. The language has no side effects of its own, so this means
+# a call depends on nothing but its arguments - unlike a call that reads a name which is undefined
+# or bound to a Python callable. Returns the set of pure function names.
+def pure_functions(global_scope):
+    candidates = {name: free_variables(value) for name, value in global_scope.items()
+                  if isinstance(value, Function)}
+    pure = set(candidates)
+    changed = True
+    while changed:  # Drop functions that depend on an impure name until nothing changes
+        changed = False
+        for name in list(pure):
+            if not candidates[name] <= pure:
+                pure.discard(name)
+                changed = True
+    return pure
@@ -0,0 +1,196 @@
+import itertools
+from collections.abc import Sequence
+
+# Most elements kept together in one leaf of the tree
+CHUNK = 32
+
+
+# A PVector is an immutable list. Its elements sit in the leaves of a balanced (AVL) binary tree;
+# every leaf holds a tuple of up to CHUNK consecutive elements, and every inner node knows the size
+# and height of its subtree. Adding an element at either end or joining two lists only rebuilds
+# the nodes along one path of the tree, and shares everything else with the lists it was built
+# from, so cons, append and concat take O(log n) time and memory and never copy a whole list.
+# nth takes O(log n) time and len O(1). A PVector is a collections.abc.Sequence, so Python code can
+# index, slice, iterate over and compare it without converting it first.
+class PVector(Sequence):
+    __slots__ = ('root', 'hash')
+
+    def __init__(self, items=()):
+        items = tuple(items)
+        root = ()
+        for start in range(0, len(items), CHUNK):
+            root = join(root, items[start:start + CHUNK])
+        self.root = root  # A leaf tuple (the empty tuple for the empty list) or a Node
+        self.hash = None  # Computed on first use
+
+    # A PVector around an existing tree
+    @classmethod
+    def wrap(cls, root):
+        vector = cls.__new__(cls)
+        vector.root = root
+        vector.hash = None
+        return vector
+
+    def __len__(self):
+        return size(self.root)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PVector(itertools.islice(self, *index.indices(len(self))))
+        if not isinstance(index, int):
+            raise TypeError(f"list indices must be integers, not {index}")
+        length = size(self.root)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("list index out of range")
+        node = self.root
+        while type(node) is Node:
+            left = size(node.left)
+            if index < left:
+                node = node.left
+            else:
+                index -= left
+                node = node.right
+        return node[index]
+
+    # Walk the leaves from left to right
+    def __iter__(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if type(node) is Node:
+                stack.append(node.right)
+                stack.append(node.left)
+            else:
+                yield from node
+
+    def __eq__(self, other):
+        if not isinstance(other, PVector):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    # Lists can be memoized function arguments, so they are hashable
+    def __hash__(self):
+        if self.hash is None:
+            self.hash = hash(tuple(self))
+        return self.hash
+
+    def __repr__(self):
+        return f'[{", ".join(str(item) for item in self)}]'
+
+
+# An inner node of the tree
+class Node:
+    __slots__ = ('left', 'right', 'size', 'height')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.size = size(left) + size(right)
+        self.height = max(height(left), height(right)) + 1
+
+
+# Number of elements in a tree
+def size(tree):
+    return tree.size if type(tree) is Node else len(tree)
+
+
+# Height of a tree (0 for a leaf)
+def height(tree):
+    return tree.height if type(tree) is Node else 0
+
+
+# A node over two trees whose heights differ by at most 2, rotated so that they differ by at most 1
+def balance(left, right):
+    if height(right) > height(left) + 1:
+        if height(right.left) > height(right.right):
+            return Node(Node(left, right.left.left), Node(right.left.right, right.right))
+        return Node(Node(left, right.left), right.right)
+    if height(left) > height(right) + 1:
+        if height(left.right) > height(left.left):
+            return Node(Node(left.left, left.right.left), Node(left.right.right, right))
+        return Node(left.left, Node(left.right, right))
+    return Node(left, right)
+
+
+# The elements of `left` followed by those of `right`
+def join(left, right):
+    if not size(left):
+        return right
+    if not size(right):
+        return left
+    if type(left) is not Node and type(right) is not Node and len(left) + len(right) <= CHUNK:
+        return left + right
+    if height(left) > height(right) + 1:
+        return balance(left.left, join(left.right, right))
+    if height(right) > height(left) + 1:
+        return balance(join(left, right.left), right.right)
+    return Node(left, right)
+
+
+# `tree` with `item` added at the front
+def push_front(tree, item):
+    if type(tree) is Node:
+        return balance(push_front(tree.left, item), tree.right)
+    if len(tree) < CHUNK:
+        return (item,) + tree
+    return Node((item,), tree)
+
+
+# `tree` with `item` added at the end
+def push_back(tree, item):
+    if type(tree) is Node:
+        return balance(tree.left, push_back(tree.right, item))
+    if len(tree) < CHUNK:
+        return tree + (item,)
+    return Node(tree, (item,))
+
+
+# list(x1, x2, ...): a new list of the given elements
+def make_list(*items):
+    return PVector(items)
+
+
+# cons(x, l): l with x added at the front
+def cons(item, vector):
+    return PVector.wrap(push_front(as_vector(vector, 'cons').root, item))
+
+
+# append(l, x): l with x added at the end
+def append(vector, item):
+    return PVector.wrap(push_back(as_vector(vector, 'append').root, item))
+
+
+# concat(l1, l2): the elements of l1 followed by those of l2
+def concat(left, right):
+    return PVector.wrap(join(as_vector(left, 'concat').root, as_vector(right, 'concat').root))
+
+
+# nth(l, i): element i of l, counting from 0 (negative indexes count from the end)
+def nth(vector, index):
+    if type(index) is not int:
+        raise TypeError(f"nth expects an integer index, not {index}")
+    try:
+        return vector[index]
+    except TypeError:
+        raise TypeError(f"nth expects a list, not {vector}") from None
+
+
+# len(l): number of elements of a list or tuple
+def length(vector):
+    if not isinstance(vector, Sequence):
+        raise TypeError(f"len expects a list, not {vector}")
+    return len(vector)
+
+
+# Check that a list function was given a list
+def as_vector(vector, name):
+    if not isinstance(vector, PVector):
+        raise TypeError(f"{name} expects a list, not {vector}")
+    return vector
+
+
+# The built-in functions to add to an interpreter's global scope
+def builtins():
+    return {'list': make_list, 'cons': cons, 'append': append, 'concat': concat, 'nth': nth, 'len': length}
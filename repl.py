@@ -1,10 +1,16 @@
-from interpreter import Interpreter
+from backends import BACKENDS, MEMOIZING_BACKENDS, create_interpreter
 from lexer import Lexer
 from parser import Parser
+from optimizer import Optimizer
+from inliner import Inliner
+from snapshot import Snapshot
 
 
-def repl():
-    interpreter = Interpreter()
+def repl(backend='tree', optimize=False, memoize=False, memo_size=1024, prelude=None):
+    if prelude is not None:
+        interpreter = prelude.fork(backend, memoize, memo_size)  # Start with the prelude's functions defined
+    else:
+        interpreter = create_interpreter(backend, memoize, memo_size)
     while True:
         try:
             text = input('calc> ')
@@ -12,10 +18,33 @@ def repl():
             tokens = lexer.lex()
             parser = Parser(tokens)
             tree = parser.parse()
+            if optimize:
+                tree = Optimizer(Inliner(closed=False)).optimize(tree)
             result = interpreter.visit(tree)
             print(result)
         except Exception as e:
             print(e)
 
 if __name__ == '__main__':
-    repl()
+    import argparse
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--backend', choices=list(BACKENDS), default='tree',
+                            help="execution engine to evaluate input with")
+    arg_parser.add_argument('--optimize', action='store_true',
+                            help="fold constants, inline small functions and simplify each input before evaluating it")
+    arg_parser.add_argument('--memoize', action='store_true',
+                            help="remember the results of pure functions (tree and stackless backends)")
+    arg_parser.add_argument('--memo-size', type=int, default=1024,
+                            help="maximum number of results remembered per function")
+    arg_parser.add_argument('--prelude-snapshot', default=None, metavar='FILE',
+                            help="start with the functions of a prelude snapshot written by snapshot.py")
+    args = arg_parser.parse_args()
+    if args.memoize and args.backend not in MEMOIZING_BACKENDS:
+        arg_parser.error(f"--memoize is not supported by the {args.backend} backend")
+    prelude = None
+    if args.prelude_snapshot is not None:
+        try:
+            prelude = Snapshot.load(args.prelude_snapshot)
+        except (OSError, ValueError) as error:
+            arg_parser.error(str(error))
+    repl(args.backend, args.optimize, args.memoize, args.memo_size, prelude)
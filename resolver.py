@@ -0,0 +1,42 @@
+from parser import BinOp, UnaryOp, Var, Function, Lambda, Call, If
+
+
+# The Resolver is a pass over the AST that gives every parameter reference a lexical address.
+# A Var inside a function or lambda body that names one of the enclosing parameters gets
+# (depth, slot): how many frames to walk outwards and the parameter's index in that frame.
+# Every other Var keeps depth None and is looked up in the global scope at run time.
+class Resolver:
+    # Resolve a node. `scope` is the chain of parameter lists enclosing it, innermost first
+    def resolve(self, node, scope=()):
+        if isinstance(node, list):
+            for statement in node:
+                self.resolve(statement, scope)
+            return
+        if isinstance(node, Var):
+            node.depth = node.slot = None
+            for depth, params in enumerate(scope):
+                if node.name in params:
+                    node.depth, node.slot = depth, params.index(node.name)
+                    break
+        elif isinstance(node, (Function, Lambda)):
+            self.resolve(node.body, (node.params,) + scope)
+        else:
+            for child in children(node):
+                self.resolve(child, scope)
+
+
+# The direct sub-expressions of a node, in evaluation order
+def children(node):
+    if isinstance(node, list):
+        return node
+    if isinstance(node, BinOp):
+        return [node.left, node.right]
+    if isinstance(node, UnaryOp):
+        return [node.expr]
+    if isinstance(node, Call):
+        return [node.func] + node.args
+    if isinstance(node, If):
+        return [node.condition, node.then_branch] + ([] if node.else_branch is None else [node.else_branch])
+    if isinstance(node, (Function, Lambda)):
+        return node.body if isinstance(node.body, list) else [node.body]
+    return []
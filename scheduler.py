@@ -0,0 +1,224 @@
+import sys
+from collections import deque
+
+from lexer import Lexer
+from parser import Parser
+from stackless import StacklessInterpreter, Evaluation
+from sinks import NullSink, BufferedSink, CallbackSink
+
+# Steps (function calls) a program runs before the scheduler moves on to the next one
+TIME_SLICE = 1000
+
+
+# Raised in a program that used up its step budget or grew past its memory budget
+class BudgetExceeded(Exception):
+    pass
+
+
+# The interpreter of a Task. Built-ins such as map, filter, reduce and pmap call back into the program
+# from Python, in nested evaluations that run inside the built-in's call and cannot be paused. Their steps
+# (one per function call, as in the task's own evaluation) are charged to the task as they run, and the
+# task's budgets are enforced on them: a nested evaluation stops with BudgetExceeded once the task's step
+# budget is used up, or when it holds more continuations than allowed. Once they have used up the task's
+# time slice, the task gives way (see Task.give_way) before the built-in goes on, so a built-in cannot
+# starve the other tasks either. pmap and preduce always run in this process, where their steps can be counted.
+class TaskInterpreter(StacklessInterpreter):
+    def __init__(self, task, memoize=False, memo_size=1024):
+        super().__init__(memoize, memo_size)
+        self.task = task
+        self.nested_steps = 0  # Steps of nested evaluations not yet added to task.steps
+        self.slice_steps = 0   # Steps of nested evaluations in the task's current time slice
+        self.parallel.workers = 1
+
+    # Charge steps of nested evaluations to the task
+    def charge(self, steps):
+        self.nested_steps += steps
+        self.slice_steps += steps
+
+    # Let the other tasks run once nested evaluations have used up the task's time slice
+    def give_way(self):
+        if self.slice_steps >= self.task.time_slice:
+            self.slice_steps = 0
+            self.task.give_way()
+
+    # Evaluate an expression for a built-in, pausing at the end of every time slice to check the budgets
+    # and let the other tasks run
+    def evaluate(self, node):
+        evaluation = Evaluation(node, self.frame)
+        while True:
+            steps = max(self.task.time_slice - self.slice_steps, 1)
+            if self.task.max_steps is not None:
+                steps = min(steps, self.task.max_steps - self.task.steps - self.nested_steps)
+                if steps <= 0:
+                    raise BudgetExceeded(f"Step budget of {self.task.max_steps} exceeded")
+            before = evaluation.steps
+            try:
+                finished = self.run(evaluation, steps)
+            finally:
+                self.charge(evaluation.steps - before)
+            if self.task.max_stack is not None and len(evaluation.stack) > self.task.max_stack:
+                raise BudgetExceeded(f"Memory budget of {self.task.max_stack} continuations exceeded")
+            if finished:
+                return evaluation.value
+            self.give_way()
+
+    # A defun called by a built-in (through map, filter or reduce) takes a step of its own
+    def call_body(self, body, frame):
+        if self.task.max_steps is not None and self.task.steps + self.nested_steps >= self.task.max_steps:
+            raise BudgetExceeded(f"Step budget of {self.task.max_steps} exceeded")
+        self.charge(1)
+        self.give_way()
+        return super().call_body(body, frame)
+
+
+# A Task is one program run by a Scheduler, with its own interpreter (so programs cannot see each
+# other's functions) and its own budgets: `max_steps` is the total number of steps (function calls) it
+# may run, and `max_stack` the number of continuations its evaluation may hold. Every non-tail call keeps at least
+# one continuation alive until it returns, so this bounds how deep it can recurse and the memory its
+# frames take. The memory budget is checked at the end of every time slice.
+# The value of every statement that has one is written to the task's `output` sink as soon as it is known.
+# `scheduler` is the Scheduler running the task, if any, and `time_slice` the steps it runs per turn.
+class Task:
+    def __init__(self, name, statements, max_steps=None, max_stack=None, memoize=False, memo_size=1024,
+                 output=None, scheduler=None, time_slice=TIME_SLICE):
+        self.name = name
+        self.scheduler = scheduler
+        self.time_slice = time_slice
+        self.interpreter = TaskInterpreter(self, memoize, memo_size)
+        self.statements = statements
+        self.index = 0            # Next statement to start
+        self.evaluation = None    # Statement being evaluated, if any
+        self.max_steps = max_steps
+        self.max_stack = max_stack
+        self.steps = 0            # Steps run so far
+        self.output = output if output is not None else NullSink()  # Receives the values of the statements
+        self.error = None         # Exception the program stopped with
+        self.done = False
+
+    # Run the program for at most `steps` steps
+    def run(self, steps):
+        self.interpreter.slice_steps = 0
+        try:
+            while steps > 0 and not self.done:
+                if self.evaluation is None:
+                    if self.index == len(self.statements):
+                        self.done = True
+                        break
+                    self.evaluation = Evaluation(self.statements[self.index])
+                    self.index += 1
+                if self.max_steps is not None:
+                    steps = min(steps, self.max_steps - self.steps)
+                    if steps <= 0:
+                        raise BudgetExceeded(f"Step budget of {self.max_steps} exceeded")
+                evaluation = self.evaluation
+                before = evaluation.steps
+                try:
+                    finished = self.interpreter.run(evaluation, steps)
+                finally:
+                    used = evaluation.steps - before + self.interpreter.nested_steps
+                    self.interpreter.nested_steps = 0
+                    steps -= used
+                    self.steps += used
+                if self.max_stack is not None and len(evaluation.stack) > self.max_stack:
+                    raise BudgetExceeded(f"Memory budget of {self.max_stack} continuations exceeded")
+                if finished:
+                    self.evaluation = None
+                    if evaluation.value is not None:
+                        self.output.write(evaluation.value)
+        except Exception as error:
+            self.error = error
+            self.evaluation = None
+            self.done = True
+
+    # Called by a built-in that used up the time slice while it cannot be paused: let the other tasks
+    # run their time slices before it goes on
+    def give_way(self):
+        if self.scheduler is not None:
+            self.scheduler.run_others()
+
+
+# The Scheduler runs many programs in one thread, as green threads: it takes the ready tasks in turn,
+# runs each for one time slice of `time_slice` steps and puts it back at the end of the queue, until
+# every program has finished. A long or endless program therefore only delays the others by one time
+# slice per round instead of starving them. Programs run on the stackless interpreter, whose
+# evaluations can be paused after any step and resumed later. A built-in that cannot be paused runs
+# the other tasks' time slices from inside its own instead (see run_others).
+class Scheduler:
+    def __init__(self, time_slice=TIME_SLICE, memoize=False, memo_size=1024):
+        if time_slice < 1:
+            raise ValueError("The time slice must be at least one step")
+        self.time_slice = time_slice
+        self.options = (memoize, memo_size)
+        self.ready = deque()  # Tasks waiting for their next time slice
+        self.tasks = []       # Every task, in the order they were spawned
+
+    # Add a program, given as source text or as parsed statements, whose results go to the `output` sink
+    def spawn(self, program, name=None, max_steps=None, max_stack=None, output=None):
+        if isinstance(program, str):
+            program = Parser(Lexer(program).lex()).parse()
+        if not isinstance(program, list):
+            program = [program]
+        task = Task(name if name is not None else f'task-{len(self.tasks)}', program, max_steps, max_stack,
+                    *self.options, output, self, self.time_slice)
+        self.tasks.append(task)
+        self.ready.append(task)
+        return task
+
+    # Give one time slice to the next ready task. Returns False when there is none left
+    def tick(self):
+        if not self.ready:
+            return False
+        task = self.ready.popleft()
+        task.run(self.time_slice)
+        if not task.done:
+            self.ready.append(task)
+        return True
+
+    # Give one time slice to every ready task, for a task that is running a built-in and so is not among them.
+    # A task can give way while another one is giving way, at most once per task
+    def run_others(self):
+        for _ in range(len(self.ready)):
+            self.tick()
+
+    # Run until every task has finished, and return the tasks
+    def run(self):
+        while self.tick():
+            pass
+        return self.tasks
+
+
+# Main entry point for running the script
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="python scheduler.py")
+    arg_parser.add_argument('files', nargs='+', help=".lambda programs to run side by side")
+    arg_parser.add_argument('--time-slice', type=int, default=TIME_SLICE,
+                            help="function calls each program runs before the next one gets its turn")
+    arg_parser.add_argument('--max-steps', type=int, default=None,
+                            help="stop a program after this many function calls")
+    arg_parser.add_argument('--max-stack', type=int, default=None,
+                            help="stop a program whose evaluation holds more continuations than this")
+    arg_parser.add_argument('--memoize', action='store_true',
+                            help="remember the results of pure functions")
+    arg_parser.add_argument('--memo-size', type=int, default=1024,
+                            help="maximum number of results remembered per function")
+    args = arg_parser.parse_args()
+    if args.time_slice < 1:
+        arg_parser.error("--time-slice must be at least 1")
+
+    scheduler = Scheduler(args.time_slice, args.memoize, args.memo_size)
+    output = BufferedSink(sys.stdout)
+    for file_path in args.files:
+        with open(file_path, 'r') as file:
+            task_output = CallbackSink(lambda result, name=file_path: output.write(f"{name}: {result}"))
+            scheduler.spawn(file.read(), file_path, args.max_steps, args.max_stack, task_output)
+    try:
+        tasks = scheduler.run()
+    finally:
+        output.close()
+    failed = False
+    for task in tasks:
+        if task.error is not None:
+            print(f"{task.name}: {type(task.error).__name__}: {task.error}", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from backends import BACKENDS, MEMOIZING_BACKENDS, create_interpreter
+from lexer import Lexer
+from parser import Parser
+from optimizer import Optimizer
+from inliner import Inliner
+from snapshot import Snapshot
+from pvector import PVector
+import parallel
+
+# Longest request line accepted, in bytes
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+# A Session holds the interpreter of one connection, so functions defined by one request
+# stay defined for the following ones, like in the repl
+# A `prelude` Snapshot is the template every session starts from
+class Session:
+    def __init__(self, backend='tree', optimize=False, memoize=False, memo_size=1024, prelude=None):
+        if prelude is not None:
+            self.interpreter = prelude.fork(backend, memoize, memo_size)
+        else:
+            self.interpreter = create_interpreter(backend, memoize, memo_size)
+        self.optimize = optimize
+
+    # Evaluate the source of one request and return the value of its last statement
+    def evaluate(self, code):
+        tree = Parser(Lexer(code).lex()).parse()
+        if self.optimize:
+            tree = Optimizer(Inliner(closed=False)).optimize(tree)
+        return self.interpreter.visit(tree)  # Only the result is sent back; the interpreter keeps no output
+
+    # Release what the interpreter holds once the connection is over
+    def close(self):
+        if hasattr(self.interpreter, 'parallel'):
+            self.interpreter.parallel.close()
+
+
+# The Server evaluates programs sent over a socket. The protocol is line-delimited JSON: every
+# request is one line holding {"id": ..., "code": "..."}, and gets one response line holding
+# {"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false, "error": "..."}.
+# Each connection has its own session. A client may send requests without waiting for the responses
+# (pipelining): they wait in the connection's buffer, and are evaluated one after the other and
+# answered in the order they were sent. Evaluation runs on a thread pool, so a slow program does
+# not keep the event loop from serving other connections or accepting new ones.
+class Server:
+    def __init__(self, backend='tree', optimize=False, memoize=False, memo_size=1024, workers=None, prelude=None):
+        self.options = (backend, optimize, memoize, memo_size, prelude)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.server = None
+
+    # Start listening on a Unix socket at `path`, or on a TCP port of `host`
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path, limit=LINE_LIMIT)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+        return self.server
+
+    # Stop accepting connections, wait for the evaluation threads to finish and stop the pmap workers
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+        parallel.shutdown()
+
+    # Serve one connection until the client closes it
+    async def handle(self, reader, writer):
+        session = Session(*self.options)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(encode({'id': None, 'ok': False, 'error': "ValueError: Request line too long"}))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self.respond(session, line, loop)
+                writer.write(encode(response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            session.close()
+            writer.close()
+
+    # Evaluate one request line and build its response
+    async def respond(self, session, line, loop):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict) or not isinstance(request.get('code'), str):
+                raise ValueError("A request must be an object with a 'code' string")
+        except ValueError as error:
+            return {'id': None, 'ok': False, 'error': f"ValueError: Invalid request: {error}"}
+        try:
+            result = await loop.run_in_executor(self.executor, session.evaluate, request['code'])
+        except Exception as error:
+            return {'id': request.get('id'), 'ok': False, 'error': f"{type(error).__name__}: {error}"}
+        return {'id': request.get('id'), 'ok': True, 'result': json_value(result)}
+
+
+# A result as a JSON value: numbers, booleans and null as they are, lists as arrays, anything else as text
+def json_value(value):
+    if value is None or isinstance(value, (bool, int)):
+        return value
+    if isinstance(value, (tuple, PVector)):
+        return [json_value(item) for item in value]
+    return str(value)
+
+
+# One response line
+def encode(response):
+    return (json.dumps(response) + '\n').encode()
+
+
+# Run a server until it is interrupted
+async def serve(host='127.0.0.1', port=8765, path=None, **options):
+    server = Server(**options)
+    listener = await server.start(host, port, path)
+    where = path if path is not None else ', '.join(str(socket.getsockname()) for socket in listener.sockets)
+    print(f"Serving on {where}", file=sys.stderr)
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+# Main entry point for running the script
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="python server.py")
+    arg_parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    arg_parser.add_argument('--port', type=int, default=8765, help="TCP port to listen on")
+    arg_parser.add_argument('--unix', default=None, metavar='PATH',
+                            help="listen on a Unix socket at PATH instead of a TCP port")
+    arg_parser.add_argument('--workers', type=int, default=None,
+                            help="number of threads evaluating requests")
+    arg_parser.add_argument('--backend', choices=list(BACKENDS), default='tree',
+                            help="execution engine to evaluate requests with")
+    arg_parser.add_argument('--optimize', action='store_true',
+                            help="fold constants, inline small functions and simplify each request before evaluating it")
+    arg_parser.add_argument('--memoize', action='store_true',
+                            help="remember the results of pure functions (tree and stackless backends)")
+    arg_parser.add_argument('--memo-size', type=int, default=1024,
+                            help="maximum number of results remembered per function")
+    arg_parser.add_argument('--prelude-snapshot', default=None, metavar='FILE',
+                            help="start every session with the functions of a prelude snapshot written by snapshot.py")
+    args = arg_parser.parse_args()
+    if args.memoize and args.backend not in MEMOIZING_BACKENDS:
+        arg_parser.error(f"--memoize is not supported by the {args.backend} backend")
+    prelude = None
+    if args.prelude_snapshot is not None:
+        try:
+            prelude = Snapshot.load(args.prelude_snapshot)
+        except (OSError, ValueError) as error:
+            arg_parser.error(str(error))
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, backend=args.backend, optimize=args.optimize,
+                          memoize=args.memoize, memo_size=args.memo_size, workers=args.workers, prelude=prelude))
+    except KeyboardInterrupt:
+        pass
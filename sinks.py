@@ -0,0 +1,74 @@
+import sys
+from collections import deque
+
+# Number of results a BufferedSink collects before it writes them out
+BATCH_SIZE = 64
+
+
+# Interpreters hand the value of every top-level statement that has one to an output sink, which
+# decides what happens to it. A sink has three methods: write(result) takes one result, flush()
+# passes on anything held back, and close() flushes for the last time. The default sink of every
+# interpreter is a NullSink, so a long-running interpreter keeps no results it is not asked for.
+class NullSink:
+    # Drop the result
+    def write(self, result):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+# Writes results as lines of text to a file (standard output by default). Results are collected and
+# written `batch_size` at a time with a single write call, so a program with many results does not
+# pay for a write per result, and at most one batch is held in memory. flush() writes the collected
+# results right away.
+class BufferedSink(NullSink):
+    def __init__(self, file=None, batch_size=BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError("The batch size must be at least 1")
+        self.file = file if file is not None else sys.stdout
+        self.batch_size = batch_size
+        self.pending = []  # Text of the results not written yet
+
+    def write(self, result):
+        self.pending.append(f'{result}\n')
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(''.join(self.pending))
+            self.pending.clear()
+        self.file.flush()
+
+
+# Keeps the last `capacity` results, forgetting older ones as new ones arrive
+class RingSink(NullSink):
+    def __init__(self, capacity=BATCH_SIZE):
+        if capacity < 1:
+            raise ValueError("The capacity must be at least 1")
+        self.results = deque(maxlen=capacity)
+        self.written = 0  # Results written in total, including the forgotten ones
+
+    def write(self, result):
+        self.results.append(result)
+        self.written += 1
+
+    # The results kept, oldest first
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+
+# Calls a function with every result
+class CallbackSink(NullSink):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, result):
+        self.callback(result)
@@ -0,0 +1,86 @@
+import pickle
+import sys
+
+from backends import create_interpreter
+from cache import CACHE_VERSION, load_program
+from interpreter import Interpreter
+from parser import Function
+
+
+# A Snapshot holds the functions a prelude defines, so that programs can start with them already
+# defined instead of lexing, parsing and running the prelude every time. It is a template in memory:
+# fork() makes a new interpreter that knows the functions, at the cost of one dictionary entry per
+# function for the tree and stackless interpreters, which share the resolved ASTs (call sites check
+# which global scope their inline cache belongs to, so sharing is safe). The other backends compile
+# the functions once per fork, which still skips the lexer, the parser and the prelude's other
+# statements. save() and load() keep a snapshot in a file for the next process.
+class Snapshot:
+    def __init__(self, functions):
+        self.functions = functions  # Function name -> Function node, in the order they were defined
+
+    # Take the functions defined in a tree or stackless interpreter
+    @classmethod
+    def capture(cls, interpreter):
+        if not isinstance(interpreter, Interpreter):
+            raise ValueError("Snapshots are taken from the tree or stackless interpreter")
+        return cls({name: value for name, value in interpreter.global_scope.items() if isinstance(value, Function)})
+
+    # Run a prelude file and take the functions it defines; the values of its other statements are dropped
+    @classmethod
+    def build(cls, file_path, optimize=False, cache=True):
+        tree, _ = load_program(file_path, optimize, cache)
+        interpreter = Interpreter()
+        interpreter.visit(tree)
+        return cls.capture(interpreter)
+
+    # Read a snapshot written by save()
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            try:
+                key = pickle.load(file)
+            except Exception:
+                raise ValueError(f"{path} is not a prelude snapshot") from None
+            if key != snapshot_key():
+                raise ValueError(f"{path} was written by another version of the interpreter; build it again")
+            return cls(pickle.load(file))
+
+    # Write the snapshot to a file
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump(snapshot_key(), file)
+            pickle.dump(self.functions, file, pickle.HIGHEST_PROTOCOL)
+
+    # Define the functions in an existing interpreter
+    def install(self, interpreter):
+        if isinstance(interpreter, Interpreter):
+            for func in self.functions.values():
+                interpreter.define(func)  # Already resolved
+        elif self.functions:
+            interpreter.visit(list(self.functions.values()))
+
+    # A new interpreter of the named backend that knows the functions
+    def fork(self, backend='tree', memoize=False, memo_size=1024, output=None):
+        interpreter = create_interpreter(backend, memoize, memo_size, output)
+        self.install(interpreter)
+        return interpreter
+
+
+# Header written in front of a snapshot. A snapshot holds pickled AST nodes, so it is only valid
+# for the AST format (CACHE_VERSION) and Python version that wrote it
+def snapshot_key():
+    return {'format': 'prelude-snapshot', 'version': CACHE_VERSION, 'python': sys.version_info[:2]}
+
+
+# Main entry point for running the script
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="python snapshot.py")
+    arg_parser.add_argument('prelude', help=".lambda file defining the functions to snapshot")
+    arg_parser.add_argument('output', help="file to write the snapshot to")
+    arg_parser.add_argument('--optimize', action='store_true',
+                            help="fold constants, inline small functions and simplify the prelude before taking the snapshot")
+    args = arg_parser.parse_args()
+    snapshot = Snapshot.build(args.prelude, args.optimize)
+    snapshot.save(args.output)
+    print(f"Saved {len(snapshot.functions)} functions to {args.output}", file=sys.stderr)
@@ -0,0 +1,216 @@
+# Token Types
+INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
+    AND, OR, NOT, EQ, NEQ, GT, LT, GEQ, LEQ, \
+    ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
+    'INTEGER', 'BOOLEAN', 'PLUS', 'MINUS', 'MUL', 'DIV', 'MOD', 'LPAREN', 'RPAREN',
+    'AND', 'OR', 'NOT', 'EQ', 'NEQ', 'GT', 'LT', 'GEQ', 'LEQ',
+    'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
+)
+
+from compiler import BINARY_OPERATORS, UNARY_OPERATORS
+from interpreter import Interpreter, Frame
+from parser import BinOp, UnaryOp, Num, Bool, Var, Function, Lambda, Call, If
+
+# Continuation kinds kept on the heap-allocated continuation stack
+BINOP_LEFT, BINOP_RIGHT, UNARY, BRANCH, CALL_ARGS, SEQUENCE, RESTORE, MEMOIZE = range(8)
+
+
+# A lambda value of the stackless interpreter. The machine calls it in place (so calls to it
+# can be tail calls), and Python code can still call it like a function
+class Closure:
+    __slots__ = ('node', 'env', 'interpreter')
+
+    def __init__(self, node, env, interpreter):
+        self.node = node                # The Lambda node
+        self.env = env                  # Frame the lambda was created in
+        self.interpreter = interpreter  # Interpreter whose global scope the body sees
+
+    def __call__(self, *args):
+        return self.interpreter.apply(self, list(args))
+
+    def __repr__(self):
+        return f'<lambda({", ".join(self.node.params)})>'
+
+
+# The StacklessInterpreter evaluates expressions in a loop over an explicit continuation stack
+# instead of recursing through visit(). A call in tail position - the last statement of a body,
+# an If branch, or the right operand of && and || - reuses the caller's continuation, so
+# tail-recursive functions run in constant memory, and other recursion is only bounded by the heap.
+class StacklessInterpreter(Interpreter):
+    # Lists of statements are run one by one like in the tree walker; everything else goes through the machine
+    def visit(self, node):
+        if isinstance(node, list):
+            return self.visit_statements(node)
+        return self.evaluate(node)
+
+    # Call a function or closure with already evaluated arguments
+    def apply(self, func, args):
+        return self.evaluate(Call(_Value(func), [_Value(arg) for arg in args]))
+
+    # Evaluate a single expression to a value
+    def evaluate(self, node):
+        evaluation = Evaluation(node, self.frame)
+        self.run(evaluation)
+        return evaluation.value
+
+    # Run an evaluation for at most `steps` steps (at least one, or without limit when None). Returns
+    # True when it has finished, with its value in evaluation.value, and False when it was paused;
+    # calling run() again continues where it stopped. A step is a call of a defun function or lambda:
+    # the language has no loops, so between two calls the machine only does work bounded by the size
+    # of the function body. Built-in Python callables (pmap, reduce and the like) run to completion
+    # within the step that calls them
+    def run(self, evaluation, steps=None):
+        global_scope = self.global_scope
+        node, stack, value = evaluation.node, evaluation.stack, evaluation.value
+        remaining = start = steps if steps is not None else -1  # Counting down from -1 never reaches 0
+        initial_frame = self.frame
+        self.frame = evaluation.frame
+        try:
+            while True:
+                # Descend into the expression until it produces a value
+                while node is not None:
+                    kind = type(node)
+                    if kind is Num or kind is Bool:
+                        value = node.value
+                        node = None
+                    elif kind is Var:
+                        if node.depth is not None:
+                            frame = self.frame
+                            for _ in range(node.depth):
+                                frame = frame.parent
+                            value = frame.values[node.slot]
+                        elif node.name in global_scope:
+                            value = global_scope[node.name]
+                        else:
+                            raise NameError(f"Undefined variable: {node.name}")
+                        node = None
+                    elif kind is BinOp:
+                        stack.append((BINOP_LEFT, node))
+                        node = node.left
+                    elif kind is Call:
+                        stack.append((CALL_ARGS, node, []))
+                        node = node.func
+                    elif kind is If:
+                        stack.append((BRANCH, node))
+                        node = node.condition
+                    elif kind is UnaryOp:
+                        stack.append((UNARY, node))
+                        node = node.expr
+                    elif kind is list:
+                        if len(node) > 1:
+                            stack.append((SEQUENCE, node, 1))
+                        node = node[0] if node else None
+                        value = None
+                    elif kind is Function:
+                        self.visit_function(node)
+                        value = node = None
+                    elif kind is Lambda:
+                        if self.frame is None:
+                            self.resolver.resolve(node)
+                        value = Closure(node, self.frame, self)
+                        node = None
+                    elif kind is _Value:
+                        value = node.value
+                        node = None
+                    else:
+                        self.generic_visit(node)
+
+                # Feed the value to continuations until one of them needs another expression evaluated
+                while node is None:
+                    if not stack:
+                        evaluation.node, evaluation.value = None, value
+                        return True
+                    continuation = stack.pop()
+                    tag = continuation[0]
+
+                    if tag == BINOP_LEFT:
+                        binop = continuation[1]
+                        op_type = binop.op.type
+                        if op_type == OR:
+                            if not value:
+                                node = binop.right  # Tail position: no continuation left behind
+                        elif op_type == AND:
+                            if value:
+                                node = binop.right
+                        else:
+                            stack.append((BINOP_RIGHT, binop, value))
+                            node = binop.right
+                    elif tag == BINOP_RIGHT:
+                        value = BINARY_OPERATORS[continuation[1].op.type](continuation[2], value)
+                    elif tag == CALL_ARGS:
+                        call, evaluated = continuation[1], continuation[2]
+                        evaluated.append(value)
+                        if len(evaluated) <= len(call.args):
+                            stack.append(continuation)
+                            node = call.args[len(evaluated) - 1]
+                            continue
+                        func, args = evaluated[0], evaluated[1:]
+                        if isinstance(func, Function):
+                            params, body, env = func.params, func.body, None
+                        elif isinstance(func, Closure):
+                            params, body, env = func.node.params, func.node.body, func.env
+                        elif callable(func):
+                            value = func(*args)  # Built-in Python callables
+                            continue
+                        else:
+                            raise TypeError(f"{getattr(call.func, 'name', func)} is not callable")
+                        if len(args) != len(params):
+                            raise TypeError("Argument count mismatch")
+                        table = key = None
+                        if self.memo is not None and isinstance(func, Function):
+                            table, key = self.memo.table(func), self.memo.key(args)
+                            if table is not None and key is not None:
+                                found, value = table.get(key)
+                                if found:
+                                    continue
+                        # Only remember the caller's frame if this is not a tail call
+                        if stack and stack[-1][0] != RESTORE:
+                            stack.append((RESTORE, self.frame))
+                        if table is not None and key is not None:
+                            stack.append((MEMOIZE, table, key))  # Memoized calls are never tail calls
+                        self.frame = Frame(args, env)
+                        node = body
+                        value = None
+                        remaining -= 1
+                        if not remaining:  # Pause before running the body
+                            evaluation.node, evaluation.value, evaluation.frame = node, value, self.frame
+                            return False
+                    elif tag == RESTORE:
+                        self.frame = continuation[1]
+                    elif tag == MEMOIZE:
+                        continuation[1].put(continuation[2], value)
+                    elif tag == BRANCH:
+                        branch = continuation[1]
+                        node = branch.then_branch if value else branch.else_branch
+                        value = None
+                    elif tag == SEQUENCE:
+                        statements, index = continuation[1], continuation[2]
+                        if index + 1 < len(statements):
+                            stack.append((SEQUENCE, statements, index + 1))
+                        node = statements[index]
+                    elif tag == UNARY:
+                        value = UNARY_OPERATORS[continuation[1].op.type](value)
+        finally:
+            evaluation.steps += start - remaining
+            self.frame = initial_frame
+
+
+# The state of an expression being evaluated by StacklessInterpreter.run(): what to evaluate next, the
+# continuation stack waiting for its value, and the frame it runs in
+class Evaluation:
+    __slots__ = ('node', 'stack', 'value', 'frame', 'steps')
+
+    def __init__(self, node, frame=None):
+        self.node = node    # Expression to evaluate next (None once finished)
+        self.stack = []     # Continuation stack: tuples whose first item is the continuation kind
+        self.value = None   # The result, once finished
+        self.frame = frame  # Frame of the call being executed when paused
+        self.steps = 0      # Steps run so far
+
+
+# An already evaluated value standing in for an expression, used when Python code calls into the machine
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
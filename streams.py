@@ -0,0 +1,95 @@
+import itertools
+from functools import reduce
+
+from parser import Function
+
+
+# A Stream is a lazy sequence: it holds a function that starts a fresh iterator over its elements,
+# and computes elements only as they are consumed. A pipeline such as
+# reduce(add, map(square, filter(iseven, range(1000000)))) never holds more than one element at a
+# time, so it runs in constant memory. A stream can be consumed any number of times, and Python
+# code can iterate over it like over any other iterable.
+class Stream:
+    __slots__ = ('start',)
+
+    def __init__(self, start):
+        self.start = start  # Function returning a new iterator over the elements
+
+    def __iter__(self):
+        return self.start()
+
+    # Printing a stream computes none of its elements: even the first one could take arbitrarily long to
+    # find (filter over a huge range) or call functions the program only meant to run when consumed
+    def __repr__(self):
+        return '<stream>'
+
+
+# Streams provides the stream built-ins of an interpreter. The loops run natively: each element costs
+# one call of the user's function (prepared once per stream, not looked up per element), and
+# nothing at all for built-in functions, which are passed to Python's map and filter directly.
+class Streams:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter  # Interpreter that runs the functions passed to map, filter and reduce
+
+    # The built-in functions to add to the interpreter's global scope
+    def builtins(self):
+        return {'range': self.range, 'map': self.map, 'filter': self.filter, 'take': self.take,
+                'reduce': self.reduce}
+
+    # range(stop), range(start, stop) or range(start, stop, step): the integers Python's range gives
+    def range(self, *args):
+        numbers = range(*args)
+        return Stream(lambda: iter(numbers))
+
+    # map(f, s): f applied to each element of s
+    def map(self, func, source):
+        call = self.caller(func, 1)
+        source = iterable(source, 'map')
+        return Stream(lambda: map(call, source))
+
+    # filter(f, s): the elements of s for which f is true
+    def filter(self, func, source):
+        call = self.caller(func, 1)
+        source = iterable(source, 'filter')
+        return Stream(lambda: filter(call, source))
+
+    # take(n, s): the first n elements of s
+    def take(self, count, source):
+        if type(count) is not int or count < 0:
+            raise ValueError("take expects a non-negative integer count")
+        source = iterable(source, 'take')
+        return Stream(lambda: itertools.islice(source, count))
+
+    # reduce(f, s) or reduce(f, s, initial): combine the elements of s from left to right with f
+    def reduce(self, func, source, *initial):
+        if len(initial) > 1:
+            raise TypeError("Argument count mismatch")
+        call = self.caller(func, 2)
+        elements = iter(iterable(source, 'reduce'))
+        if not initial:
+            initial = tuple(itertools.islice(elements, 1))
+            if not initial:
+                raise TypeError("reduce of an empty stream with no initial value")
+        return reduce(call, elements, initial[0])
+
+    # A Python callable that calls `func` with `arity` arguments, with the type and arity checks done once
+    def caller(self, func, arity):
+        if isinstance(func, Function):
+            if len(func.params) != arity:
+                raise TypeError("Argument count mismatch")
+            call_function = self.interpreter.call_function
+            if arity == 1:
+                return lambda value: call_function(func, [value])
+            return lambda left, right: call_function(func, [left, right])
+        if callable(func):
+            return func  # Lambdas and built-ins are Python callables already
+        raise TypeError(f"{func} is not callable")
+
+
+# Check that a stream function was given something to iterate over
+def iterable(source, name):
+    try:
+        iter(source)
+    except TypeError:
+        raise TypeError(f"{name} expects a stream, not {source}") from None
+    return source
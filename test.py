@@ -1,13 +1,53 @@
+import os
+import shutil
+import tempfile
 import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
 
 from lexer import Lexer
-from parser import Parser
+from parser import Parser, NodeTable, Function, Lambda, BinOp, Var, Call, Num
+from lexer import Token, StreamLexer
+from file_runner import run_stream, run_file
+from snapshot import Snapshot
+from sinks import NullSink, BufferedSink, RingSink, CallbackSink
+import cache
+import astsize
+import gc
+import operator
+import tracemalloc
+import pickle
+from resolver import Resolver
 from interpreter import Interpreter
+from compiler import ClosureInterpreter
+from transpiler import PythonInterpreter, cache_path
+from vm import VMInterpreter, BytecodeCompiler, disassemble
+from stackless import StacklessInterpreter, Evaluation
+from scheduler import Scheduler, BudgetExceeded
+from optimizer import Optimizer, constant as optimizer_constant
+import inliner
+from inliner import Inliner
+from purity import pure_functions
+import vectorize
+import batch_runner
+import asyncio
+import json
+import server
+import parallel
+import backends
+from profiler import ProfilingInterpreter
+from streams import Stream
+from pvector import PVector, height
+from benchmarks import WORKLOADS, PHASES, run_benchmarks, compare_results
 
 
 class BaseTestInterpreter(unittest.TestCase):
     def setUp(self):
-        self.interpreter = Interpreter()
+        self.interpreter = self.create_interpreter()
+
+    def create_interpreter(self):
+        return Interpreter()
 
     def run_test_case(self, text, expected):
         lexer = Lexer(text)
@@ -147,5 +187,1409 @@ class TestBooleanLogicAndFunctions(BaseTestInterpreter):
         self.run_test_case("isodd(5)", True)
 
 
+class TestLexicalScopes(BaseTestInterpreter):
+
+    def test_callee_does_not_see_caller_parameters(self):
+        self.run_test_case("defun g() { x }", None)
+        self.run_test_case("defun f(x) { g() }", None)
+        with self.assertRaises(NameError):
+            self.run_test_case("f(1)", None)
+
+    def test_calls_do_not_touch_global_scope(self):
+        builtins = list(self.interpreter.global_scope)
+        self.run_test_case("defun add(a, b) { a + b }", None)
+        self.run_test_case("add(2, 3)", 5)
+        self.assertEqual(list(self.interpreter.global_scope), builtins + ['add'])
+
+    def test_frame_restored_after_error(self):
+        self.run_test_case("defun bad(x) { x / 0 }", None)
+        with self.assertRaises(ZeroDivisionError):
+            self.run_test_case("bad(1)", None)
+        self.assertIsNone(self.interpreter.frame)
+
+    def test_argument_count_mismatch(self):
+        self.run_test_case("defun add(a, b) { a + b }", None)
+        with self.assertRaises(TypeError):
+            self.run_test_case("add(1)", None)
+
+    def test_resolver_coordinates(self):
+        tree = Parser(Lexer("defun f(a, b) { b + c }").lex()).parse()
+        Resolver().resolve(tree)
+        body = tree[0].body[0]
+        self.assertEqual((body.left.depth, body.left.slot), (0, 1))
+        self.assertIsNone(body.right.depth)
+
+    def test_lambda_captures_defining_frame(self):
+        # defun adder(n) { lambd(x) (x + n) } - built by hand, lambdas are only parsed at top level
+        body = BinOp(Var(Token('ID', 'x')), Token('PLUS', '+'), Var(Token('ID', 'n')))
+        self.interpreter.visit(Function('adder', ['n'], [Lambda(['x'], body)]))
+        add_five = self.interpreter.visit(Call(Var(Token('ID', 'adder')), [Num(Token('INTEGER', 5))]))
+        self.assertEqual(add_five(10), 15)
+        self.assertEqual(add_five(1), 6)
+
+
+class TestLexer(unittest.TestCase):
+
+    def lex(self, text):
+        return [(token.type, token.value) for token in Lexer(text).lex()]
+
+    def test_tokens(self):
+        self.assertEqual(self.lex("defun f(x) { x >= 10 && !True }"), [
+            ('DEFUN', 'defun'), ('ID', 'f'), ('LPAREN', '('), ('ID', 'x'), ('RPAREN', ')'),
+            ('LBRACE', '{'), ('ID', 'x'), ('GEQ', '>='), ('INTEGER', 10), ('AND', '&&'),
+            ('NOT', '!'), ('BOOLEAN', True), ('RBRACE', '}'), ('EOF', None)])
+
+    def test_comments_and_whitespace_are_skipped(self):
+        self.assertEqual(self.lex("1 # one\n\t2 # two"), [('INTEGER', 1), ('INTEGER', 2), ('EOF', None)])
+
+    def test_not_keyword_in_any_case(self):
+        self.assertEqual(self.lex("Not x")[0], ('NOT', 'Not'))
+
+    def test_token_offsets(self):
+        self.assertEqual([token.offset for token in Lexer("ab + 12").lex()], [0, 3, 5, 7])
+
+    def test_unknown_token_reports_line_and_column(self):
+        with self.assertRaisesRegex(ValueError, "Unknown token: '&' at line 2, column 5"):
+            Lexer("1 +\n  2 & 3").lex()
+
+    def test_single_equals_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Lexer("a = b").lex()
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_stream_lexer_matches_lexer_for_any_chunk_size(self):
+        with open('program.lambda') as file:
+            code = file.read()
+        expected = [(token.type, token.value, token.offset) for token in Lexer(code).lex()]
+        for size in (1, 2, 5, 64, len(code)):
+            chunks = [code[i:i + size] for i in range(0, len(code), size)]
+            tokens = [(token.type, token.value, token.offset) for token in StreamLexer(chunks).tokens()]
+            self.assertEqual(tokens, expected)
+
+    def test_stream_lexer_error_position(self):
+        chunks = ["1 +\n  ", "2 ", "& 3"]
+        with self.assertRaisesRegex(ValueError, "at line 2, column 5"):
+            list(StreamLexer(chunks).tokens())
+
+    def test_parser_pulls_tokens_lazily(self):
+        pulled = []
+
+        def tokens():
+            for token in Lexer("1 + 2 3 * 4").lex():
+                pulled.append(token)
+                yield token
+
+        statements = Parser(tokens()).statements()
+        first = next(statements)
+        self.assertEqual(first.op.type, 'PLUS')
+        self.assertLess(len(pulled), 6)
+
+    def test_results_are_printed_before_a_later_error(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'partial.lambda')
+        with open(path, 'w') as file:
+            file.write("defun double(x) { x * 2 }\ndouble(21)\n1 + 1\n3 @ 4\n")
+        output = StringIO()
+        with redirect_stdout(output), self.assertRaises(ValueError):
+            run_stream(path)
+        self.assertEqual(output.getvalue(), "42\n2\n")
+
+
+class TestBatchRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        os.mkdir(os.path.join(self.directory, 'nested'))
+        self.write('b.lambda', "defun double(x) { x * 2 }\ndouble(21)\n1 == 1\n")
+        self.write('a.lambda', "1 + 2\n")
+        self.write('nested/c.lambda', "5 / 0\n")
+        self.write('manifest.txt', "# programs to run\nnested/c.lambda\na.lambda  # trailing comment\n")
+
+    def write(self, name, text):
+        with open(os.path.join(self.directory, name), 'w') as file:
+            file.write(text)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_collect_sources(self):
+        everything = [self.path('a.lambda'), self.path('b.lambda'), self.path('nested/c.lambda')]
+        self.assertEqual(batch_runner.collect_files([self.directory]), everything)
+        self.assertEqual(batch_runner.collect_files([self.path('*.lambda')]), everything[:2])
+        self.assertEqual(batch_runner.collect_files([self.path('manifest.txt'), self.path('a.lambda')]),
+                         [everything[0], everything[2]])
+        with self.assertRaises(ValueError):
+            batch_runner.collect_files([self.path('missing.lambda')])
+
+    def test_report_in_file_order(self):
+        files = batch_runner.collect_files([self.directory])
+        for workers in (1, 2):
+            report = batch_runner.run_batch(files, workers=workers, chunksize=2, cache=False)
+            self.assertEqual([entry['file'] for entry in report['files']], files)
+            self.assertEqual([entry['results'] for entry in report['files']], [['3'], ['42', 'True'], None])
+            self.assertEqual(report['files'][2]['error'], "ZeroDivisionError: integer division or modulo by zero")
+            self.assertEqual(report['summary']['failed'], 1)
+            self.assertTrue(all(entry['seconds'] >= 0 for entry in report['files']))
+
+
+class TestProgramCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'square.lambda')
+        self.write("defun square(x) { x * x }\nsquare(2 + 3)\n")
+
+    def write(self, code):
+        with open(self.path, 'w') as file:
+            file.write(code)
+
+    def run_program(self, tree):
+        interpreter = Interpreter()
+        return [interpreter.visit(statement) for statement in tree]
+
+    def test_warm_start_skips_lexer_and_parser(self):
+        cache.load_program(self.path)
+        with mock.patch.object(cache, 'Lexer', side_effect=AssertionError("lexed again")):
+            tree, _ = cache.load_program(self.path)
+        self.assertEqual(self.run_program(tree), [None, 25])
+
+    def test_changed_source_invalidates_entry(self):
+        cache.load_program(self.path)
+        self.write("defun square(x) { x * x }\nsquare(4)\n")
+        tree, _ = cache.load_program(self.path)
+        self.assertEqual(self.run_program(tree), [None, 16])
+
+    def test_new_cache_version_invalidates_entry(self):
+        cache.load_program(self.path)
+        with mock.patch.object(cache, 'CACHE_VERSION', cache.CACHE_VERSION + 1), \
+                mock.patch.object(cache, 'Lexer', wraps=cache.Lexer) as lexer:
+            cache.load_program(self.path)
+        lexer.assert_called_once()
+
+    def test_optimized_programs_are_cached_separately(self):
+        cache.load_program(self.path)
+        tree, removed = cache.load_program(self.path, optimize=True)
+        self.assertEqual(removed, 4)  # square(2 + 3) is folded, inlined and folded again to 25
+        self.assertEqual(cache.load_program(self.path, optimize=True)[1], 4)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, cache.CACHE_DIR))),
+                         ['square.lambda.ast.pickle', 'square.lambda.opt.pickle'])
+
+    def test_disabled_cache_writes_nothing(self):
+        cache.load_program(self.path, use_cache=False)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, cache.CACHE_DIR)))
+
+    def test_corrupt_entry_is_rebuilt(self):
+        cache.load_program(self.path)
+        with open(cache.cache_path(self.path, '.ast.pickle'), 'wb') as file:
+            file.write(b'not a pickle')
+        tree, _ = cache.load_program(self.path)
+        self.assertEqual(self.run_program(tree), [None, 25])
+
+
+class TestCompactAST(unittest.TestCase):
+
+    def parse(self, text):
+        return Parser(Lexer(text).lex()).parse()
+
+    def test_nodes_have_no_instance_dict(self):
+        tree = self.parse("defun f(x) { if x > 0 !x else g(-x) }")
+        pending = list(tree)
+        while pending:
+            node = pending.pop()
+            self.assertFalse(hasattr(node, '__dict__'), type(node).__name__)
+            pending.extend(child for child in astsize.children(node))
+
+    def test_operator_tokens_are_shared(self):
+        first, second = self.parse("1 + 2 3 + 4")
+        self.assertIs(first.op, second.op)
+        self.assertIsNone(first.op.offset)
+
+    def test_tree_survives_pickling(self):
+        tree = pickle.loads(pickle.dumps(self.parse("defun f(x) { x * 2 } f(21)")))
+        interpreter = Interpreter()
+        self.assertEqual(interpreter.visit(tree), 42)
+
+    def test_measure_reports_smaller_layout(self):
+        with open('program.lambda') as file:
+            sizes = astsize.measure(self.parse(file.read()))
+        self.assertEqual(sizes['nodes'], 116)
+        self.assertLess(sizes['after'], sizes['before'] / 2)
+
+
+class TestSharedSubtrees(unittest.TestCase):
+
+    def parse(self, text, table):
+        return Parser(Lexer(text).lex(), table).parse()
+
+    def test_identical_subtrees_are_shared(self):
+        table = NodeTable()
+        (statement,) = self.parse("(n % 2) * (n % 2)", table)
+        self.assertIs(statement.left, statement.right)
+        self.assertEqual(table.shared, 3)  # n, 2 and n % 2
+
+    def test_tables_are_optional(self):
+        (statement,) = Parser(Lexer("(n % 2) * (n % 2)").lex()).parse()
+        self.assertIsNot(statement.left, statement.right)
+
+    def test_sharing_spans_parsers(self):
+        table = NodeTable()
+        (first,) = self.parse("lambd(x) x - 1", table)
+        (second,) = self.parse("lambd(x) x - 1", table)
+        self.assertIs(first, second)
+
+    def test_variables_in_different_scopes_are_kept_apart(self):
+        table = NodeTable()
+        f, g = self.parse("defun f(x) { x + 1 } defun g(y, x) { x + 1 }", table)
+        self.assertIsNot(f.body[0], g.body[0])
+        h, = self.parse("defun h(x) { x + 1 }", table)
+        self.assertIs(f.body[0], h.body[0])
+        self.assertEqual((h.body[0].left.depth, h.body[0].left.slot), (0, 0))
+
+    def test_results_match_unshared_trees(self):
+        with open('program.lambda') as file:
+            text = file.read()
+        for interpreter_class in (Interpreter, ClosureInterpreter, VMInterpreter, StacklessInterpreter):
+            shared, plain = interpreter_class(), interpreter_class()
+            shared_results = [shared.visit(statement) for statement in self.parse(text, NodeTable())]
+            plain_results = [plain.visit(statement) for statement in self.parse(text, None)]
+            self.assertEqual(shared_results, plain_results, interpreter_class.__name__)
+
+    def test_table_does_not_keep_trees_alive(self):
+        table = NodeTable()
+        tree = self.parse("defun f(x) { x * 2 + 1 }", table)
+        self.assertGreater(len(table), 0)
+        del tree
+        gc.collect()
+        self.assertEqual(len(table), 0)
+
+    def test_shared_subtree_is_optimized_once(self):
+        (statement,) = self.parse("(n * (2 + 3)) + (n * (2 + 3))", NodeTable())
+        optimizer = Optimizer()
+        with mock.patch('optimizer.constant', wraps=optimizer_constant) as constant:
+            optimized = optimizer.optimize(statement)
+        self.assertEqual(constant.call_count, 1)
+        self.assertIs(optimized.left, optimized.right)
+        self.assertEqual(optimizer.removed, 4)
+
+    def test_shared_tree_is_smaller(self):
+        text = " ".join(["lambd(x) x % 2 == 0 && x - 1 > 0"] * 50)
+        self.assertLess(astsize.tree_bytes(self.parse(text, NodeTable())),
+                        astsize.tree_bytes(self.parse(text, None)) / 10)
+
+
+# Run the language test cases above against the closure-compiling backend as well
+class ClosureBackend:
+    def create_interpreter(self):
+        return ClosureInterpreter()
+
+
+class TestClosureArithmeticOperations(ClosureBackend, TestArithmeticOperations): pass
+class TestClosureBooleanOperations(ClosureBackend, TestBooleanOperations): pass
+class TestClosureConditionalStatements(ClosureBackend, TestConditionalStatements): pass
+class TestClosureFunctionDefinitionsAndCalls(ClosureBackend, TestFunctionDefinitionsAndCalls): pass
+class TestClosureLambdaExpressions(ClosureBackend, TestLambdaExpressions): pass
+class TestClosureDivisionByZero(ClosureBackend, TestDivisionByZero): pass
+class TestClosureBooleanLogicAndFunctions(ClosureBackend, TestBooleanLogicAndFunctions): pass
+
+
+class TestClosureBackendSpecifics(BaseTestInterpreter):
+
+    def create_interpreter(self):
+        return ClosureInterpreter()
+
+    def test_function_as_argument(self):
+        self.run_test_case("defun addone(x) { x + 1 }", None)
+        self.run_test_case("defun applytwice(f, x) { f(f(x)) }", None)
+        self.run_test_case("applytwice(addone, 3)", 5)
+
+    def test_redefinition_is_seen_by_callers(self):
+        self.run_test_case("defun g(x) { x + 1 }", None)
+        self.run_test_case("defun f(x) { g(x) }", None)
+        self.run_test_case("defun g(x) { x * 10 }", None)
+        self.run_test_case("f(2)", 20)
+
+    def test_undefined_variable(self):
+        with self.assertRaises(NameError):
+            self.run_test_case("y + 1", None)
+
+    def test_program_file_matches_tree_walker(self):
+        with open('program.lambda') as file:
+            code = file.read()
+        outputs = []
+        for interpreter in (Interpreter(), ClosureInterpreter()):
+            statements = Parser(Lexer(code).lex()).parse()
+            outputs.append([interpreter.visit(statement) for statement in statements])
+        self.assertEqual(outputs[0], outputs[1])
+
+
+# Run the language test cases above against the Python transpiling backend as well
+class PythonBackend:
+    def create_interpreter(self):
+        return PythonInterpreter()
+
+
+class TestPythonArithmeticOperations(PythonBackend, TestArithmeticOperations): pass
+class TestPythonBooleanOperations(PythonBackend, TestBooleanOperations): pass
+class TestPythonConditionalStatements(PythonBackend, TestConditionalStatements): pass
+class TestPythonFunctionDefinitionsAndCalls(PythonBackend, TestFunctionDefinitionsAndCalls): pass
+class TestPythonLambdaExpressions(PythonBackend, TestLambdaExpressions): pass
+class TestPythonDivisionByZero(PythonBackend, TestDivisionByZero): pass
+class TestPythonBooleanLogicAndFunctions(PythonBackend, TestBooleanLogicAndFunctions): pass
+
+
+class TestPythonBackendSpecifics(BaseTestInterpreter):
+
+    def create_interpreter(self):
+        return PythonInterpreter()
+
+    def test_short_circuit_returns_deciding_operand(self):
+        self.run_test_case("0 || 7", 7)
+        self.run_test_case("3 && 0", 0)
+        self.run_test_case("False && (1 / 0)", False)
+
+    def test_comparisons_do_not_chain(self):
+        self.run_test_case("1 < 2 == True", True)
+
+    def test_negative_floor_division(self):
+        self.run_test_case("-7 / 2", -4)
+
+    def test_python_keyword_identifiers(self):
+        self.run_test_case("defun is(and, or) { and + or }", None)
+        self.run_test_case("is(1, 2)", 3)
+
+    def test_python_builtins_are_not_visible(self):
+        with self.assertRaises(NameError):
+            self.run_test_case("print(1)", None)
+
+    def test_only_the_last_generated_source_is_kept(self):
+        self.run_test_case("defun addone(x) { x + 1 }", None)
+        self.assertIn("def addone(x):", self.interpreter.source)
+        self.run_test_case("addone(1)", 2)
+        self.assertNotIn("def addone(x):", self.interpreter.source)
+
+    def test_file_module_is_cached(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'square.lambda')
+        with open(path, 'w') as file:
+            file.write("defun square(x) { x * x }\nsquare(7)\n")
+        self.assertEqual(self.interpreter.run_file(path), 49)
+        self.assertTrue(os.path.exists(cache_path(path)))
+        self.assertEqual(PythonInterpreter().run_file(path), 49)
+        with open(path, 'w') as file:
+            file.write("defun square(x) { x * x }\nsquare(8)\n")
+        self.assertEqual(PythonInterpreter().run_file(path), 64)
+
+
+# Run the language test cases above against the bytecode virtual machine as well
+class VMBackend:
+    def create_interpreter(self):
+        return VMInterpreter()
+
+
+class TestVMArithmeticOperations(VMBackend, TestArithmeticOperations): pass
+class TestVMBooleanOperations(VMBackend, TestBooleanOperations): pass
+class TestVMConditionalStatements(VMBackend, TestConditionalStatements): pass
+class TestVMFunctionDefinitionsAndCalls(VMBackend, TestFunctionDefinitionsAndCalls): pass
+class TestVMLambdaExpressions(VMBackend, TestLambdaExpressions): pass
+class TestVMDivisionByZero(VMBackend, TestDivisionByZero): pass
+class TestVMBooleanLogicAndFunctions(VMBackend, TestBooleanLogicAndFunctions): pass
+
+
+class TestVMSpecifics(BaseTestInterpreter):
+
+    def create_interpreter(self):
+        return VMInterpreter()
+
+    def test_deep_recursion_does_not_use_python_stack(self):
+        self.run_test_case("defun count(n) { n == 0 || count(n - 1) }", None)
+        self.run_test_case("count(20000)", True)
+
+    def test_short_circuit(self):
+        self.run_test_case("False && (1 / 0)", False)
+        self.run_test_case("0 || 7", 7)
+
+    def test_function_as_argument(self):
+        self.run_test_case("defun addone(x) { x + 1 }", None)
+        self.run_test_case("defun applytwice(f, x) { f(f(x)) }", None)
+        self.run_test_case("applytwice(addone, 3)", 5)
+
+    def test_bool_and_int_constants_are_distinct(self):
+        self.run_test_case("if True 1 else 2", 1)
+        self.run_test_case("1 == 1 && True", True)
+
+    def test_disassemble(self):
+        tree = Parser(Lexer("defun iseven(x) { x % 2 == 0 }").lex()).parse()
+        listing = disassemble(BytecodeCompiler().compile_program(tree))
+        self.assertIn("STORE_GLOBAL          0 (iseven)", listing)
+        self.assertIn("Disassembly of iseven(x):", listing)
+        self.assertIn("LOAD_LOCAL            0 (x)", listing)
+
+
+class TestIfExpressions(BaseTestInterpreter):
+
+    def test_if_inside_expression(self):
+        self.run_test_case("1 + if False 10 else 20", 21)
+
+    def test_if_inside_function_body(self):
+        self.run_test_case("defun sign(n) { if n < 0 0 - 1 else if n > 0 1 else 0 }", None)
+        self.run_test_case("sign(0 - 5)", -1)
+        self.run_test_case("sign(5)", 1)
+        self.run_test_case("sign(0)", 0)
+
+
+# Run the language test cases above against the stackless evaluator as well
+class StacklessBackend:
+    def create_interpreter(self):
+        return StacklessInterpreter()
+
+
+class TestStacklessArithmeticOperations(StacklessBackend, TestArithmeticOperations): pass
+class TestStacklessBooleanOperations(StacklessBackend, TestBooleanOperations): pass
+class TestStacklessConditionalStatements(StacklessBackend, TestConditionalStatements): pass
+class TestStacklessFunctionDefinitionsAndCalls(StacklessBackend, TestFunctionDefinitionsAndCalls): pass
+class TestStacklessLambdaExpressions(StacklessBackend, TestLambdaExpressions): pass
+class TestStacklessDivisionByZero(StacklessBackend, TestDivisionByZero): pass
+class TestStacklessBooleanLogicAndFunctions(StacklessBackend, TestBooleanLogicAndFunctions): pass
+class TestStacklessLexicalScopes(StacklessBackend, TestLexicalScopes): pass
+class TestStacklessIfExpressions(StacklessBackend, TestIfExpressions): pass
+
+
+class TestStacklessTailCalls(BaseTestInterpreter):
+
+    def create_interpreter(self):
+        return StacklessInterpreter()
+
+    def test_tail_recursive_if_loop(self):
+        self.run_test_case("defun loop(n, acc) { if n == 0 acc else loop(n - 1, acc + n) }", None)
+        self.run_test_case("loop(100000, 0)", 5000050000)
+
+    def test_tail_call_in_or_operand(self):
+        self.run_test_case("defun count(n) { n == 0 || count(n - 1) }", None)
+        self.run_test_case("count(100000)", True)
+
+    def test_deep_non_tail_recursion(self):
+        self.run_test_case("defun factorial(n) { n == 0 || n * factorial(n - 1) }", None)
+        self.run_test_case("factorial(3000) == factorial(3000)", True)
+
+    def test_frame_restored_after_error(self):
+        self.run_test_case("defun bad(x) { x / 0 }", None)
+        with self.assertRaises(ZeroDivisionError):
+            self.run_test_case("bad(1)", None)
+        self.assertIsNone(self.interpreter.frame)
+
+
+class TestOptimizer(BaseTestInterpreter):
+
+    def optimize(self, text):
+        optimizer = Optimizer()
+        tree = optimizer.optimize(Parser(Lexer(text).lex()).parse())
+        return tree, optimizer.removed
+
+    def test_constant_folding(self):
+        tree, removed = self.optimize("16 * (9/8)")
+        self.assertIsInstance(tree[0], Num)
+        self.assertEqual(tree[0].value, 16)
+        self.assertEqual(removed, 4)
+
+    def test_boolean_folding_keeps_bool_type(self):
+        tree, _ = self.optimize("(3 > 0) && (2 < 10)")
+        self.assertIs(tree[0].value, True)
+
+    def test_constant_if_collapses(self):
+        tree, _ = self.optimize("if False 1 else 2")
+        self.assertEqual(tree[0].value, 2)
+
+    def test_short_circuit_with_constant_left(self):
+        tree, _ = self.optimize("defun f(x) { False && x }")
+        self.assertIs(tree[0].body[0].value, False)
+        tree, _ = self.optimize("defun f(x) { True && x }")
+        self.assertIsInstance(tree[0].body[0], Var)
+
+    def test_identities(self):
+        tree, _ = self.optimize("defun f(x) { (x + 2) * 1 + 0 }")
+        self.assertEqual(tree[0].body[0].op.type, 'PLUS')
+        self.assertEqual(tree[0].body[0].right.value, 2)
+
+    def test_identity_kept_when_type_could_change(self):
+        tree, removed = self.optimize("defun f(x) { x * 1 }")
+        self.assertEqual(removed, 0)
+        self.interpreter.visit(tree)
+        self.run_test_case("f(True)", 1)
+
+    def test_division_by_zero_is_preserved(self):
+        tree, _ = self.optimize("10 / (2 - 2)")
+        with self.assertRaises(ZeroDivisionError):
+            self.interpreter.visit(tree)
+
+    def test_input_tree_is_not_modified(self):
+        tree = Parser(Lexer("defun f(x) { x + (1 + 2) }").lex()).parse()
+        Optimizer().optimize(tree)
+        self.assertIsInstance(tree[0].body[0].right, BinOp)
+
+    def test_program_results_unchanged(self):
+        with open('program.lambda') as file:
+            tree = Parser(Lexer(file.read()).lex()).parse()
+        optimized = Optimizer().optimize(tree)
+        results = []
+        for statements in (tree, optimized):
+            interpreter = Interpreter()
+            results.append([interpreter.visit(statement) for statement in statements])
+        self.assertEqual(results[0], results[1])
+
+
+
+class TestInliner(BaseTestInterpreter):
+
+    def optimize(self, text, **options):
+        self.inliner = Inliner(**options)
+        optimizer = Optimizer(self.inliner)
+        return optimizer.optimize(Parser(Lexer(text).lex()).parse())
+
+    def run_tree(self, tree, interpreter=None):
+        interpreter = interpreter or Interpreter()
+        return [interpreter.visit(statement) for statement in tree]
+
+    def test_function_arguments_are_inlined_in_turn(self):
+        tree = self.optimize("defun addone(x) { x + 1 }\ndefun applytwice(f, x) { f(f(x)) }\n"
+                             "defun g(y) { applytwice(addone, y) }\ng(5)")
+        body = tree[2].body[0]  # y + 1 + 1
+        self.assertEqual((body.op.type, body.right.value, body.left.op.type, body.left.right.value), ('PLUS', 1, 'PLUS', 1))
+        self.assertEqual(body.left.left.name, 'y')
+        self.assertEqual(self.run_tree(tree)[-1], 7)
+
+    def test_constant_arguments_are_folded(self):
+        tree = self.optimize("defun square(x) { x * x }\nsquare(3) + square(square(2))")
+        self.assertIsInstance(tree[1], Num)
+        self.assertEqual(tree[1].value, 25)
+
+    def test_inlined_code_keeps_its_offsets(self):
+        text = "defun addone(x) { x + 1 }\ndefun g(y) { addone(y) }"
+        tree = self.optimize(text)
+        self.assertEqual(tree[1].body[0].offset, text.index('x + 1'))
+
+    def test_recursive_functions_are_not_inlined(self):
+        tree = self.optimize("defun fact(n) { n == 0 || n * fact(n - 1) }\n"
+                             "defun even(n) { n == 0 || odd(n - 1) }\ndefun odd(n) { n != 0 && even(n - 1) }\n"
+                             "fact(5)\neven(4)")
+        self.assertIsInstance(tree[3], Call)
+        self.assertIsInstance(tree[4], Call)
+        self.assertEqual(self.run_tree(tree)[3:], [120, True])
+
+    def test_arguments_that_could_fail_keep_their_evaluation(self):
+        # b is never used, and b - a would evaluate the arguments in the other order
+        tree = self.optimize("defun first(a, b) { a }\ndefun sub(a, b) { b - a }\nfirst(1, 1 / 0)\nsub(1 % 0, 1 / 0)")
+        self.assertEqual(self.inliner.inlined, 0)
+        self.assertIsInstance(tree[2], Call)
+        self.assertIsInstance(tree[3], Call)
+        with self.assertRaises(ZeroDivisionError):
+            self.run_tree(tree)
+
+    def test_argument_used_once_in_order_is_inlined(self):
+        tree = self.optimize("defun addone(x) { x + 1 }\ndefun g(y) { addone(y * 2) }")
+        self.assertEqual(self.inliner.inlined, 1)
+        self.assertEqual(tree[1].body[0].left.op.type, 'MUL')
+
+    def test_redefined_functions_are_not_inlined(self):
+        tree = self.optimize("defun f(x) { x + 1 }\nf(1)\ndefun f(x) { x + 2 }\nf(1)")
+        self.assertEqual(self.inliner.inlined, 0)
+        self.assertEqual(self.run_tree(tree), [None, 2, None, 3])
+
+    def test_captured_names_are_not_inlined(self):
+        tree = self.optimize("defun g(x) { y + x }\ndefun h(y) { g(1) }")
+        self.assertIsInstance(tree[1].body[0], Call)
+
+    def test_constants_are_not_substituted_as_callees(self):
+        tree = self.optimize("defun ap(f, x) { f(x) }\nap(3, 4)\n"
+                             "defun big(f, n) { f(n) + f(n + 1) + f(n + 2) + f(n * 3) + f(n - 4) + n }\nbig(3, 4)")
+        self.assertEqual(self.inliner.inlined, 0)
+        self.assertEqual(tree[1].func.name, 'ap')
+        nodes = [node for statement in tree for node in inliner.walk(statement)]
+        self.assertFalse([node for node in nodes if isinstance(node, Call) and isinstance(node.func, Num)])
+        self.assertIn(['f'], [node.params for node in nodes if isinstance(node, Function)])  # big_4 keeps f
+        with self.assertRaises(TypeError):
+            self.run_tree(tree)
+
+    def test_size_and_budget_limits(self):
+        text = "defun addtwo(x) { x + 1 + 1 }\ndefun g(y) { addtwo(y) }"
+        self.assertIsInstance(self.optimize(text, max_size=4)[1].body[0], Call)
+        self.assertIsInstance(self.optimize(text, budget=1)[1].body[0], Call)  # 5 nodes replace 3
+        self.assertIsInstance(self.optimize(text)[1].body[0], BinOp)
+
+    def test_large_functions_are_specialized(self):
+        tree = self.optimize("defun addone(x) { x + 1 }\n"
+                             "defun big(f, n) { f(n) + f(n + 1) + f(n + 2) + f(n * 3) + f(n - 4) + n }\n"
+                             "defun h(m) { big(addone, m) }\nh(7)")
+        self.assertEqual(self.inliner.specialized, 1)
+        self.assertEqual((tree[2].name, tree[2].params), ('big_addone', ['n']))
+        self.assertEqual(tree[2].body[0].right.name, 'n')  # addone(n - 4) + n, with addone inlined
+        self.assertIsInstance(tree[2].body[0].left.right, BinOp)
+        self.assertEqual(tree[3].body[0].func.name, 'big_addone')
+        self.assertEqual(self.run_tree(tree)[-1], 60)
+
+    def test_open_world_leaves_definitions_alone(self):
+        text = "defun addone(x) { x + 1 }\ndefun g(y) { addone(y) }\naddone(1)\ndefun addone(x) { x + 2 }\naddone(1)"
+        tree = self.optimize(text, closed=False)
+        self.assertIsInstance(tree[1].body[0], Call)
+        self.assertEqual([tree[2].value, tree[4].value], [2, 3])
+
+    def test_program_results_unchanged_on_every_backend(self):
+        with open('program.lambda') as file:
+            tree = Parser(Lexer(file.read()).lex()).parse()
+        expected = self.run_tree(tree)
+        for interpreter in (Interpreter, ClosureInterpreter, VMInterpreter, StacklessInterpreter):
+            with self.subTest(backend=interpreter.__name__):
+                optimized = Optimizer(Inliner()).optimize(tree)
+                results = [value for value in self.run_tree(optimized, interpreter()) if value is not None]
+                self.assertEqual(results, [value for value in expected if value is not None])
+
+class TestMemoization(BaseTestInterpreter):
+
+    def create_interpreter(self):
+        return Interpreter(memoize=True, memo_size=64)
+
+    def test_naive_fibonacci_is_memoized(self):
+        self.run_test_case("defun fib(n) { if n < 2 n else fib(n - 1) + fib(n - 2) }", None)
+        self.run_test_case("fib(60)", 1548008755920)
+        stats = self.interpreter.memo.stats()['fib']
+        self.assertEqual(stats['misses'], 61)
+        self.assertEqual(stats['hits'], 58)
+
+    def test_lru_eviction(self):
+        self.interpreter = type(self.interpreter)(memoize=True, memo_size=2)
+        self.run_test_case("defun square(x) { x * x }", None)
+        for text in ("square(1)", "square(2)", "square(3)", "square(1)"):
+            self.interpreter.visit(Parser(Lexer(text).lex()).parse())
+        stats = self.interpreter.memo.stats()['square']
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (0, 4, 2))
+
+    def test_bool_and_int_arguments_are_distinct(self):
+        self.run_test_case("defun same(x) { x }", None)
+        self.run_test_case("same(1)", 1)
+        result = self.interpreter.visit(Parser(Lexer("same(True)").lex()).parse())
+        self.assertIs(result, True)
+
+    def test_redefinition_invalidates_dependents(self):
+        self.run_test_case("defun g(x) { x + 1 }", None)
+        self.run_test_case("defun f(x) { g(x) }", None)
+        self.run_test_case("f(1)", 2)
+        self.run_test_case("defun g(x) { x + 100 }", None)
+        self.run_test_case("f(1)", 101)
+
+    def test_impure_functions_are_not_memoized(self):
+        calls = []
+        self.interpreter.global_scope['probe'] = lambda x: calls.append(x) or x
+        self.run_test_case("defun f(x) { probe(x) }", None)
+        self.run_test_case("f(1)", 1)
+        self.run_test_case("f(1)", 1)
+        self.assertEqual(calls, [1, 1])
+        self.assertNotIn('f', self.interpreter.memo.stats())
+
+    def test_purity_analysis(self):
+        self.run_test_case("defun a(x) { x + 1 }", None)
+        self.run_test_case("defun b(x) { a(x) * 2 }", None)
+        self.run_test_case("defun c(x) { x + y }", None)
+        self.run_test_case("defun d(x) { c(x) }", None)
+        self.run_test_case("defun e(f, x) { f(x) }", None)
+        self.assertEqual(pure_functions(self.interpreter.global_scope), {'a', 'b', 'e'})
+
+    def test_lambdas_are_called_without_memo_tables(self):
+        self.run_test_case("lambd(x) ( x * x )(4)", 16)
+        self.run_test_case("lambd(x) ( x * x )(4)", 16)
+        self.assertEqual(self.interpreter.memo.stats(), {})
+
+    def test_calls_with_impure_function_arguments_are_not_memoized(self):
+        calls = []
+        self.interpreter.global_scope['probe'] = lambda x: calls.append(x) or x
+        self.run_test_case("defun e(f, x) { f(x) }", None)
+        self.run_test_case("defun g(x) { probe(x) }", None)
+        self.run_test_case("defun h(x) { x + 1 }", None)
+        for _ in range(2):
+            self.run_test_case("e(probe, 1)", 1)
+            self.run_test_case("e(g, 2)", 2)
+            self.run_test_case("e(h, 4)", 5)
+        self.assertEqual(calls, [1, 2, 1, 2])
+        self.assertEqual(self.interpreter.memo.stats()['e']['hits'], 1)  # e(h, 4)
+
+
+class TestStacklessMemoization(TestMemoization):
+
+    def create_interpreter(self):
+        return StacklessInterpreter(memoize=True, memo_size=64)
+
+
+@unittest.skipIf(vectorize.np is None, "numpy is not installed")
+class TestVectorize(BaseTestInterpreter):
+
+    def setUp(self):
+        super().setUp()
+        self.run_test_case("defun iseven(n) { if n == 0 True else isodd(n - 1) }", None)
+        self.run_test_case("defun isodd(n) { if n == 0 False else iseven(n - 1) }", None)
+        self.run_test_case("defun even(n) { n % 2 == 0 }", None)
+        self.run_test_case("defun score(n, k) { if even(n) && n > k n / k else 0 - n }", None)
+        self.run_test_case("defun safe(n) { if n == 0 0 else 100 / n }", None)
+        self.run_test_case("defun either(n) { n > 3 || -n + !n }", None)
+        self.run_test_case("defun positive(n) { if n > 0 n }", None)
+        self.vectorizer = vectorize.Vectorizer(self.interpreter)
+
+    # Compare a vectorized call with calling the function once per element
+    def assert_matches_scalar(self, name, *arrays):
+        func = self.interpreter.global_scope[name]
+        expected = [self.interpreter.apply(func, list(row)) for row in zip(*[list(array) for array in arrays])]
+        self.assertEqual(self.vectorizer.call(func, *arrays).tolist(), expected)
+
+    def test_operators_and_calls(self):
+        numbers = vectorize.np.arange(-20, 20)
+        self.assert_matches_scalar('even', numbers)
+        self.assert_matches_scalar('score', numbers, vectorize.np.full(len(numbers), 3))
+        self.assert_matches_scalar('either', numbers)
+
+    def test_branches_only_see_their_elements(self):
+        self.assert_matches_scalar('safe', vectorize.np.arange(-5, 5))
+
+    def test_division_by_zero_is_raised(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.vectorizer.call(self.interpreter.global_scope['score'], [4], [0])
+
+    def test_recursive_calls_fall_back_to_interpreter(self):
+        self.assert_matches_scalar('iseven', vectorize.np.arange(12))
+        # Only the recursive call runs per element; the body itself is still vectorized
+        with mock.patch.object(self.vectorizer, 'scalar') as scalar:
+            self.vectorizer.call(self.interpreter.global_scope['iseven'], vectorize.np.arange(12))
+        scalar.assert_not_called()
+
+    def test_unvectorizable_body_runs_per_element(self):
+        self.assert_matches_scalar('positive', vectorize.np.arange(-3, 3))
+        with mock.patch.object(self.vectorizer, 'scalar') as scalar:
+            self.vectorizer.call(self.interpreter.global_scope['positive'], [1])
+        scalar.assert_called_once()
+
+    def test_argument_checks(self):
+        with self.assertRaises(TypeError):
+            self.vectorizer.call(self.interpreter.global_scope['even'], [1], [2])
+        with self.assertRaises(ValueError):
+            self.vectorizer.call(self.interpreter.global_scope['score'], [1, 2], [3])
+
+
+class TestInlineCaches(BaseTestInterpreter):
+
+    def call(self, text):
+        (node,) = Parser(Lexer(text).lex()).parse()
+        return node
+
+    def test_call_site_skips_the_lookup_once_cached(self):
+        self.run_test_case("defun seven() { 7 }", None)
+        node = self.call("seven()")
+        self.assertEqual(self.interpreter.visit(node), 7)
+        self.assertIs(node.cache.func, self.interpreter.global_scope['seven'])
+        with mock.patch.object(self.interpreter, 'visit_var') as visit_var:
+            self.assertEqual(self.interpreter.visit(node), 7)
+        visit_var.assert_not_called()
+
+    def test_redefinition_invalidates_call_sites(self):
+        self.run_test_case("defun g(x) { x + 1 }", None)
+        self.run_test_case("defun f(x) { g(x) }", None)
+        node = self.call("f(2)")
+        self.assertEqual(self.interpreter.visit(node), 3)
+        self.run_test_case("defun g(x) { x * 10 }", None)
+        self.assertEqual(self.interpreter.visit(node), 20)
+        self.run_test_case("defun f(x, y) { x }", None)
+        with self.assertRaises(TypeError):
+            self.interpreter.visit(node)
+
+    def test_caches_are_per_interpreter(self):
+        node = self.call("h(5)")
+        other = Interpreter()
+        self.run_test_case("defun h(x) { x + 1 }", None)
+        other.visit(Parser(Lexer("defun h(x) { x * 2 }").lex()).parse())
+        self.assertEqual(self.interpreter.visit(node), 6)
+        self.assertEqual(other.visit(node), 10)
+        self.assertEqual(self.interpreter.visit(node), 6)
+
+    def test_parameters_and_lambdas_are_not_cached(self):
+        self.run_test_case("defun inc(x) { x + 1 }", None)
+        self.run_test_case("defun apply(f, x) { f(x) }", None)
+        self.run_test_case("apply(inc, 1)", 2)
+        self.assertIsNone(self.interpreter.global_scope['apply'].body[0].cache)
+
+    def test_cache_is_not_pickled(self):
+        self.run_test_case("defun inc(x) { x + 1 }", None)
+        node = self.call("inc(1)")
+        self.interpreter.visit(node)
+        self.assertIsNone(pickle.loads(pickle.dumps(node)).cache)
+
+
+class TestProfiler(unittest.TestCase):
+    source = ("defun inc(x) { x + 1 }\n"
+              "defun twice(x) { inc(inc(x)) }\n"
+              "defun fact(n) { if n == 0 1 else n * fact(n - 1) }\n"
+              "twice(1) + fact(5)\n"
+              "lambd(y) ( twice(y) )(3)\n")
+
+    def setUp(self):
+        self.interpreter = ProfilingInterpreter(source=self.source)
+        self.results = [self.interpreter.visit(statement) for statement in Parser(Lexer(self.source).lex()).parse()]
+
+    def test_results_are_unchanged(self):
+        self.assertEqual(self.results, [None, None, None, 123, 5])
+
+    def test_nodes_carry_source_positions(self):
+        (statement,) = Parser(Lexer("1 +\n  f(x, -y)").lex()).parse()
+        lexer = Lexer("1 +\n  f(x, -y)")
+        self.assertEqual(lexer.position(statement.offset), (1, 1))
+        self.assertEqual(lexer.position(statement.right.offset), (2, 3))
+        self.assertEqual(lexer.position(statement.right.args[1].offset), (2, 8))
+
+    def test_call_counts_and_times(self):
+        functions = self.interpreter.functions
+        self.assertEqual({name: stats.calls for name, stats in functions.items()},
+                         {'inc': 4, 'twice': 2, 'fact': 6, '<lambda 5:1>': 1})
+        for stats in functions.values():
+            self.assertLessEqual(stats.exclusive, stats.inclusive + 1e-9)
+        self.assertGreaterEqual(functions['twice'].inclusive, functions['twice'].exclusive)
+
+    def test_node_hits_and_report(self):
+        report = self.interpreter.report()
+        self.assertIn("Functions by exclusive time:", report)
+        self.assertRegex(report, r"\n +6  3:20 +BinOp ==")
+        self.assertRegex(report, r"\n +4  1:16 +BinOp \+")
+
+    def test_callees_are_counted_on_inline_cache_hits(self):
+        calls = [node for node in self.interpreter.hits if isinstance(node, Call)]
+        for call in calls:
+            if isinstance(call.func, Var):
+                self.assertEqual(self.interpreter.hits[call.func], self.interpreter.hits[call], call.func.name)
+
+    def test_collapsed_stacks(self):
+        stacks = dict(line.rsplit(' ', 1) for line in self.interpreter.collapsed().splitlines())
+        self.assertIn('twice;inc', stacks)
+        self.assertIn('<lambda 5:1>;twice;inc', stacks)
+        self.assertIn('fact;fact;fact', stacks)
+        self.assertTrue(all(int(value) > 0 for value in stacks.values()))
+
+    def test_plain_interpreter_is_not_instrumented(self):
+        self.assertIs(Interpreter.visit, Interpreter.__dict__['visit'])
+        self.assertFalse(hasattr(Interpreter(), 'hits'))
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_workloads_run_on_every_backend(self):
+        for name, workload in WORKLOADS.items():
+            tree = Parser(Lexer(workload()).lex()).parse()
+            results = {}
+            for backend in ('tree', 'closure', 'vm'):
+                interpreter = backends.create_interpreter(backend)
+                results[backend] = [interpreter.visit(statement) for statement in tree]
+            self.assertEqual(results['closure'], results['tree'], name)
+            self.assertEqual(results['vm'], results['tree'], name)
+
+    def test_results_layout(self):
+        results = run_benchmarks(['recursion'], repeat=2, warmup=0)
+        self.assertEqual(sorted(results['results']), sorted(f'recursion/{phase}' for phase in PHASES))
+        summary = results['results']['recursion/run']
+        self.assertEqual(len(summary['runs']), 2)
+        self.assertLessEqual(summary['min'], summary['median'])
+        self.assertEqual(results['meta']['backend'], 'tree')
+        with self.assertRaises(ValueError):
+            run_benchmarks(['missing'])
+
+    def test_compare_flags_regressions(self):
+        old = {'results': {'a/run': {'median': 1.0}, 'b/run': {'median': 1.0}, 'c/run': {'median': 1.0}}}
+        new = {'results': {'a/run': {'median': 1.5}, 'b/run': {'median': 1.05}, 'c/run': {'median': 0.5}}}
+        statuses = {row[0]: row[4] for row in compare_results(old, new)}
+        self.assertEqual(statuses, {'a/run': 'regression', 'b/run': 'same', 'c/run': 'improvement'})
+
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = server.Server(workers=4)
+        listener = await self.server.start()
+        self.port = listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.addCleanup(writer.close)
+        return reader, writer
+
+    async def receive(self, reader):
+        return json.loads(await reader.readline())
+
+    async def test_pipelined_requests_share_a_session(self):
+        reader, writer = await self.connect()
+        requests = [
+            {'id': 1, 'code': "defun double(x) { x * 2 }"},
+            {'id': 2, 'code': "double(21)"},
+            {'id': 3, 'code': "5 / 0"},
+            {'id': 4, 'code': "double(2) == 4"},
+        ]
+        writer.write(b''.join(server.encode(request) for request in requests))
+        responses = [await self.receive(reader) for _ in requests]
+        self.assertEqual(responses[0], {'id': 1, 'ok': True, 'result': None})
+        self.assertEqual(responses[1], {'id': 2, 'ok': True, 'result': 42})
+        self.assertEqual(responses[2], {'id': 3, 'ok': False, 'error': "ZeroDivisionError: integer division or modulo by zero"})
+        self.assertEqual(responses[3], {'id': 4, 'ok': True, 'result': True})
+
+    async def test_sessions_are_separate(self):
+        first, first_writer = await self.connect()
+        second, second_writer = await self.connect()
+        first_writer.write(server.encode({'id': 'a', 'code': "defun f() { 1 }"}))
+        self.assertTrue((await self.receive(first))['ok'])
+        second_writer.write(server.encode({'id': 'b', 'code': "f()"}))
+        self.assertEqual(await self.receive(second), {'id': 'b', 'ok': False, 'error': "NameError: Undefined variable: f"})
+
+    async def test_invalid_request(self):
+        reader, writer = await self.connect()
+        writer.write(b'{"code": 1}\nnot json\n')
+        for _ in range(2):
+            response = await self.receive(reader)
+            self.assertFalse(response['ok'])
+            self.assertTrue(response['error'].startswith("ValueError: Invalid request"))
+
+    async def test_slow_request_does_not_block_other_connections(self):
+        slow, slow_writer = await self.connect()
+        fast, fast_writer = await self.connect()
+        slow_writer.write(server.encode({'id': 'slow', 'code':
+                                         "defun fib(n) { if n < 2 n else fib(n - 1) + fib(n - 2) } fib(19)"}))
+        await asyncio.sleep(0.01)
+        fast_writer.write(server.encode({'id': 'fast', 'code': "1 + 1"}))
+        self.assertEqual(await self.receive(fast), {'id': 'fast', 'ok': True, 'result': 2})
+        self.assertEqual(await self.receive(slow), {'id': 'slow', 'ok': True, 'result': 4181})
+
+    def test_closing_a_session_releases_the_pool(self):
+        session = server.Session()
+        self.addCleanup(parallel.shutdown)
+        session.interpreter.parallel.workers = 2
+        session.evaluate("defun double(n) { n * 2 }")
+        self.assertEqual(session.evaluate("len(pmap(double, range(300)))"), 300)
+        self.assertIsNotNone(session.interpreter.parallel.pool)
+        session.close()
+        self.assertIsNone(session.interpreter.parallel.pool)
+
+
+class TestParallel(BaseTestInterpreter):
+
+    @classmethod
+    def tearDownClass(cls):
+        parallel.shutdown()
+
+    def setUp(self):
+        super().setUp()
+        self.parallel = self.interpreter.parallel
+        self.parallel.workers, self.parallel.threshold = 2, 4
+        self.addCleanup(self.parallel.close)
+        self.run_test_case("defun fib(n) { if n < 2 n else fib(n - 1) + fib(n - 2) }", None)
+        self.run_test_case("defun add(a, b) { a + b }", None)
+        self.run_test_case("defun offset(n) { n + shift }", None)
+
+    def test_pmap_runs_pure_functions_in_workers(self):
+        self.run_test_case("pmap(fib, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10)", PVector((1, 1, 2, 3, 5, 8, 13, 21, 34, 55)))
+        self.assertIsNotNone(self.parallel.pool)
+
+    def test_preduce_combines_chunks_in_order(self):
+        self.run_test_case("preduce(add, pmap(fib, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10))", 143)
+        self.assertIsNotNone(self.parallel.pool)
+        self.run_test_case("preduce(add, 4)", 4)
+        with self.assertRaises(TypeError):
+            self.run_test_case("preduce(add)", None)
+
+    def test_preduce_folds_non_associative_functions_from_the_left(self):
+        self.run_test_case("defun sub(a, b) { a - b }", None)
+        self.run_test_case("preduce(sub, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10)", -53)
+        self.assertIsNone(self.parallel.pool)
+
+    def test_small_inputs_run_serially(self):
+        self.run_test_case("pmap(fib, 5, 6)", PVector((5, 8)))
+        self.assertIsNone(self.parallel.pool)
+
+    def test_impure_functions_run_serially(self):
+        self.interpreter.global_scope['shift'] = 100
+        self.run_test_case("pmap(offset, 1, 2, 3, 4, 5)", PVector((101, 102, 103, 104, 105)))
+        self.assertIsNone(self.parallel.pool)
+
+    def test_results_are_not_numbers_with_or_without_optimization(self):
+        self.run_test_case("defun double(n) { n * 2 }", None)
+        for text in ["(pmap(double, 1, 2) + pmap(double, 3)) + 0", "(pmap(double, 1, 2) * 2) - 0"]:
+            tree = Parser(Lexer(text).lex()).parse()
+            for optimized in (tree, Optimizer(Inliner()).optimize(Parser(Lexer(text).lex()).parse())):
+                with self.subTest(text=text, optimized=optimized is not tree):
+                    with self.assertRaises(TypeError):
+                        self.interpreter.visit(optimized)
+
+    def test_interpreters_share_one_pool(self):
+        other = self.create_interpreter().parallel
+        other.workers = 2
+        self.addCleanup(other.close)
+        pool = self.parallel.executor()
+        self.assertIs(other.executor(), pool)
+        self.parallel.close()
+        self.assertIsNone(self.parallel.pool)
+        self.assertEqual(other.executor().submit(abs, -1).result(), 1)
+
+    def test_errors_in_workers_are_raised(self):
+        self.run_test_case("defun bad(n) { 10 / (n - 3) }", None)
+        with self.assertRaises(ZeroDivisionError):
+            self.run_test_case("pmap(bad, 1, 2, 3, 4, 5, 6)", None)
+
+
+class TestStacklessParallel(StacklessBackend, TestParallel): pass
+
+
+class TestStreams(BaseTestInterpreter):
+
+    def setUp(self):
+        super().setUp()
+        self.run_test_case("defun square(x) { x * x }", None)
+        self.run_test_case("defun iseven(x) { x % 2 == 0 }", None)
+        self.run_test_case("defun add(a, b) { a + b }", None)
+
+    def test_pipeline(self):
+        self.run_test_case("reduce(add, map(square, filter(iseven, range(10))))", 120)
+        self.run_test_case("reduce(add, range(1, 11, 3), 100)", 122)
+
+    def test_take_and_display(self):
+        stream = self.interpreter.visit(Parser(Lexer("take(3, map(square, range(100)))").lex()).parse())
+        self.assertIsInstance(stream, Stream)
+        self.assertEqual(list(stream), [0, 1, 4])
+        self.assertEqual(list(stream), [0, 1, 4])  # A stream can be consumed again
+        self.assertEqual(list(self.interpreter.streams.take(0, stream)), [])
+
+    def test_printing_computes_no_elements(self):
+        calls = []
+        self.interpreter.global_scope['probe'] = lambda x: calls.append(x) or x
+        self.run_test_case("defun never(x) { False }", None)
+        stream = self.interpreter.visit(Parser(Lexer("map(probe, filter(never, range(1000000000000)))").lex()).parse())
+        self.assertEqual(repr(stream), '<stream>')
+        self.assertEqual(calls, [])
+
+    def test_elements_are_computed_on_demand(self):
+        calls = []
+        stream = self.interpreter.streams.map(lambda x: calls.append(x) or x, self.interpreter.streams.range(10 ** 9))
+        self.assertEqual(list(self.interpreter.streams.take(3, stream)), [0, 1, 2])
+        self.assertEqual(calls, [0, 1, 2])
+
+    def test_lambdas_and_pmap_accept_streams(self):
+        square = self.interpreter.visit(Parser(Lexer("lambd(x) ( x * x )").lex()).parse())
+        streams = self.interpreter.streams
+        self.assertEqual(list(streams.map(square, streams.range(4))), [0, 1, 4, 9])
+        self.run_test_case("pmap(iseven, range(3))", PVector((True, False, True)))
+
+    def test_errors(self):
+        with self.assertRaises(TypeError):
+            self.run_test_case("map(add, range(3))", None)
+        with self.assertRaises(TypeError):
+            self.run_test_case("map(square, 5)", None)
+        with self.assertRaises(TypeError):
+            self.run_test_case("reduce(add, range(0))", None)
+        with self.assertRaises(ValueError):
+            self.run_test_case("take(0 - 1, range(3))", None)
+        self.run_test_case("reduce(add, range(0), 7)", 7)
+
+    def test_constant_memory(self):
+        streams = self.interpreter.streams
+        tracemalloc.start()
+        try:
+            total = streams.reduce(operator.add, streams.map(abs, streams.filter(bool, streams.range(10 ** 6))))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(total, sum(range(10 ** 6)))
+        self.assertLess(peak, 100000)
+
+    def test_defun_pipelines_run_in_constant_memory(self):
+        tree = Parser(Lexer("reduce(add, map(square, filter(iseven, range(20000))))").lex()).parse()
+        tracemalloc.start()
+        try:
+            total = self.interpreter.visit(tree)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(total, sum(x * x for x in range(0, 20000, 2)))
+        self.assertLess(peak, 100000)
+
+
+class TestStacklessStreams(StacklessBackend, TestStreams): pass
+
+
+class TestLists(BaseTestInterpreter):
+
+    def test_building_lists(self):
+        self.run_test_case("list()", PVector())
+        self.run_test_case("cons(1, append(list(2, 3), 4))", PVector([1, 2, 3, 4]))
+        self.run_test_case("concat(list(1, 2), list(True, 3))", PVector([1, 2, True, 3]))
+        self.run_test_case("nth(list(5, 6, 7), 1)", 6)
+        self.run_test_case("nth(list(5, 6, 7), 0 - 1)", 7)
+        self.run_test_case("len(list(5, 6, 7))", 3)
+
+    def test_recursive_list_functions(self):
+        self.run_test_case("defun fib(a, b, n) { if n == 0 list() else cons(a, fib(b, a + b, n - 1)) }", None)
+        self.run_test_case("fib(0, 1, 10)", PVector([0, 1, 1, 2, 3, 5, 8, 13, 21, 34]))
+        result = self.interpreter.visit(Parser(Lexer("fib(0, 1, 5)").lex()).parse())
+        self.assertEqual(repr(result), '[0, 1, 1, 2, 3]')
+
+    def test_with_streams_and_pmap(self):
+        self.run_test_case("defun double(x) { x * 2 }", None)
+        self.run_test_case("defun add(a, b) { a + b }", None)
+        self.run_test_case("reduce(add, map(double, list(1, 2, 3)))", 12)
+        self.run_test_case("pmap(double, list(1, 2, 3))", PVector((2, 4, 6)))
+
+    def test_errors(self):
+        with self.assertRaises(IndexError):
+            self.run_test_case("nth(list(1), 1)", None)
+        with self.assertRaises(TypeError):
+            self.run_test_case("cons(1, 2)", None)
+        with self.assertRaises(TypeError):
+            self.run_test_case("len(5)", None)
+
+    def test_lists_are_python_sequences(self):
+        vector = PVector(range(100))
+        self.assertEqual(vector[10:13], PVector([10, 11, 12]))
+        self.assertEqual(sum(vector), 4950)
+        self.assertIn(42, vector)
+        self.assertEqual(vector.index(42), 42)
+        self.assertEqual(list(reversed(vector))[:2], [99, 98])
+        self.assertEqual(pickle.loads(pickle.dumps(vector)), vector)
+        self.assertEqual(hash(vector), hash(PVector(range(100))))
+
+    def test_updates_share_structure(self):
+        scope = self.interpreter.global_scope
+        vector = PVector(range(10000))
+        longer = scope['append'](vector, -1)
+        joined = scope['concat'](vector, vector)
+        self.assertEqual(len(vector), 10000)  # The original list is unchanged
+        self.assertEqual((longer[-1], len(longer)), (-1, 10001))
+        self.assertIs(longer.root.left, vector.root.left)
+        self.assertEqual(list(joined), list(range(10000)) * 2)
+        for item in range(10000):
+            vector = scope['cons'](item, vector)
+        self.assertLessEqual(height(vector.root), 14)  # Stays balanced: about log2(20000 / 32)
+
+
+class TestStacklessLists(StacklessBackend, TestLists): pass
+
+
+class TestPreludeSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.prelude = self.path('prelude.lambda')
+        with open(self.prelude, 'w') as file:
+            file.write("defun square(x) { x * x }\ndefun twice(f, x) { f(f(x)) }\nsquare(3)\n")
+        self.snapshot = Snapshot.build(self.prelude, cache=False)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def run_code(self, interpreter, text):
+        return interpreter.visit(Parser(Lexer(text).lex()).parse())
+
+    def test_build_keeps_the_functions(self):
+        self.assertEqual(list(self.snapshot.functions), ['square', 'twice'])
+
+    def test_forks_on_every_backend(self):
+        for backend in backends.BACKENDS:
+            with self.subTest(backend=backend):
+                self.assertEqual(self.run_code(self.snapshot.fork(backend), "twice(square, 3)"), 81)
+
+    def test_forks_are_independent(self):
+        first, second = self.snapshot.fork(), self.snapshot.fork('stackless', memoize=True)
+        self.assertEqual(self.run_code(first, "square(4)"), 16)
+        self.run_code(first, "defun square(x) { x + x }")
+        self.assertEqual(self.run_code(first, "square(4)"), 8)
+        self.assertEqual(self.run_code(second, "square(4)"), 16)
+        self.assertEqual(self.run_code(self.snapshot.fork(), "square(4)"), 16)
+
+    def test_install_replaces_definitions(self):
+        interpreter = Interpreter()
+        self.run_code(interpreter, "defun square(x) { 0 } defun use() { square(5) }")
+        self.assertEqual(self.run_code(interpreter, "use()"), 0)  # Caches the call site's binding
+        self.snapshot.install(interpreter)
+        self.assertEqual(self.run_code(interpreter, "use()"), 25)
+
+    def test_save_and_load(self):
+        self.snapshot.save(self.path('prelude.snapshot'))
+        loaded = Snapshot.load(self.path('prelude.snapshot'))
+        self.assertEqual(self.run_code(loaded.fork(), "twice(square, 2)"), 16)
+        with open(self.path('other.snapshot'), 'wb') as file:
+            pickle.dump({'format': 'prelude-snapshot', 'version': -1}, file)
+        with self.assertRaises(ValueError):
+            Snapshot.load(self.path('other.snapshot'))
+        with self.assertRaises(ValueError):
+            Snapshot.load(self.prelude)
+        with self.assertRaises(ValueError):
+            Snapshot.capture(ClosureInterpreter())
+
+    def test_file_runner_and_server_sessions(self):
+        with open(self.path('main.lambda'), 'w') as file:
+            file.write("twice(square, 2)\n")
+        for stream in (False, True):
+            output = StringIO()
+            with redirect_stdout(output):
+                run_file(self.path('main.lambda'), stream=stream, cache=False, prelude=self.snapshot)
+            self.assertEqual(output.getvalue(), "16\n")
+        session = server.Session(prelude=self.snapshot)
+        self.assertEqual(session.evaluate("square(7)"), 49)
+        with self.assertRaises(ValueError):
+            run_file(self.path('main.lambda'), profile=True, prelude=self.snapshot)
+
+
+class TestSinks(unittest.TestCase):
+    PROGRAM = "defun double(x) { x * 2 } double(1) double(2) defun unused() { 0 } 1 == 1 double(3)"
+
+    def run_program(self, interpreter):
+        return interpreter.visit(Parser(Lexer(self.PROGRAM).lex()).parse())
+
+    def test_every_backend_writes_top_level_results(self):
+        for backend in backends.BACKENDS:
+            with self.subTest(backend=backend):
+                results = []
+                self.run_program(backends.create_interpreter(backend, output=CallbackSink(results.append)))
+                self.assertEqual(results, [2, 4, True, 6])
+
+    def test_function_bodies_are_not_collected(self):
+        results = []
+        interpreter = Interpreter(output=CallbackSink(results.append))
+        interpreter.visit(Parser(Lexer("defun f(n) { if n == 0 0 else f(n - 1) } f(50)").lex()).parse())
+        self.assertEqual(results, [0])
+
+    def test_interpreters_keep_no_results_by_default(self):
+        interpreter = StacklessInterpreter()
+        self.assertIsInstance(interpreter.output, NullSink)
+        self.assertEqual(self.run_program(interpreter), 6)
+
+    def test_ring_sink_keeps_the_last_results(self):
+        sink = RingSink(2)
+        self.run_program(Interpreter(output=sink))
+        self.assertEqual((list(sink), len(sink), sink.written), ([True, 6], 2, 4))
+        with self.assertRaises(ValueError):
+            RingSink(0)
+
+    def test_buffered_sink_writes_in_batches(self):
+        file = mock.Mock()
+        sink = BufferedSink(file, batch_size=3)
+        for result in range(7):
+            sink.write(result)
+        self.assertEqual([call.args[0] for call in file.write.call_args_list], ["0\n1\n2\n", "3\n4\n5\n"])
+        sink.close()
+        self.assertEqual(file.write.call_args_list[-1].args[0], "6\n")
+        self.assertEqual(file.flush.call_count, 3)
+        with self.assertRaises(ValueError):
+            BufferedSink(file, batch_size=0)
+
+    def test_results_before_an_error_are_printed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'error.lambda')
+        with open(path, 'w') as file:
+            file.write("1 + 1\n2 / 0\n")
+        for backend in backends.BACKENDS:
+            with self.subTest(backend=backend):
+                output = StringIO()
+                with redirect_stdout(output), self.assertRaises(ZeroDivisionError):
+                    run_file(path, backend, cache=False)
+                self.assertEqual(output.getvalue(), "2\n")
+
+
+class TestScheduler(unittest.TestCase):
+    FACTORIAL = "defun fact(n) { if n == 0 1 else n * fact(n - 1) } fact(20) fact(5)"
+    FOREVER = "defun forever(n) { forever(n + 1) } forever(0)"
+
+    def test_paused_evaluations_resume(self):
+        interpreter = StacklessInterpreter()
+        interpreter.visit(Parser(Lexer("defun fact(n) { if n == 0 1 else n * fact(n - 1) }").lex()).parse())
+        evaluation = Evaluation(Parser(Lexer("fact(10) + 1").lex()).parse()[0])
+        pauses = 0
+        while not interpreter.run(evaluation, 1):
+            pauses += 1
+            self.assertIsNone(interpreter.frame)  # The caller's frame is back while paused
+        self.assertEqual(evaluation.value, 3628801)
+        self.assertEqual((pauses, evaluation.steps), (11, 11))  # One step per call
+
+    def test_programs_run_side_by_side(self):
+        scheduler = Scheduler(time_slice=50)
+        slow = scheduler.spawn(self.FACTORIAL * 20, name='slow', output=RingSink())
+        fast = scheduler.spawn(self.FACTORIAL, name='fast', output=RingSink())
+        while not fast.done:
+            scheduler.tick()
+        self.assertFalse(slow.done)  # The first program did not run to completion before the second got a turn
+        self.assertLessEqual(slow.steps, fast.steps + 50)
+        scheduler.run()
+        self.assertEqual(list(fast.output), [2432902008176640000, 120])
+        self.assertEqual(slow.output.written, 40)
+        self.assertIsNone(slow.error)
+
+    def test_step_budget(self):
+        scheduler = Scheduler(time_slice=100)
+        endless = scheduler.spawn(self.FOREVER, max_steps=1000)
+        other = scheduler.spawn(self.FACTORIAL, output=RingSink())
+        scheduler.run()
+        self.assertIsInstance(endless.error, BudgetExceeded)
+        self.assertEqual(endless.steps, 1000)
+        self.assertEqual(list(other.output), [2432902008176640000, 120])
+
+    def test_memory_budget(self):
+        scheduler = Scheduler(time_slice=10)
+        deep = scheduler.spawn("defun count(n) { if n == 0 0 else 1 + count(n - 1) } count(100000)", max_stack=500)
+        shallow = scheduler.spawn("defun count(n) { if n == 0 0 else 1 + count(n - 1) } count(100)", max_stack=500,
+                                  output=RingSink())
+        scheduler.run()
+        self.assertIsInstance(deep.error, BudgetExceeded)
+        self.assertEqual(list(shallow.output), [100])
+
+    def test_budgets_cover_calls_from_built_ins(self):
+        scheduler = Scheduler(time_slice=10)
+        endless = scheduler.spawn("defun add(a, b) { a + b } reduce(add, range(300000))", max_steps=100)
+        other = scheduler.spawn("defun add(a, b) { a + b } reduce(add, range(10))", output=RingSink())
+        deep = scheduler.spawn("defun count(n) { if n == 0 0 else 1 + count(n - 1) } "
+                               "pmap(count, 100000)", max_stack=500)
+        scheduler.run()
+        self.assertIsInstance(endless.error, BudgetExceeded)
+        self.assertEqual(endless.steps, 100)
+        self.assertEqual((list(other.output), other.steps), ([45], 9))
+        self.assertIsInstance(deep.error, BudgetExceeded)
+
+    def test_results_are_written_to_each_task_sink_as_they_finish(self):
+        scheduler = Scheduler(time_slice=50)
+        results = []
+        slow = scheduler.spawn(self.FACTORIAL * 20, output=CallbackSink(lambda result: results.append('slow')))
+        fast = scheduler.spawn(self.FACTORIAL, output=CallbackSink(lambda result: results.append('fast')))
+        while not fast.done:
+            scheduler.tick()
+        self.assertEqual(results.count('fast'), 2)
+        self.assertLess(results.count('slow'), 40)
+        scheduler.run()
+        self.assertEqual(results.count('slow'), 40)
+        self.assertIsNone(slow.error)
+
+    def test_built_ins_do_not_starve_other_programs(self):
+        scheduler = Scheduler(time_slice=50)
+        results = []
+        scheduler.spawn("defun add(a, b) { a + b } reduce(add, range(20000))",
+                        output=CallbackSink(lambda result: results.append(('long', result))))
+        scheduler.spawn(self.FACTORIAL, output=CallbackSink(lambda result: results.append(('fact', result))))
+        scheduler.run()
+        self.assertEqual(results, [('fact', 2432902008176640000), ('fact', 120), ('long', 199990000)])
+
+    def test_programs_are_isolated(self):
+        scheduler = Scheduler()
+        failing = scheduler.spawn("defun f(x) { 1 / x } f(0)")
+        other = scheduler.spawn("f(0)")
+        scheduler.run()
+        self.assertIsInstance(failing.error, ZeroDivisionError)
+        self.assertIsInstance(other.error, NameError)
+        with self.assertRaises(ValueError):
+            Scheduler(time_slice=0)
+
+
 if __name__ == '__main__':
     unittest.main()
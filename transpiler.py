@@ -0,0 +1,184 @@
+# Token Types
+INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
+    AND, OR, NOT, EQ, NEQ, GT, LT, GEQ, LEQ, \
+    ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
+    'INTEGER', 'BOOLEAN', 'PLUS', 'MINUS', 'MUL', 'DIV', 'MOD', 'LPAREN', 'RPAREN',
+    'AND', 'OR', 'NOT', 'EQ', 'NEQ', 'GT', 'LT', 'GEQ', 'LEQ',
+    'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
+)
+
+import hashlib
+import keyword
+import os
+
+import cache
+from parser import Function
+from sinks import NullSink
+
+# Bump whenever the generated code changes shape, so stale cached modules are regenerated
+TRANSPILER_VERSION = 3
+
+# Python spelling of every binary operator. && and || map to `and`/`or`, which return
+# the deciding operand exactly like the interpreter does, and DIV keeps its integer division
+PYTHON_OPERATORS = {
+    PLUS: '+', MINUS: '-', MUL: '*', DIV: '//', MOD: '%',
+    AND: 'and', OR: 'or',
+    EQ: '==', NEQ: '!=', GT: '>', LT: '<', GEQ: '>=', LEQ: '<=',
+}
+
+# Python spelling of the unary operators
+PYTHON_UNARY_OPERATORS = {MINUS: '-', NOT: 'not '}
+
+
+# The Transpiler turns the AST into Python source code, one `def` per defun.
+# Every operation is fully parenthesised so Python's precedence and comparison chaining never apply.
+class Transpiler:
+    # Translate a list of top-level statements into the source of a Python module.
+    # Expression statements report their value through `_emit`, which the runner provides
+    def transpile(self, statements):
+        lines = []
+        for statement in statements:
+            if isinstance(statement, Function):
+                lines.extend(self.visit_function(statement))
+            else:
+                lines.append(f'_emit({self.visit(statement)})')
+        return '\n'.join(lines) + '\n'
+
+    # Main visit method that dispatches to the appropriate visit method and returns a Python expression
+    def visit(self, node):
+        method_name = f'visit_{type(node).__name__.lower()}'
+        method = getattr(self, method_name, self.generic_visit)
+        return method(node)
+
+    # Generic visit method that raises an error if no specific visit method is found
+    def generic_visit(self, node):
+        raise Exception(f'No visit_{type(node).__name__} method')
+
+    # Language identifiers cannot contain '_' and the names of the inliner's specialized functions never
+    # end with one, so a trailing one safely avoids Python keywords
+    def name(self, identifier):
+        if keyword.iskeyword(identifier) or keyword.issoftkeyword(identifier):
+            return identifier + '_'
+        return identifier
+
+    # Numbers and booleans are emitted as Python literals
+    def visit_num(self, node):
+        return repr(node.value)
+
+    def visit_bool(self, node):
+        return repr(node.value)
+
+    # Variables become plain Python names - parameters are locals, everything else a module global
+    def visit_var(self, node):
+        return self.name(node.name)
+
+    # Visit a binary operation node and emit the equivalent Python operator
+    def visit_binop(self, node):
+        return f'({self.visit(node.left)} {PYTHON_OPERATORS[node.op.type]} {self.visit(node.right)})'
+
+    # Visit a unary operation node (negation or logical NOT)
+    def visit_unaryop(self, node):
+        return f'({PYTHON_UNARY_OPERATORS[node.op.type]}{self.visit(node.expr)})'
+
+    # A defun becomes a real Python function; every statement of the body runs and the last one is returned
+    def visit_function(self, node):
+        params = ', '.join(self.name(param) for param in node.params)
+        body = node.body if isinstance(node.body, list) else [node.body]
+        lines = [f'def {self.name(node.name)}({params}):']
+        for statement in body[:-1]:
+            lines.append(f'    {self.visit(statement)}')
+        lines.append(f'    return {self.visit(body[-1]) if body else None}')
+        return lines
+
+    # A lambda becomes a Python lambda, which checks its argument count on its own
+    def visit_lambda(self, node):
+        params = ', '.join(self.name(param) for param in node.params)
+        return f'(lambda {params}: {self.visit(node.body)})'
+
+    # Visit a function call node
+    def visit_call(self, node):
+        args = ', '.join(self.visit(arg) for arg in node.args)
+        return f'{self.visit(node.func)}({args})'
+
+    # The if form is an expression, and a missing else branch evaluates to None
+    def visit_if(self, node):
+        else_branch = 'None' if node.else_branch is None else self.visit(node.else_branch)
+        return f'({self.visit(node.then_branch)} if {self.visit(node.condition)} else {else_branch})'
+
+
+# Runs programs as native Python code objects produced by the Transpiler
+class PythonInterpreter:
+    def __init__(self, output=None):
+        # Module namespace shared by every run, with no Python builtins so unknown names raise NameError
+        self.global_scope = {'__builtins__': {}}
+        self.output = output if output is not None else NullSink()  # Sink for the results of top-level statements
+        self.source = None  # Generated Python source of the last program run, for inspection
+        self.last = None   # Value of the last expression statement run
+
+    # Transpile, compile and execute a statement or a list of statements, mirroring Interpreter.visit
+    def visit(self, node):
+        statements = node if isinstance(node, list) else [node]
+        source = Transpiler().transpile(statements)
+        result = self.run_code(compile(source, '<lambda>', 'exec'), source)
+        if not statements or isinstance(statements[-1], Function):
+            return None
+        return result
+
+    # Execute a compiled module and return the value of its last expression statement
+    def run_code(self, code, source):
+        self.source = source
+        self.last = None
+        self.global_scope['_emit'] = self.emit
+        exec(code, self.global_scope)
+        return self.last
+
+    # Receive the value of an expression statement as the module runs, so results reach the sink right away
+    def emit(self, value):
+        self.last = value
+        if value is not None:
+            self.output.write(value)
+
+    # Run a .lambda file through its cached Python module and return the value of its last expression statement
+    def run_file(self, file_path, optimize=False):
+        code, source = load_file(file_path, optimize)
+        return self.run_code(code, source)
+
+
+# Path of the generated module cached for a source file
+def cache_path(file_path):
+    return cache.cache_path(file_path, '.py')
+
+
+# Return the (code object, Python source) for a .lambda file, reusing the cached module
+# when it was generated from the same source text by the same transpiler version and optimizer setting
+def load_file(file_path, optimize=False):
+    with open(file_path, 'rb') as file:
+        code = file.read()
+    header = f'# Generated from {os.path.basename(file_path)} ' \
+             f'(transpiler {TRANSPILER_VERSION}, sha256 {hashlib.sha256(code).hexdigest()}' \
+             f'{", optimized" if optimize else ""})\n'
+    path = cache_path(file_path)
+
+    try:
+        with open(path, 'r') as file:
+            source = file.read()
+        if not source.startswith(header):
+            source = None
+    except OSError:
+        source = None
+
+    if source is None:
+        tree, _ = cache.load_program(file_path, optimize)
+        source = header + Transpiler().transpile(tree)
+        cache.atomic_write(path, source.encode())
+
+    return compile(source, path, 'exec'), source
+
+
+# Print the Python module generated for a .lambda file
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) == 2:
+        print(load_file(sys.argv[1])[1], end='')
+    else:
+        print("Usage: python transpiler.py <program.lambda>")
@@ -0,0 +1,237 @@
+# Token Types
+INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
+    AND, OR, NOT, EQ, NEQ, GT, LT, GEQ, LEQ, \
+    ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
+    'INTEGER', 'BOOLEAN', 'PLUS', 'MINUS', 'MUL', 'DIV', 'MOD', 'LPAREN', 'RPAREN',
+    'AND', 'OR', 'NOT', 'EQ', 'NEQ', 'GT', 'LT', 'GEQ', 'LEQ',
+    'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
+)
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: only vectorized evaluation needs it
+    np = None
+
+from interpreter import Interpreter
+from parser import BinOp, UnaryOp, Num, Bool, Var, Function, Call, If
+from resolver import children
+
+# Binary operators resolved to the NumPy ufuncs with the same semantics on integers
+# (floor_divide and mod round like Python's // and %)
+if np is not None:
+    VECTOR_OPERATORS = {
+        PLUS: np.add,
+        MINUS: np.subtract,
+        MUL: np.multiply,
+        DIV: np.floor_divide,
+        MOD: np.mod,
+        EQ: np.equal,
+        NEQ: np.not_equal,
+        GT: np.greater,
+        LT: np.less,
+        GEQ: np.greater_equal,
+        LEQ: np.less_equal,
+    }
+
+# Operators whose operands are used as integers (booleans count as 0 and 1, like in Python)
+ARITHMETIC = (PLUS, MINUS, MUL, DIV, MOD)
+
+
+# Raised when a body uses something that has no element-wise form; the whole call then runs element by element
+class Unvectorizable(Exception):
+    pass
+
+
+# The Vectorizer evaluates a defun function over whole arrays of arguments at once: the body is
+# walked a single time, and every operation is applied to all elements by a NumPy ufunc.
+# - arithmetic and comparisons map to ufuncs,
+# - && and || keep the left operand where it decides the result, and evaluate the right operand
+#   only for the remaining elements,
+# - if expressions use np.where when neither branch can fail, and otherwise evaluate each branch
+#   only for the elements that take it, so an error is raised only where the scalar interpreter would raise it,
+# - calls to other non-recursive functions are evaluated inline over the same arrays.
+# Recursive calls and calls to Python callables are made element by element through the scalar
+# interpreter, and a body that cannot be vectorized at all (lambdas, functions held in parameters,
+# an if without else) falls back to calling the function once per element.
+# Integers follow NumPy's fixed-width arithmetic, so results that overflow int64 differ from the interpreter's.
+class Vectorizer:
+    def __init__(self, interpreter=None):
+        if np is None:
+            raise ImportError("Vectorized evaluation requires numpy")
+        # Interpreter whose global scope holds the functions the body calls (tree or stackless backend)
+        self.interpreter = interpreter if interpreter is not None else Interpreter()
+        self.active = []  # Functions whose bodies are being evaluated, to detect recursion
+
+    # Evaluate `func` (a Function node) for every element of the argument arrays, returning an array of results
+    def call(self, func, *arrays):
+        if not isinstance(func, Function):
+            raise TypeError(f"{func} is not a function")
+        if len(arrays) != len(func.params):
+            raise TypeError("Argument count mismatch")
+        arrays = [np.asarray(array) for array in arrays]
+        if any(array.ndim != 1 for array in arrays):
+            raise ValueError("Arguments must be one-dimensional arrays")
+        sizes = {len(array) for array in arrays}
+        if len(sizes) > 1:
+            raise ValueError("Argument arrays must have the same length")
+        size = sizes.pop() if sizes else 1
+
+        self.interpreter.resolver.resolve(func)
+        try:
+            return self.spread(self.evaluate_function(func, arrays, size), size)
+        except Unvectorizable:
+            return self.scalar(func, arrays, size)
+        finally:
+            self.active = []
+
+    # Run a function element by element through the scalar interpreter
+    def scalar(self, func, arrays, size):
+        rows = zip(*[array.tolist() for array in arrays]) if arrays else [()] * size
+        return np.array([self.interpreter.apply(func, list(row)) for row in rows])
+
+    # Evaluate a function body over `arrays`, its parameters
+    def evaluate_function(self, func, arrays, size):
+        self.active.append(func)
+        try:
+            value = None
+            for statement in func.body:
+                value = self.evaluate(statement, arrays, size)
+            return value
+        finally:
+            self.active.pop()
+
+    # Evaluate an expression for all elements: the result is an array of length `size` or a single
+    # value shared by all elements. `env` holds the parameter arrays of the innermost function
+    def evaluate(self, node, env, size):
+        if isinstance(node, (Num, Bool)):
+            return node.value
+        if isinstance(node, Var):
+            if node.depth == 0:
+                return env[node.slot]
+            if node.depth is None and node.name in self.interpreter.global_scope:
+                value = self.interpreter.global_scope[node.name]
+                if isinstance(value, (int, bool)):
+                    return value
+            raise Unvectorizable(node.name)
+        if isinstance(node, BinOp):
+            return self.evaluate_binop(node, env, size)
+        if isinstance(node, UnaryOp):
+            value = self.evaluate(node.expr, env, size)
+            if node.op.type == NOT:
+                return np.logical_not(value)
+            return np.negative(as_integer(value))
+        if isinstance(node, If):
+            return self.evaluate_if(node, env, size)
+        if isinstance(node, Call):
+            return self.evaluate_call(node, env, size)
+        raise Unvectorizable(type(node).__name__)
+
+    # Evaluate a binary operation, with && and || evaluating their right operand only where needed
+    def evaluate_binop(self, node, env, size):
+        op_type = node.op.type
+        left = self.evaluate(node.left, env, size)
+        if op_type in (AND, OR):
+            truthy = self.spread(left, size).astype(bool)
+            needed = truthy if op_type == AND else ~truthy
+            if not needed.any():
+                return left
+            right = self.evaluate(node.right, select(env, needed), int(needed.sum()))
+            return merge(needed, right, select_value(left, ~needed), size)
+
+        right = self.evaluate(node.right, env, size)
+        if op_type in ARITHMETIC:
+            left, right = as_integer(left), as_integer(right)
+            if op_type in (DIV, MOD) and np.any(np.equal(right, 0)):
+                if op_type == DIV:
+                    raise ZeroDivisionError("integer division or modulo by zero")
+                raise ZeroDivisionError("integer modulo by zero")
+        return VECTOR_OPERATORS[op_type](left, right)
+
+    # Evaluate an if expression: np.where over both branches, or each branch over its own elements if one can fail
+    def evaluate_if(self, node, env, size):
+        if node.else_branch is None:
+            raise Unvectorizable("if without else")
+        condition = self.spread(self.evaluate(node.condition, env, size), size).astype(bool)
+        if is_total(node.then_branch) and is_total(node.else_branch):
+            return np.where(condition,
+                            self.evaluate(node.then_branch, env, size),
+                            self.evaluate(node.else_branch, env, size))
+        then_value = else_value = None
+        if condition.any():
+            then_value = self.evaluate(node.then_branch, select(env, condition), int(condition.sum()))
+        if not condition.all():
+            otherwise = ~condition
+            else_value = self.evaluate(node.else_branch, select(env, otherwise), int(otherwise.sum()))
+        if then_value is None:
+            return else_value
+        if else_value is None:
+            return then_value
+        return merge(condition, then_value, else_value, size)
+
+    # Evaluate a call: inline for non-recursive functions, element by element otherwise
+    def evaluate_call(self, node, env, size):
+        if not isinstance(node.func, Var) or node.func.depth is not None:
+            raise Unvectorizable("call of a computed function")
+        func = self.interpreter.global_scope.get(node.func.name)
+        if func is None:
+            raise NameError(f"Undefined variable: {node.func.name}")
+        args = [self.spread(self.evaluate(arg, env, size), size) for arg in node.args]
+        if isinstance(func, Function):
+            if len(args) != len(func.params):
+                raise TypeError("Argument count mismatch")
+            if func not in self.active:
+                return self.evaluate_function(func, args, size)
+        elif not callable(func):
+            raise TypeError(f"{node.func.name} is not callable")
+        # Recursive calls and Python callables go through the scalar interpreter for each element
+        rows = zip(*[arg.tolist() for arg in args]) if args else [()] * size
+        return np.array([self.interpreter.apply(func, list(row)) for row in rows])
+
+    # Turn a value shared by all elements into an array of `size` elements
+    def spread(self, value, size):
+        if isinstance(value, np.ndarray) and value.shape == (size,):
+            return value
+        return np.full(size, value)
+
+
+# Whether evaluating a node can never raise, so both branches of an if can be evaluated for every element
+def is_total(node):
+    if isinstance(node, BinOp) and node.op.type in (DIV, MOD):
+        return False
+    if isinstance(node, Call):
+        return False
+    return all(is_total(child) for child in children(node))
+
+
+# Booleans take part in arithmetic as 0 and 1, like in Python
+def as_integer(value):
+    if isinstance(value, np.ndarray) and value.dtype == bool:
+        return value.astype(np.int64)
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    return value
+
+
+# The parameter arrays restricted to the elements where `mask` is true
+def select(env, mask):
+    return [array[mask] for array in env]
+
+
+# A value restricted to the elements where `mask` is true (values shared by all elements stay as they are)
+def select_value(value, mask):
+    if isinstance(value, np.ndarray) and value.ndim == 1:
+        return value[mask]
+    return value
+
+
+# Combine two partial results: `chosen` for the elements where `mask` is true, `other` for the rest
+def merge(mask, chosen, other, size):
+    result = np.empty(size, dtype=np.result_type(chosen, other))
+    result[mask] = chosen
+    result[~mask] = other
+    return result
+
+
+# Evaluate a function over arrays of arguments with a new Vectorizer
+def vectorize_call(func, *arrays, interpreter=None):
+    return Vectorizer(interpreter).call(func, *arrays)
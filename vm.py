@@ -0,0 +1,356 @@
+# Token Types
+INTEGER, BOOLEAN, PLUS, MINUS, MUL, DIV, MOD, LPAREN, RPAREN, \
+    AND, OR, NOT, EQ, NEQ, GT, LT, GEQ, LEQ, \
+    ID, COMMA, IF, DEFUN, LAMBDA, DOT, EOF, ELSE = (
+    'INTEGER', 'BOOLEAN', 'PLUS', 'MINUS', 'MUL', 'DIV', 'MOD', 'LPAREN', 'RPAREN',
+    'AND', 'OR', 'NOT', 'EQ', 'NEQ', 'GT', 'LT', 'GEQ', 'LEQ',
+    'ID', 'COMMA', 'IF', 'DEFUN', 'LAMBDA', 'DOT', 'EOF', 'ELSE'
+)
+
+from array import array
+
+from compiler import BINARY_OPERATORS, UNARY_OPERATORS
+from parser import Function
+from sinks import NullSink
+
+# Opcodes. Every instruction is two ints in the stream: the opcode and its argument (0 when unused)
+LOAD_CONST, LOAD_LOCAL, LOAD_OUTER, LOAD_GLOBAL, STORE_GLOBAL, BINARY_OP, UNARY_OP, \
+    JUMP, POP_JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP, \
+    MAKE_FUNCTION, CALL, RETURN, POP, EMIT = range(16)
+
+# Opcode names, indexed by opcode, for the disassembler
+OPCODES = [
+    'LOAD_CONST',            # push constants[arg]
+    'LOAD_LOCAL',            # push the current frame's argument number arg
+    'LOAD_OUTER',            # push argument (arg & 0xFFFF) of the frame (arg >> 16) levels out
+    'LOAD_GLOBAL',           # push the global named names[arg]
+    'STORE_GLOBAL',          # pop a value and bind it to the global named names[arg]
+    'BINARY_OP',             # pop two operands and push OPERATOR_TABLE[arg](left, right)
+    'UNARY_OP',              # pop one operand and push UNARY_TABLE[arg](operand)
+    'JUMP',                  # continue at instruction offset arg
+    'POP_JUMP_IF_FALSE',     # pop a value, continue at arg if it is falsy
+    'JUMP_IF_FALSE_OR_POP',  # && : keep a falsy value and jump to arg, otherwise pop it
+    'JUMP_IF_TRUE_OR_POP',   # || : keep a truthy value and jump to arg, otherwise pop it
+    'MAKE_FUNCTION',         # push a function for the code object constants[arg], closing over the frame
+    'CALL',                  # call the function below arg arguments on the stack
+    'RETURN',                # return the top of the stack to the caller
+    'POP',                   # discard the top of the stack
+    'EMIT',                  # pop a top-level statement result and record it
+]
+
+# The operator callables addressed by BINARY_OP and UNARY_OP arguments
+OPERATOR_TABLE = list(BINARY_OPERATORS.values())
+OPERATOR_INDEX = {token_type: index for index, token_type in enumerate(BINARY_OPERATORS)}
+UNARY_TABLE = list(UNARY_OPERATORS.values())
+UNARY_INDEX = {token_type: index for index, token_type in enumerate(UNARY_OPERATORS)}
+
+
+# A compiled unit - the top-level program or one function body. It holds no AST nodes
+class Code:
+    __slots__ = ('name', 'params', 'instructions', 'constants', 'names')
+
+    def __init__(self, name, params):
+        self.name = name                    # Function name ('<program>' for top-level code)
+        self.params = tuple(params)         # Parameter names, kept for arity checks and the disassembler
+        self.instructions = array('i')      # Flat opcode/argument stream
+        self.constants = []                 # Constant pool: numbers, booleans, None and nested Code objects
+        self.names = []                     # Global names referenced by the code
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+
+# A function value created by MAKE_FUNCTION: a code object plus the frame it was defined in
+class VMFunction:
+    __slots__ = ('code', 'env')
+
+    def __init__(self, code, env):
+        self.code = code
+        self.env = env  # (arguments, parent env) of the defining frame, or None at top level
+
+    def __repr__(self):
+        return f'<function {self.code.name}({", ".join(self.code.params)})>'
+
+
+# The BytecodeCompiler flattens the AST into Code objects
+class BytecodeCompiler:
+    def __init__(self):
+        self.indexes = {}  # Constant pool and names table positions, per Code object
+
+    # Compile a list of top-level statements into the program's Code object
+    def compile_program(self, statements):
+        code = Code('<program>', ())
+        for statement in statements:
+            self.visit(statement, code, ())
+            if isinstance(statement, Function):
+                self.emit(code, LOAD_CONST, self.constant(code, None))
+            self.emit(code, EMIT)
+        return code
+
+    # Compile a function or lambda body into its own Code object
+    def compile_function(self, name, params, body, scope):
+        code = Code(name, params)
+        scope = (tuple(params),) + scope
+        body = body if isinstance(body, list) else [body]
+        if not body:
+            self.emit(code, LOAD_CONST, self.constant(code, None))
+        for index, statement in enumerate(body):
+            if index:
+                self.emit(code, POP)
+            self.visit(statement, code, scope)
+        self.emit(code, RETURN)
+        return code
+
+    # Append one instruction and return its offset
+    def emit(self, code, opcode, arg=0):
+        code.instructions.append(opcode)
+        code.instructions.append(arg)
+        return len(code.instructions) - 2
+
+    # Point the jump instruction at `offset` to the current end of the stream
+    def patch(self, code, offset):
+        code.instructions[offset + 1] = len(code.instructions)
+
+    # Index of a value in the constant pool. Booleans and ints compare equal, so the type is part of the key
+    def constant(self, code, value):
+        key = (id(code), type(value), value)
+        if key not in self.indexes:
+            code.constants.append(value)
+            self.indexes[key] = len(code.constants) - 1
+        return self.indexes[key]
+
+    # Index of a global name in the names table
+    def name(self, code, name):
+        key = (id(code), name)
+        if key not in self.indexes:
+            code.names.append(name)
+            self.indexes[key] = len(code.names) - 1
+        return self.indexes[key]
+
+    # Main visit method that dispatches to the appropriate visit method
+    def visit(self, node, code, scope):
+        method_name = f'visit_{type(node).__name__.lower()}'
+        method = getattr(self, method_name, self.generic_visit)
+        return method(node, code, scope)
+
+    # Generic visit method that raises an error if no specific visit method is found
+    def generic_visit(self, node, code, scope):
+        raise Exception(f'No visit_{type(node).__name__} method')
+
+    # Numbers and booleans are loaded from the constant pool
+    def visit_num(self, node, code, scope):
+        self.emit(code, LOAD_CONST, self.constant(code, node.value))
+
+    def visit_bool(self, node, code, scope):
+        self.emit(code, LOAD_CONST, self.constant(code, node.value))
+
+    # Parameters are read from frame slots, any other name is looked up globally at run time
+    def visit_var(self, node, code, scope):
+        for depth, params in enumerate(scope):
+            if node.name in params:
+                slot = params.index(node.name)
+                if depth == 0:
+                    self.emit(code, LOAD_LOCAL, slot)
+                else:
+                    self.emit(code, LOAD_OUTER, depth << 16 | slot)
+                return
+        self.emit(code, LOAD_GLOBAL, self.name(code, node.name))
+
+    # Binary operations; && and || jump over their right operand to short-circuit
+    def visit_binop(self, node, code, scope):
+        self.visit(node.left, code, scope)
+        if node.op.type in (AND, OR):
+            jump = self.emit(code, JUMP_IF_FALSE_OR_POP if node.op.type == AND else JUMP_IF_TRUE_OR_POP)
+            self.visit(node.right, code, scope)
+            self.patch(code, jump)
+            return
+        self.visit(node.right, code, scope)
+        self.emit(code, BINARY_OP, OPERATOR_INDEX[node.op.type])
+
+    # Visit a unary operation node (negation or logical NOT)
+    def visit_unaryop(self, node, code, scope):
+        self.visit(node.expr, code, scope)
+        self.emit(code, UNARY_OP, UNARY_INDEX[node.op.type])
+
+    # A defun compiles its body into a nested Code object and binds the new function globally
+    def visit_function(self, node, code, scope):
+        function_code = self.compile_function(node.name, node.params, node.body, scope)
+        self.emit(code, MAKE_FUNCTION, self.constant(code, function_code))
+        self.emit(code, STORE_GLOBAL, self.name(code, node.name))
+
+    # A lambda compiles to a nested Code object and leaves the function on the stack
+    def visit_lambda(self, node, code, scope):
+        function_code = self.compile_function('<lambda>', node.params, node.body, scope)
+        self.emit(code, MAKE_FUNCTION, self.constant(code, function_code))
+
+    # Push the function and its arguments, then call
+    def visit_call(self, node, code, scope):
+        self.visit(node.func, code, scope)
+        for arg in node.args:
+            self.visit(arg, code, scope)
+        self.emit(code, CALL, len(node.args))
+
+    # The if form is an expression; a missing else branch produces None
+    def visit_if(self, node, code, scope):
+        self.visit(node.condition, code, scope)
+        skip_then = self.emit(code, POP_JUMP_IF_FALSE)
+        self.visit(node.then_branch, code, scope)
+        skip_else = self.emit(code, JUMP)
+        self.patch(code, skip_then)
+        if node.else_branch is None:
+            self.emit(code, LOAD_CONST, self.constant(code, None))
+        else:
+            self.visit(node.else_branch, code, scope)
+        self.patch(code, skip_else)
+
+
+# Execute a Code object in a single dispatch loop. Language-level calls push a frame onto
+# an explicit call stack instead of recursing in Python, so recursion depth is bounded only by memory.
+# Every value recorded by EMIT is passed to `emit` as soon as it is computed.
+def execute(program, global_scope, emit):
+    stack = []
+    frames = []  # Saved (instructions, constants, names, pc, env) of every suspended caller
+    instructions, constants, names = program.instructions, program.constants, program.names
+    env = None
+    args = ()
+    pc = 0
+    end = len(instructions)
+
+    while pc < end:
+        opcode = instructions[pc]
+        arg = instructions[pc + 1]
+        pc += 2
+
+        if opcode == LOAD_LOCAL:
+            stack.append(args[arg])
+        elif opcode == LOAD_CONST:
+            stack.append(constants[arg])
+        elif opcode == BINARY_OP:
+            right = stack.pop()
+            stack[-1] = OPERATOR_TABLE[arg](stack[-1], right)
+        elif opcode == LOAD_GLOBAL:
+            try:
+                stack.append(global_scope[names[arg]])
+            except KeyError:
+                raise NameError(f"Undefined variable: {names[arg]}") from None
+        elif opcode == CALL:
+            call_args = tuple(stack[len(stack) - arg:]) if arg else ()
+            del stack[len(stack) - arg:]
+            func = stack.pop()
+            if type(func) is VMFunction:
+                code = func.code
+                if len(call_args) != len(code.params):
+                    raise TypeError("Argument count mismatch")
+                frames.append((instructions, constants, names, pc, env, end))
+                env = (call_args, func.env)
+                args = call_args
+                instructions, constants, names = code.instructions, code.constants, code.names
+                pc = 0
+                end = len(instructions)
+            elif callable(func):
+                stack.append(func(*call_args))  # Built-in Python callables
+            else:
+                raise TypeError(f"{func!r} is not callable")
+        elif opcode == RETURN:
+            instructions, constants, names, pc, env, end = frames.pop()
+            args = env[0] if env is not None else ()
+        elif opcode == POP_JUMP_IF_FALSE:
+            if not stack.pop():
+                pc = arg
+        elif opcode == JUMP:
+            pc = arg
+        elif opcode == JUMP_IF_FALSE_OR_POP:
+            if stack[-1]:
+                stack.pop()
+            else:
+                pc = arg
+        elif opcode == JUMP_IF_TRUE_OR_POP:
+            if stack[-1]:
+                pc = arg
+            else:
+                stack.pop()
+        elif opcode == UNARY_OP:
+            stack[-1] = UNARY_TABLE[arg](stack[-1])
+        elif opcode == LOAD_OUTER:
+            frame = env
+            for _ in range(arg >> 16):
+                frame = frame[1]
+            stack.append(frame[0][arg & 0xFFFF])
+        elif opcode == MAKE_FUNCTION:
+            stack.append(VMFunction(constants[arg], env))
+        elif opcode == STORE_GLOBAL:
+            global_scope[names[arg]] = stack.pop()
+        elif opcode == POP:
+            stack.pop()
+        elif opcode == EMIT:
+            emit(stack.pop())
+        else:
+            raise Exception(f'Unknown opcode {opcode}')
+
+
+# Render a Code object (and every nested one) as readable text for debugging emitted code
+def disassemble(code):
+    lines = [f'Disassembly of {code.name}({", ".join(code.params)}):']
+    nested = []
+    instructions = code.instructions
+    for offset in range(0, len(instructions), 2):
+        opcode, arg = instructions[offset], instructions[offset + 1]
+        name = OPCODES[opcode]
+        if opcode == LOAD_CONST or opcode == MAKE_FUNCTION:
+            value = code.constants[arg]
+            detail = f'{arg} ({value!r})'
+            if isinstance(value, Code):
+                nested.append(value)
+        elif opcode == LOAD_GLOBAL or opcode == STORE_GLOBAL:
+            detail = f'{arg} ({code.names[arg]})'
+        elif opcode == LOAD_LOCAL:
+            detail = f'{arg} ({code.params[arg]})'
+        elif opcode == LOAD_OUTER:
+            detail = f'{arg >> 16}, {arg & 0xFFFF}'
+        elif opcode == BINARY_OP:
+            detail = f'{arg} ({list(BINARY_OPERATORS)[arg]})'
+        elif opcode == UNARY_OP:
+            detail = f'{arg} ({list(UNARY_OPERATORS)[arg]})'
+        elif opcode in (JUMP, POP_JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP, CALL):
+            detail = str(arg)
+        else:
+            detail = ''
+        lines.append(f'{offset:>6} {name:<22}{detail}'.rstrip())
+    for function_code in nested:
+        lines.append('')
+        lines.append(disassemble(function_code))
+    return '\n'.join(lines)
+
+
+# Runs programs on the stack virtual machine
+class VMInterpreter:
+    def __init__(self, output=None):
+        self.global_scope = {}  # Global scope for storing functions
+        self.output = output if output is not None else NullSink()  # Sink for the results of top-level statements
+        self.last = None  # Value of the last expression statement run
+
+    # Compile and execute a statement or a list of statements, mirroring Interpreter.visit
+    def visit(self, node):
+        statements = node if isinstance(node, list) else [node]
+        self.last = None
+        execute(BytecodeCompiler().compile_program(statements), self.global_scope, self.emit)
+        return self.last
+
+    # Receive the value of an expression statement as the program runs, so results reach the sink right away
+    def emit(self, value):
+        self.last = value
+        if value is not None:
+            self.output.write(value)
+
+
+# Print the disassembly of the bytecode emitted for a .lambda file
+if __name__ == '__main__':
+    import sys
+    from lexer import Lexer
+    from parser import Parser
+    if len(sys.argv) == 2:
+        with open(sys.argv[1], 'r') as file:
+            tree = Parser(Lexer(file.read()).lex()).parse()
+        print(disassemble(BytecodeCompiler().compile_program(tree)))
+    else:
+        print("Usage: python vm.py <program.lambda>")